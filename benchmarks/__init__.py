@@ -0,0 +1 @@
+"""Benchmarks for ModuleUltra. See `benchmarks.planning`."""
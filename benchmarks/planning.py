@@ -0,0 +1,217 @@
+"""Time the planning phase of a run on synthetic repos of several sizes.
+
+Run from the root of the source tree:
+
+    python -m benchmarks.planning --out bench.json \\
+        --thresholds benchmarks/thresholds.json
+
+Each scale is given as SAMPLESxGROUPSxMODULES. For each scale a fresh
+config, pipeline and repo are made in a temp dir, then every stage is
+timed `--repeat` times and the best time is kept. Results are written
+as JSON. If a thresholds file is given, any stage that is slower than
+its threshold is a regression and the exit status is 1.
+"""
+
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+from time import time
+from shutil import rmtree
+from contextlib import contextmanager
+from statistics import median
+
+from . import synthetic
+
+
+DEFAULT_SCALES = ['10x2x3', '100x5x5', '1000x20x10']
+STAGES = [
+    'preprocessSamplesAndGroups',
+    'preprocessSamplesAndGroupsManifest',
+    'preprocessEndpoints',
+    'planDelta',
+    'preprocessConf',
+    'preprocessSnakemake',
+    'tabify',
+    'dryrunDAG',
+]
+
+
+def parseScale(scale):
+    '''Return (samples, groups, modules) from a string like 100x5x10.'''
+    numSamples, numGroups, numModules = [int(tkn) for tkn in scale.lower().split('x')]
+    return numSamples, numGroups, numModules
+
+
+@contextmanager
+def syntheticRepo(numSamples, numGroups, numModules, numOrigins=1,
+                  filesPerOrigin=2, layout='nested', keep=False):
+    '''Yield a PipelineInstance in a fresh synthetic repo.
+
+    The working dir is the repo root while the context is open. The
+    config, pipeline, repo and origin files all live in one temp dir.
+    '''
+    import datasuper as ds
+    from moduleultra import ModuleUltraConfig, ModuleUltraRepo
+
+    root = tempfile.mkdtemp(prefix='mu_bench_')
+    oldCwd, oldConfig = os.getcwd(), os.environ.get('MODULE_ULTRA_CONFIG')
+    try:
+        os.environ['MODULE_ULTRA_CONFIG'] = os.path.join(root, 'config')
+        ModuleUltraConfig.initConfig()
+        pipeSrc = os.path.join(root, 'pipeline')
+        synthetic.writePipeline(pipeSrc, numModules, numOrigins=numOrigins,
+                                filesPerOrigin=filesPerOrigin)
+        ModuleUltraConfig.load().installPipeline(pipeSrc, skipInstalled=True)
+
+        repoDir = os.path.join(root, 'repo')
+        os.makedirs(repoDir)
+        os.chdir(repoDir)
+        ModuleUltraRepo.initRepo()
+        repo = ModuleUltraRepo.loadRepo()
+        repo.addPipeline(synthetic.PIPELINE_NAME)
+        with ds.Repo.loadRepo() as dsRepo:
+            synthetic.populateRepo(dsRepo, os.path.join(root, 'data'),
+                                   numSamples, numGroups, numOrigins=numOrigins,
+                                   filesPerOrigin=filesPerOrigin, layout=layout)
+        yield repo.getPipelineInstance(synthetic.PIPELINE_NAME)
+    finally:
+        os.chdir(oldCwd)
+        if oldConfig is None:
+            os.environ.pop('MODULE_ULTRA_CONFIG', None)
+        else:
+            os.environ['MODULE_ULTRA_CONFIG'] = oldConfig
+        if keep:
+            print('Kept synthetic repo in {}'.format(root), file=sys.stderr)
+        else:
+            rmtree(root, ignore_errors=True)
+
+
+def timeStages(pipe, repeat=3):
+    '''Return a dict of stage -> list of seconds for each repeat.'''
+    from snakemake import snakemake
+    from moduleultra.pipeline_instance_utils import (
+        preprocessSamplesAndGroups,
+        tabify,
+    )
+
+    times = {stage: [] for stage in STAGES}
+
+    def timed(stage, func, *args, **kwargs):
+        start = time()
+        out = func(*args, **kwargs)
+        times[stage].append(time() - start)
+        return out
+
+    for _ in range(repeat):
+        plan = timed('preprocessSamplesAndGroups',
+                     preprocessSamplesAndGroups, pipe.origins, None, None)
+        timed('preprocessSamplesAndGroupsManifest', preprocessSamplesAndGroups,
+              pipe.origins, None, None, manifest=pipe.muRepo.originManifest())
+        endpts = timed('preprocessEndpoints', pipe.preprocessEndpoints, None, None)
+        plan, targets = timed('planDelta', pipe.planDelta, endpts, plan)
+        confStr = timed('preprocessConf', pipe.preprocessConf, plan, endpts, targets=targets)
+        snakefile = timed('preprocessSnakemake', pipe.preprocessSnakemake,
+                          confStr, endpts, plan, runId='bench')
+        with open(snakefile) as sf:
+            untabbed = sf.read().replace('\t', '    ')
+        timed('tabify', tabify, untabbed)
+        timed('dryrunDAG', snakemake, snakefile, config={},
+              workdir=pipe.muRepo.getResultDir(), dryrun=True, quiet=True,
+              lock=False, log_handler=lambda msg: None)
+        os.remove(snakefile)
+    return times
+
+
+def summarize(times):
+    return {
+        stage: {'best': min(runs), 'median': median(runs), 'runs': runs}
+        for stage, runs in times.items() if runs
+    }
+
+
+def checkThresholds(results, thresholds):
+    '''Return a list of regressions, stages slower than their threshold.
+
+    `thresholds` maps a scale to a dict of stage -> max seconds. The
+    best time of each stage is compared.
+    '''
+    regressions = []
+    for result in results:
+        limits = thresholds.get(result['scale'], {})
+        for stage, maxSeconds in limits.items():
+            if stage not in result['stages']:
+                continue
+            best = result['stages'][stage]['best']
+            if best > maxSeconds:
+                regressions.append({
+                    'scale': result['scale'],
+                    'stage': stage,
+                    'seconds': best,
+                    'threshold': maxSeconds,
+                })
+    return regressions
+
+
+def main(argv=None):
+    from moduleultra.version import __version__
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('scales', nargs='*', default=DEFAULT_SCALES,
+                        help='SAMPLESxGROUPSxMODULES, default: {}'.format(' '.join(DEFAULT_SCALES)))
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--origins', type=int, default=1, help='origin result types per sample')
+    parser.add_argument('--files-per-origin', type=int, default=2)
+    parser.add_argument('--layout', choices=['nested', 'flat'], default='nested',
+                        help='a dir of origin files per sample, or one dir for all')
+    parser.add_argument('-o', '--out', default=None, help='write results as JSON here')
+    parser.add_argument('-t', '--thresholds', default=None,
+                        help='JSON of scale -> stage -> max seconds')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic repos')
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in args.scales:
+        numSamples, numGroups, numModules = parseScale(scale)
+        with syntheticRepo(numSamples, numGroups, numModules,
+                           numOrigins=args.origins,
+                           filesPerOrigin=args.files_per_origin,
+                           layout=args.layout, keep=args.keep) as pipe:
+            stages = summarize(timeStages(pipe, repeat=args.repeat))
+        results.append({
+            'scale': scale,
+            'samples': numSamples,
+            'groups': numGroups,
+            'modules': numModules,
+            'origins': args.origins,
+            'files_per_origin': args.files_per_origin,
+            'layout': args.layout,
+            'stages': stages,
+        })
+        for stage in STAGES:
+            print('{}\t{}\t{:.4f}s'.format(scale, stage, stages[stage]['best']))
+
+    regressions = []
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            regressions = checkThresholds(results, json.load(f))
+    report = {
+        'moduleultra_version': __version__,
+        'python': platform.python_version(),
+        'time': time(),
+        'results': results,
+        'regressions': regressions,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    for regression in regressions:
+        print('REGRESSION {scale} {stage}: {seconds:.4f}s > {threshold}s'.format(**regression),
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
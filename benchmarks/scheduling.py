@@ -0,0 +1,118 @@
+"""Time how many jobs per second get through the spool and an executor.
+
+Run from the root of the source tree:
+
+    python -m benchmarks.scheduling --jobs 10000 --out sched.json
+
+Synthetic jobscripts, shaped like the ones snakemake writes, are spooled
+into a `JobBundler` backed by a `FakeClusterExecutor`. Each mode submits
+them differently: 'single' submits every job on its own, 'bundle' runs
+jobs of a rule in bundles of `--group-size` and 'array' submits jobs of
+a rule as array jobs of `--array-size` tasks. The time until every job
+has touched its finished or failed marker is reported with the number
+of submissions, tasks and lost tasks.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from time import time, sleep
+from shutil import rmtree
+
+from moduleultra.job_bundler import JobBundler, spoolJobscript
+from moduleultra.executors import FakeClusterExecutor
+
+
+MODES = ['single', 'bundle', 'array']
+
+
+def writeJobscripts(root, numJobs, numRules):
+    '''Write jobscripts spread over `numRules` rules, return their paths.'''
+    jobDir = os.path.join(root, 'jobscripts')
+    markerDir = os.path.join(root, 'markers')
+    os.makedirs(jobDir)
+    os.makedirs(markerDir)
+    paths = []
+    for i in range(numJobs):
+        properties = {'rule': 'rule_{}'.format(i % numRules),
+                      'wildcards': {'sample_name': 'sample_{}'.format(i // numRules)}}
+        path = os.path.join(jobDir, 'job_{}.sh'.format(i))
+        with open(path, 'w') as jobscript:
+            jobscript.write('#!/bin/sh\n')
+            jobscript.write('# properties = {}\n'.format(json.dumps(properties)))
+            jobscript.write('true && touch "{0}/{1}.done" || (touch "{0}/{1}.failed"; exit 1)\n'
+                            .format(markerDir, i))
+        paths.append(path)
+    return paths, markerDir
+
+
+def runMode(mode, numJobs, numRules=10, latency=0.05, failureRate=0.0, slots=8,
+            groupSize=50, arraySize=100, seed=0):
+    '''Schedule `numJobs` synthetic jobs in one mode and return a result dict.'''
+    root = tempfile.mkdtemp(prefix='mu_sched_')
+    try:
+        jobscripts, markerDir = writeJobscripts(root, numJobs, numRules)
+        executor = FakeClusterExecutor(latency=latency, failureRate=failureRate,
+                                       slots=slots, seed=seed,
+                                       arraySize=arraySize if mode == 'array' else None)
+        defaultSize = {'single': 1, 'bundle': groupSize, 'array': arraySize}[mode]
+        bundler = JobBundler(os.path.join(root, 'spool'), None, {},
+                             maxWait=1, pollInterval=0.05,
+                             executor=executor, defaultSize=defaultSize)
+        start = time()
+        executor.start()
+        bundler.start()
+        for jobscript in jobscripts:
+            spoolJobscript(bundler.spoolDir, jobscript)
+        spooled = time() - start
+        while len(os.listdir(markerDir)) < numJobs:
+            sleep(0.05)
+        seconds = time() - start
+        executor.stop()
+        bundler.stop()
+        failed = sum(1 for fname in os.listdir(markerDir) if fname.endswith('.failed'))
+    finally:
+        rmtree(root, ignore_errors=True)
+    return dict(executor.counts, mode=mode, jobs=numJobs, failed=failed,
+                spool_seconds=spooled, seconds=seconds,
+                jobs_per_second=numJobs / seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('modes', nargs='*', default=MODES,
+                        help='any of {}'.format(' '.join(MODES)))
+    parser.add_argument('-n', '--jobs', type=int, default=10000)
+    parser.add_argument('--rules', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='mean queue wait in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--group-size', type=int, default=50)
+    parser.add_argument('--array-size', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--out', default=None, help='write results as JSON here')
+    args = parser.parse_args(argv)
+    for mode in args.modes:
+        if mode not in MODES:
+            parser.error('unknown mode: {}'.format(mode))
+
+    results = []
+    for mode in args.modes:
+        result = runMode(mode, args.jobs, numRules=args.rules, latency=args.latency,
+                         failureRate=args.failure_rate, slots=args.slots,
+                         groupSize=args.group_size, arraySize=args.array_size,
+                         seed=args.seed)
+        results.append(result)
+        print('{mode}\t{jobs} jobs\t{submissions} submissions\t{tasks} tasks\t'
+              '{failed} failed\t{seconds:.2f}s\t{jobs_per_second:.1f} jobs/s'.format(**result))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'time': time(), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
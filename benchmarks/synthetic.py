@@ -0,0 +1,159 @@
+"""Build synthetic pipelines and repos to benchmark planning on.
+
+A synthetic pipeline has `numModules` sample level modules in a chain
+(every third module also reads the module two before it) and, if
+`groupModule` is set, one group level module at the end. Every rule
+just touches its outputs so dry runs and real runs are cheap.
+"""
+
+import os
+import json
+import os.path
+
+from moduleultra.utils import joinResultNameType
+
+
+PIPELINE_NAME = 'mu_bench'
+PIPELINE_VERSION = '0.0.0'
+FILE_TYPE = 'bench_txt'
+SAMPLE_TYPE = 'bench_sample'
+
+
+def originNames(numOrigins):
+    return ['bench_raw_{}'.format(i) for i in range(numOrigins)]
+
+
+def originFileKeys(filesPerOrigin):
+    return ['f{}'.format(i) for i in range(filesPerOrigin)]
+
+
+def moduleNames(numModules):
+    return ['bench_mod_{}'.format(i) for i in range(numModules)]
+
+
+def moduleDependencies(index, numOrigins):
+    '''Return the result types module `index` depends on.'''
+    if index == 0:
+        return originNames(numOrigins)
+    deps = ['bench_mod_{}'.format(index - 1)]
+    if index >= 2 and index % 3 == 0:
+        deps.append('bench_mod_{}'.format(index - 2))
+    return deps
+
+
+def pipelineDefinition(numModules, numOrigins=1, filesPerOrigin=2, groupModule=True):
+    '''Return the pipeline definition of a synthetic pipeline.'''
+    resultTypes = [
+        {'NAME': origin, 'FILES': {key: FILE_TYPE for key in originFileKeys(filesPerOrigin)}}
+        for origin in originNames(numOrigins)
+    ]
+    for index, module in enumerate(moduleNames(numModules)):
+        resultTypes.append({
+            'NAME': module,
+            'DEPENDENCIES': moduleDependencies(index, numOrigins),
+            'FILES': {'out': FILE_TYPE},
+        })
+    if groupModule and numModules:
+        resultTypes.append({
+            'NAME': 'bench_group',
+            'LEVEL': 'GROUP',
+            'DEPENDENCIES': [moduleNames(numModules)[-1]],
+            'FILES': {'out': FILE_TYPE},
+        })
+    return {
+        'NAME': PIPELINE_NAME,
+        'VERSION': PIPELINE_VERSION,
+        'FILE_TYPES': [{'name': FILE_TYPE, 'ext': 'txt'}],
+        'SAMPLE_TYPES': [SAMPLE_TYPE],
+        'ORIGINS': originNames(numOrigins),
+        'RESULT_TYPES': resultTypes,
+    }
+
+
+def moduleSnakefile(resultType, filesPerOrigin):
+    '''Return the snakefile of one module in a synthetic pipeline.'''
+    name = resultType['NAME']
+    inputs = []
+    for dep in resultType['DEPENDENCIES']:
+        if dep.startswith('bench_raw_'):
+            inputs += ["getOriginResultFiles(config, '{}', '{}')".format(dep, key)
+                       for key in originFileKeys(filesPerOrigin)]
+        elif resultType.get('LEVEL') == 'GROUP':
+            inputs.append("expandGroup(config['{}']['out'])".format(dep))
+        else:
+            inputs.append("config['{}']['out']".format(dep))
+    out = 'rule {}:\n'.format(name)
+    out += '    input:\n'
+    out += ''.join('        {},\n'.format(inp) for inp in inputs)
+    out += '    output:\n'
+    out += "        config['{}']['out'],\n".format(name)
+    out += '    shell:\n'
+    out += "        'touch {output}'\n"
+    return out
+
+
+def writePipeline(dest, numModules, numOrigins=1, filesPerOrigin=2, groupModule=True):
+    '''Write a synthetic pipeline to `dest` and return its definition.'''
+    os.makedirs(os.path.join(dest, 'snakefiles'), exist_ok=True)
+    pipeDef = pipelineDefinition(numModules, numOrigins=numOrigins,
+                                 filesPerOrigin=filesPerOrigin, groupModule=groupModule)
+    with open(os.path.join(dest, 'pipeline_definition.json'), 'w') as f:
+        json.dump(pipeDef, f, indent=4)
+    conf = {}
+    for resultType in pipeDef['RESULT_TYPES']:
+        if resultType['NAME'] in pipeDef['ORIGINS']:
+            continue
+        conf[resultType['NAME']] = {}
+        snakefile = os.path.join(dest, 'snakefiles', '{}.smk'.format(resultType['NAME']))
+        with open(snakefile, 'w') as f:
+            f.write(moduleSnakefile(resultType, filesPerOrigin))
+    with open(os.path.join(dest, 'snakemake_config.json'), 'w') as f:
+        json.dump(conf, f, indent=4)
+    return pipeDef
+
+
+def originPath(dataDir, sampleName, origin, key, layout='nested'):
+    '''Return the path of an origin file.
+
+    `layout` is 'nested' (a dir per sample) or 'flat' (one dir).
+    '''
+    fname = '{}.{}.{}.txt'.format(sampleName, origin, key)
+    if layout == 'flat':
+        return os.path.join(dataDir, fname)
+    return os.path.join(dataDir, sampleName, fname)
+
+
+def populateRepo(dsRepo, dataDir, numSamples, numGroups, numOrigins=1,
+                 filesPerOrigin=2, layout='nested'):
+    '''Add samples, groups and origin results to a datasuper repo.
+
+    Samples are spread evenly over the groups. Origin files are
+    created, empty, under `dataDir`.
+    '''
+    import datasuper as ds
+
+    sampleNames = ['bench_s{}'.format(i) for i in range(numSamples)]
+    for sampleName in sampleNames:
+        resultNames = []
+        for origin in originNames(numOrigins):
+            fileRecs = {}
+            for key in originFileKeys(filesPerOrigin):
+                path = originPath(dataDir, sampleName, origin, key, layout=layout)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+                fileName = os.path.basename(path)
+                ds.FileRecord(dsRepo, name=fileName, filepath=path,
+                              file_type=FILE_TYPE).save()
+                fileRecs[key] = fileName
+            resultName = joinResultNameType(sampleName, origin)
+            ds.ResultRecord(dsRepo, name=resultName, result_type=origin,
+                            file_records=fileRecs).save()
+            resultNames.append(resultName)
+        ds.SampleRecord(dsRepo, name=sampleName, sample_type=SAMPLE_TYPE,
+                        results=resultNames).save()
+
+    for groupIndex in range(numGroups):
+        members = sampleNames[groupIndex::numGroups]
+        ds.SampleGroupRecord(dsRepo, name='bench_g{}'.format(groupIndex),
+                             direct_samples=members).save()
+    return sampleNames
@@ -1,7 +1,39 @@
+"""ModuleUltra -- biological data pipeline creation.
+
+The main classes pull in snakemake and datasuper which are slow to
+import so they are only loaded the first time they are used.
+"""
+
+import sys
+from types import ModuleType
+from importlib import import_module
 
 from .errors import *
-from .module_ultra_config import *
-from .module_ultra_repo import *
-from .pipeline_instance import *
-from .result_schema import *
 from .utils import *
+
+
+_LAZY_EXPORTS = {
+    'ModuleUltraConfig': 'module_ultra_config',
+    'ModuleUltraRepo': 'module_ultra_repo',
+    'PipelineInstance': 'pipeline_instance',
+    'ResultSchema': 'result_schema',
+}
+
+
+class _LazyExportsModule(ModuleType):
+    """Package module that imports the main classes on first access."""
+
+    def __getattr__(self, name):
+        try:
+            moduleName = _LAZY_EXPORTS[name]
+        except KeyError:
+            raise AttributeError(f'module {self.__name__!r} has no attribute {name!r}')
+        value = getattr(import_module('.' + moduleName, self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_LAZY_EXPORTS))
+
+
+sys.modules[__name__].__class__ = _LazyExportsModule
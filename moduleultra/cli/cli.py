@@ -2,10 +2,27 @@
 
 import os
 import sys
+import itertools
 import click
-from moduleultra import *
-from gimme_input import *
-from yaml import dump as ydump
+from moduleultra.errors import (
+    ModuleUltraConfigAlreadyExists,
+    ModuleUltraRepoAlreadyExists,
+    NotALinkFarmError,
+    PipelineAlreadyInRepoError,
+    PipelineAlreadyInstalledError,
+    RecipeBuildError,
+    RunLockedError,
+)
+from moduleultra.module_ultra_config import ModuleUltraConfig
+from moduleultra.module_ultra_repo import ModuleUltraRepo
+from moduleultra.result_verify import DigestCache, registeredFiles, verifyFiles
+from moduleultra.run_lock import claimedNames
+from moduleultra.sample_selection import SampleSelection, rawNames
+from moduleultra.result_gc import DEFAULT_KEEP_PATTERNS, GarbageCollector
+from moduleultra.result_cache import ResultCache
+from moduleultra.executors import EXECUTORS
+from moduleultra.result_export import ArchiveWriter, exportResults, groupEntries
+from moduleultra.virtual_dirs import buildLinkFarms, groupLinks, sampleLinks
 
 from .daemon import daemon
 
@@ -49,6 +66,54 @@ def setSubmitScript(script):
     muConfig = ModuleUltraConfig.load()
     muConfig.setClusterSubmitScript(script)
 
+
+@config.command(name='cluster_array_submit')
+@click.argument('script')
+def setArraySubmitScript(script):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setClusterArraySubmitScript(script)
+
+
+@config.command(name='cluster_status')
+@click.argument('script')
+def setStatusScript(script):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setClusterStatusScript(script)
+
+
+@config.command(name='latency_wait')
+@click.argument('seconds', type=int)
+def setLatencyWait(seconds):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setLatencyWait(seconds)
+
+
+@config.command(name='origin_staging')
+@click.option('-j', '--jobs', default=None, type=int, help='files to stage at once')
+@click.option('--budget-gb', default=None, type=float, help='max GB staged at once')
+@click.argument('stage_dir')
+def setOriginStaging(stage_dir, jobs, budget_gb):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setOriginStaging(stage_dir, jobs=jobs, budgetGB=budget_gb)
+
+
+@config.command(name='scratch')
+@click.option('--budget-gb', default=None, type=float, help='max GB of scratch in use')
+@click.argument('scratch_dir')
+def setScratch(scratch_dir, budget_gb):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setScratch(scratch_dir, budgetGB=budget_gb)
+
+
+@config.command(name='result_cache')
+@click.option('--max-gb', default=None, type=float, help='evict old results past this size')
+@click.option('--link', default=None, type=click.Choice(['hardlink', 'copy']),
+              help='how cached results are put in place')
+@click.argument('cache_dir')
+def setResultCache(cache_dir, max_gb, link):
+    muConfig = ModuleUltraConfig.load()
+    muConfig.setResultCache(cache_dir, maxGB=max_gb, link=link)
+
 ###############################################################################
 
 
@@ -65,21 +130,31 @@ def addPipeline(version, modify, name):
     repo = ModuleUltraRepo.loadRepo()
     try:
         repo.addPipeline(name, version=version, modify=modify)
-    except errors.PipelineAlreadyInRepoError:
+    except PipelineAlreadyInRepoError:
         print('{} is already in this repo.'.format(name), file=sys.stderr)
 
 ###############################################################################
 
 
+RECIPE_POLICIES = {'ask': None, 'skip': True, 'rebuild': False}
+
+
 @main.command(name='install')
 @click.option('--dev/--normal', default=False)
+@click.option('--recipe-jobs', default=1, help='recipes to build at once')
+@click.option('--installed-recipes', default='ask', type=click.Choice(sorted(RECIPE_POLICIES)),
+              help='what to do with recipes that are already installed')
 @click.argument('uri', nargs=1)
-def installPipeline(uri, dev=False):
+def installPipeline(uri, dev=False, recipe_jobs=1, installed_recipes='ask'):
     muConfig = ModuleUltraConfig.load()
     try:
-        muConfig.installPipeline(uri, dev=dev)
+        muConfig.installPipeline(uri, dev=dev, recipeJobs=recipe_jobs,
+                                 skipInstalled=RECIPE_POLICIES[installed_recipes])
     except PipelineAlreadyInstalledError:
         print('Pipeline already installed.', file=sys.stderr)
+    except RecipeBuildError as rbe:
+        print(rbe, file=sys.stderr)
+        sys.exit(1)
 
 
 @main.command(name='uninstall')
@@ -93,15 +168,23 @@ def uninstallPipeline(name, version=None):
 @main.command(name='reinstall')
 @click.option('-v', '--version', default=None, type=str)
 @click.option('--dev/--normal', default=False)
+@click.option('--recipe-jobs', default=1, help='recipes to build at once')
+@click.option('--installed-recipes', default='ask', type=click.Choice(sorted(RECIPE_POLICIES)),
+              help='what to do with recipes that are already installed')
 @click.argument('name', nargs=1)
 @click.argument('uri', nargs=1)
-def reinstallPipeline(name, uri, version=None, dev=False):
+def reinstallPipeline(name, uri, version=None, dev=False, recipe_jobs=1, installed_recipes='ask'):
     muConfig = ModuleUltraConfig.load()
     try:
         muConfig.uninstallPipeline(name, version=version)
     except KeyError:
         pass # pipeline not installed
-    muConfig.installPipeline(uri, dev=dev)
+    try:
+        muConfig.installPipeline(uri, dev=dev, recipeJobs=recipe_jobs,
+                                 skipInstalled=RECIPE_POLICIES[installed_recipes])
+    except RecipeBuildError as rbe:
+        print(rbe, file=sys.stderr)
+        sys.exit(1)
 
 ###############################################################################
 
@@ -111,9 +194,18 @@ def reinstallPipeline(name, uri, version=None, dev=False):
 @click.option('-v', '--version', default=None, type=str)
 @click.option('-c', '--local-config', default=None, type=str)
 @click.option('--sample-list', default=None, type=click.File('r'))
+@click.option('--sample-name', multiple=True, help='a sample to process')
+@click.option('--sample-glob', multiple=True, help='process samples matching this glob')
+@click.option('--sample-regex', multiple=True, help='process samples matching this regex')
+@click.option('--sample-type', multiple=True, help='process samples of this type')
+@click.option('--sample-group', multiple=True, help='process samples in this group')
 @click.option('--choose-endpts/--all-endpts', default=False)
 @click.option('--choose-exclude-endpts/--no-exclude-endpts', default=False)
 @click.option('--exclude-endpts', default='', type=str, help='list of comma-separated names')
+@click.option('--downstream-of', default='', type=str,
+              help='only run endpoints that depend on these comma-separated names')
+@click.option('--with-deps/--no-deps', default=False,
+              help='also run everything the chosen endpoints depend on')
 @click.option('--choose/--all', default=False)
 @click.option('--local/--cluster', default=True)
 @click.option('--dryrun/--wetrun', default=False)
@@ -121,9 +213,59 @@ def reinstallPipeline(name, uri, version=None, dev=False):
 @click.option('--compact/--logger', default=False)
 @click.option('--benchmark/--no-benchmark', default=False)
 @click.option('-j', '--jobs', default=1)
-def runPipe(pipeline, version, local_config, sample_list,
-            choose_endpts, choose_exclude_endpts, exclude_endpts, choose,
-            local, dryrun, unlock, compact, benchmark, jobs):
+@click.option('--delta/--full-plan', default=False,
+              help='only plan samples and endpoints without a registration flag; '
+                   'finished jobs are not rerun even if their inputs changed')
+@click.option('--latency-wait', default=None, type=int,
+              help='max seconds to wait for output files of finished jobs')
+@click.option('--group-size', default=None, type=int,
+              help='bundle up to this many cluster jobs per submission')
+@click.option('--group-by', default='rule', type=click.Choice(['rule', 'sample']))
+@click.option('--group-wait', default=30, type=int,
+              help='seconds to wait for a bundle to fill')
+@click.option('--stage-origins/--no-stage-origins', default=False,
+              help='copy origin files to local scratch before use')
+@click.option('--stage-dir', default=None, help='where to stage origin files')
+@click.option('--stage-jobs', default=None, type=int, help='origin files to stage at once')
+@click.option('--stage-budget-gb', default=None, type=float,
+              help='max GB of staged origin files')
+@click.option('--scratch/--no-scratch', default=False,
+              help='give each job its own scratch dir as $TMPDIR')
+@click.option('--scratch-budget-gb', default=None, type=float,
+              help='delay jobs while scratch dirs hold more than this')
+@click.option('--memprofile/--no-memprofile', default=False,
+              help='report peak RSS and top allocations of each stage in run_logs')
+@click.option('--result-cache/--no-result-cache', default=False,
+              help='reuse module outputs cached by earlier runs in any repo')
+@click.option('--result-cache-dir', default=None, help='dir of the result cache')
+@click.option('--result-cache-max-gb', default=None, type=float,
+              help='evict old cached results past this size')
+@click.option('--executor', default=None, type=click.Choice(EXECUTORS),
+              help='how jobs are executed, overrides --local/--cluster')
+@click.option('--array-size', default=None, type=int,
+              help='max jobs per array submission')
+@click.option('--fake-latency', default=1.0, type=float,
+              help='mean queue wait of the fake cluster in seconds')
+@click.option('--fake-failure-rate', default=0.0, type=float,
+              help='share of fake cluster tasks that are lost')
+@click.option('--fake-slots', default=None, type=int,
+              help='tasks the fake cluster runs at once')
+@click.option('--cores', default=None, type=int,
+              help='cores local jobs may use in total, 0 for all')
+@click.option('--mem-gb', default=None, type=float,
+              help='GB of memory local jobs may use in total, 0 for all')
+def runPipe(pipeline, version, local_config, sample_list, sample_name,
+            sample_glob, sample_regex, sample_type, sample_group,
+            choose_endpts, choose_exclude_endpts, exclude_endpts,
+            downstream_of, with_deps, choose, local, dryrun, unlock,
+            compact, benchmark, jobs, delta, latency_wait, group_size,
+            group_by, group_wait, stage_origins, stage_dir, stage_jobs,
+            stage_budget_gb, scratch, scratch_budget_gb, memprofile,
+            result_cache, result_cache_dir, result_cache_max_gb,
+            executor, array_size, fake_latency, fake_failure_rate, fake_slots,
+            cores, mem_gb):
+    from gimme_input import UserChoice, UserMultiChoice, BoolUserInput
+
     repo = ModuleUltraRepo.loadRepo()
     if pipeline is None:
         pipeline = UserChoice('pipeline', repo.listPipelines()).resolve()
@@ -147,32 +289,250 @@ def runPipe(pipeline, version, local_config, sample_list,
     inp = BoolUserInput('Process data from specific sample groups?', False)
     if choose and inp.resolve():
         groups = UserMultiChoice('What sample groups should be processed?',
-                                 dsRepo.db.sampleGroupTable.getAll(),
-                                 display=lambda x: x.name).resolve()
-    if sample_list:
-        samples = [line.strip() for line in sample_list if line.strip()]
-        all_samples = {sample.name for sample in dsRepo.db.sampleTable.getAll()}
-        samples = [sample for sample in samples if sample in all_samples]
-    else:
-        samples = None
+                                 rawNames(dsRepo.db.sampleGroupTable)).resolve()
+
+    names = None
+    if sample_list or sample_name:
+        names = list(sample_name)
+        if sample_list:
+            names = itertools.chain(names, sample_list)
+    selection = SampleSelection(names=names,
+                                patterns=sample_glob,
+                                regexes=sample_regex,
+                                sampleTypes=sample_type,
+                                groups=sample_group)
+    samples = None
+    if not selection.isEmpty():
+        samples = repo.selectSamples(selection)
     inp = BoolUserInput('Process data from a specific samples?', False)
     if choose and inp.resolve():
-        if groups is not None:
-            samplesToChooseFrom = []
-            for group in groups:
-                samplesToChooseFrom += group.samples()
-        else:
-            samplesToChooseFrom = dsRepo.db.sampleTable.getAll()
+        if samples is None:
+            samples = repo.selectSamples(SampleSelection(groups=groups))
         samples = UserMultiChoice('What samples should data be taken from?',
-                                  samplesToChooseFrom,
-                                  display=lambda x: x.name).resolve()
+                                  samples).resolve()
+
+    executor = pipe.getExecutor(local, name=executor, arraySize=array_size,
+                                latency=fake_latency, failureRate=fake_failure_rate,
+                                slots=fake_slots)
 
     # run the pipeline
-    pipe.run(endpts=endpts, excludeEndpts=excludedEndpts,
-             groups=groups, samples=samples, dryrun=dryrun,
-             unlock=unlock, local=local, jobs=jobs,
-             custom_config_file=local_config, compact_logger=compact,
-             benchmark=benchmark)
+    try:
+        pipe.run(endpts=endpts, excludeEndpts=excludedEndpts,
+                 groups=groups, samples=samples, dryrun=dryrun,
+                 unlock=unlock, local=local, jobs=jobs,
+                 custom_config_file=local_config, compact_logger=compact,
+                 benchmark=benchmark, delta=delta, latency_wait=latency_wait,
+                 group_size=group_size,
+                 group_by=group_by, group_wait=group_wait,
+                 downstreamOf=[name for name in downstream_of.split(',') if name],
+                 withDependencies=with_deps,
+                 stage_origins=stage_origins, stage_dir=stage_dir,
+                 stage_jobs=stage_jobs, stage_budget_gb=stage_budget_gb,
+                 scratch=scratch, scratch_budget_gb=scratch_budget_gb,
+                 memprofile=memprofile, result_cache=result_cache,
+                 result_cache_dir=result_cache_dir,
+                 result_cache_max_gb=result_cache_max_gb, executor=executor,
+                 cores=cores,
+                 mem_mb=None if mem_gb is None else int(mem_gb * 1024))
+    except RunLockedError as rle:
+        runId, names = rle.args
+        print('Run {} is already processing: {}'.format(runId, ', '.join(names)),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+###############################################################################
+
+@main.command(name='link')
+@click.option('-o', '--outdir', default='.', help='make virtual dirs in this dir')
+@click.option('-s', '--sample', multiple=True, help='make a virtual dir for this sample')
+@click.option('-g', '--group', multiple=True, help='make a virtual dir for this group')
+@click.option('--all-samples/--named-samples', default=False)
+@click.option('--all-groups/--named-groups', default=False)
+@click.option('--flat/--nested', default=False, help='layout of group dirs')
+@click.option('--hardlink/--symlink', default=False)
+@click.option('-j', '--jobs', default=1, help='dirs to build at once')
+def linkResults(outdir, sample, group, all_samples, all_groups, flat, hardlink, jobs):
+    repo = ModuleUltraRepo.loadRepo(readOnly=True)
+    db = repo.datasuperRepo().db
+    sampleNames = rawNames(db.sampleTable) if all_samples else sample
+    groupNames = rawNames(db.sampleGroupTable) if all_groups else group
+
+    farms = {}
+    try:
+        for sampleName in sampleNames:
+            links = sampleLinks(db.sampleTable.get(sampleName))
+            farms[os.path.join(outdir, sampleName)] = links
+        for groupName in groupNames:
+            links = groupLinks(db.sampleGroupTable.get(groupName), flat=flat)
+            farms[os.path.join(outdir, groupName)] = links
+    except KeyError as ke:
+        print('No such sample or group: {}'.format(ke.args[0]), file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        counts = buildLinkFarms(farms, hardlink=hardlink, jobs=jobs)
+    except NotALinkFarmError as nfe:
+        print('Not a virtual dir made by link, refusing to touch: {}'.format(nfe),
+              file=sys.stderr)
+        sys.exit(1)
+    made, kept, removed = [sum(col) for col in zip(*counts.values())] or [0, 0, 0]
+    print('{} dirs: {} links made, {} kept, {} removed'.format(len(counts), made,
+                                                              kept, removed))
+
+
+###############################################################################
+
+@main.command(name='export')
+@click.option('-g', '--group', multiple=True, required=True, help='export this group')
+@click.option('-e', '--endpoint', multiple=True, help='only export these result types')
+@click.option('-o', '--outfile', default='-', help='archive to write, - for stdout')
+@click.option('--format', 'fmt', default='tar', type=click.Choice(['tar', 'zip']))
+@click.option('--compress', default='none', type=click.Choice(['none', 'gzip', 'pigz']))
+@click.option('-t', '--threads', default=1, help='threads for pigz')
+@click.option('--read-ahead', default=16, help='MB to read ahead of the archive')
+def exportGroups(group, endpoint, outfile, fmt, compress, threads, read_ahead):
+    repo = ModuleUltraRepo.loadRepo(readOnly=True)
+    db = repo.datasuperRepo().db
+    resultTypes = set(endpoint) if endpoint else None
+    try:
+        groups = [db.sampleGroupTable.get(groupName) for groupName in group]
+    except KeyError as ke:
+        print('No such group: {}'.format(ke.args[0]), file=sys.stderr)
+        sys.exit(1)
+    entries = itertools.chain.from_iterable(
+        groupEntries(groupRec, resultTypes=resultTypes) for groupRec in groups
+    )
+
+    out = sys.stdout.buffer if outfile == '-' else outfile
+    writer = ArchiveWriter(out, fmt=fmt, compress=compress, threads=threads)
+    try:
+        manifest = exportResults(entries, writer, maxChunks=max(1, read_ahead))
+    finally:
+        writer.close()
+    print('Exported {} files'.format(len(manifest)), file=sys.stderr)
+
+
+###############################################################################
+
+@main.command(name='verify')
+@click.option('-e', '--endpoint', multiple=True, help='only verify these result types')
+@click.option('-j', '--jobs', default=1, help='files to hash at once')
+@click.option('--rehash/--use-cache', default=False, help='hash files even if unchanged')
+def verifyResults(endpoint, jobs, rehash):
+    repo = ModuleUltraRepo.loadRepo()
+    db = repo.datasuperRepo().db
+    endpoints = set(endpoint) if endpoint else None
+    report = verifyFiles(registeredFiles(db, endpoints=endpoints),
+                         DigestCache(repo.store), jobs=jobs, rehash=rehash)
+    if not report.endpoints:
+        print('No file records found', file=sys.stderr)
+        sys.exit(1)
+    for name, counts in sorted(report.endpoints.items()):
+        print('{}: {} ok, {} missing, {} altered'.format(name, counts['ok'],
+                                                         len(counts['missing']),
+                                                         len(counts['altered'])))
+        for path in counts['missing']:
+            print('\tmissing\t{}'.format(path))
+        for path in counts['altered']:
+            print('\taltered\t{}'.format(path))
+    if not report.isClean():
+        sys.exit(1)
+
+
+###############################################################################
+
+@main.command(name='gc')
+@click.option('--dryrun', 'action', flag_value='report', default=True,
+              help='only report unreferenced files')
+@click.option('--delete', 'action', flag_value='delete', help='delete unreferenced files')
+@click.option('--compress', 'action', flag_value='compress',
+              help='gzip unreferenced files in place')
+@click.option('-j', '--jobs', default=1, help='dirs to handle at once')
+@click.option('-k', '--keep', multiple=True,
+              help='also keep files matching this glob')
+@click.option('--list/--totals', 'list_files', default=False)
+def collectGarbage(action, jobs, keep, list_files):
+    repo = ModuleUltraRepo.loadRepo(readOnly=(action == 'report'))
+    dsRepo = repo.datasuperRepo()
+    referenced = [dsRepo.toAbspath(rawRec['filepath'])
+                  for rawRec in dsRepo.db.fileTable.getAllRaw()]
+    patterns = []
+    for pipeName in repo.listPipelines():
+        pipe = repo.getPipelineInstance(pipeName)
+        for schema in pipe.listResultSchema():
+            patterns += schema.getResultFilePatterns()
+
+    collector = GarbageCollector(repo.getResultDir(), referenced, patterns,
+                                 keepPatterns=DEFAULT_KEEP_PATTERNS + list(keep),
+                                 skipDirs=claimedNames(repo.getLockDir()))
+    totals, files = collector.collect(action=action, jobs=jobs)
+    if list_files:
+        for path in files:
+            print(path)
+    for module, total in sorted(totals.items()):
+        print('{}\t{} files\t{} bytes\t{} freed\t{} skipped'.format(
+            module, total['files'], total['bytes'], total['freed'], total['skipped']))
+
+
+###############################################################################
+
+@main.group(name='cache')
+def cache():
+    pass
+
+
+def loadResultCache(cache_dir):
+    if not cache_dir:
+        settings = ModuleUltraConfig.load(readOnly=True).resultCache()
+        if not settings:
+            print('No result cache dir set', file=sys.stderr)
+            sys.exit(1)
+        cache_dir = settings['dir']
+    return ResultCache(cache_dir)
+
+
+@cache.command(name='stats')
+@click.option('-d', '--cache-dir', default=None, help='dir of the result cache')
+def cacheStats(cache_dir):
+    resultCache = loadResultCache(cache_dir)
+    print('{} entries\t{} bytes'.format(len(resultCache.index), resultCache.size()))
+    for module, stats in sorted(resultCache.stats.items()):
+        print('{}\t{hits} hits\t{misses} misses\t{stored} stored\t'
+              '{evicted} evicted\t{bytes_restored} bytes restored'.format(module, **stats))
+
+
+@cache.command(name='evict')
+@click.option('-d', '--cache-dir', default=None, help='dir of the result cache')
+@click.option('--max-gb', default=0, type=float, help='evict old results past this size')
+def cacheEvict(cache_dir, max_gb):
+    resultCache = loadResultCache(cache_dir)
+    removed = resultCache.evict(maxBytes=int(max_gb * 1024 * 1024 * 1024))
+    print('Evicted {} entries'.format(removed))
+
+
+###############################################################################
+
+@main.group(name='manifest')
+def manifest():
+    pass
+
+
+@manifest.command(name='sync')
+@click.option('--rebuild/--validate', default=False,
+              help='rebuild every entry instead of only stale ones')
+def syncManifest(rebuild):
+    from moduleultra.pipeline_instance_utils import lazyRecords
+
+    repo = ModuleUltraRepo.loadRepo()
+    dsRepo = repo.datasuperRepo()
+    originManifest = repo.originManifest()
+    if rebuild:
+        originManifest.clear()
+    fileChecksums = {dsRepo.toAbspath(rawRec['filepath']): rawRec.get('checksum')
+                     for rawRec in dsRepo.db.fileTable.getAllRaw()}
+    counts = originManifest.sync(lazyRecords(dsRepo.db.sampleTable), fileChecksums)
+    print('{ok} ok, {rebuilt} rebuilt, {removed} removed'.format(**counts))
 
 
 ###############################################################################
@@ -192,7 +552,7 @@ def viewPipelines(installed):
         # to add a pipeline to a repo navigate to the repo and run
         # moduleultra add <pipeline name>
         '''
-        muConfig = ModuleUltraConfig.load()
+        muConfig = ModuleUltraConfig.load(readOnly=True)
         for pName, versions in muConfig.listInstalledPipelines().items():
             vs = ' '.join([str(el) for el in versions])
             print('{} :: {}'.format(pName, vs))
@@ -202,7 +562,7 @@ def viewPipelines(installed):
         # to see all installed pipelines use '--installed' flag
         '''
         print(msg)
-        repo = ModuleUltraRepo.loadRepo()
+        repo = ModuleUltraRepo.loadRepo(readOnly=True)
         for pName in repo.listPipelines():
             print(pName)
 
@@ -218,7 +578,9 @@ def detail():
 @click.option('-v', '--version', default=None, type=str)
 @click.argument('name', nargs=1)
 def detailPipeline(version, name):
-    repo = ModuleUltraRepo.loadRepo()
+    from yaml import dump as ydump
+
+    repo = ModuleUltraRepo.loadRepo(readOnly=True)
     pipe = repo.getPipelineInstance(name, version=version)
 
     out = {
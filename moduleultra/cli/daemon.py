@@ -4,7 +4,15 @@ import click
 
 from time import gmtime, strftime
 
-from moduleultra.daemon import repo_status, repo_run
+from moduleultra.daemon import (
+    repo_status,
+    repo_run,
+    repo_daemon,
+    DaemonStatus,
+    StatusServer,
+    fetch_status,
+)
+from moduleultra.daemon.config import DaemonConfig
 from moduleultra.utils import joinPipelineNameVersion
 
 
@@ -14,8 +22,15 @@ def daemon():
 
 
 @daemon.command('status')
-def cli_daemon_status():
+@click.option('-e', '--endpoint', default=None,
+              help='Read cached status from a running daemon (port, URL or socket path)')
+@click.option('--metrics/--json', default=False,
+              help='Print Prometheus metrics instead of JSON when reading from a daemon')
+def cli_daemon_status(endpoint, metrics):
     """Print the status of all repos in the config."""
+    if endpoint:
+        print(fetch_status(endpoint, path='/metrics' if metrics else '/status'), end='')
+        return
     for repo_config, pipelines in repo_status():
         header = f'{repo_config.repo_name} {repo_config.repo_path}'
         for (pipe_name, version), num_jobs in pipelines:
@@ -25,6 +40,31 @@ def cli_daemon_status():
 
 
 @daemon.command('run')
-def cli_daemon_run():
+@click.option('--loop/--once', default=False, help='Keep running cycles')
+@click.option('-i', '--interval', default=None, type=int,
+              help='Min seconds between the start of cycles')
+@click.option('-p', '--status-port', default=None, type=int,
+              help='Serve status on this localhost port')
+@click.option('-s', '--status-socket', default=None,
+              help='Serve status on this Unix socket')
+@click.option('--memprofile/--no-memprofile', default=None,
+              help='Write memory reports of each run and status probe to run_logs')
+def cli_daemon_run(loop, interval, status_port, status_socket, memprofile):
     """Run unfinished pipelines in the config."""
-    repo_run()
+    daemon_config = DaemonConfig.load_from_yaml()
+    if memprofile is not None:
+        daemon_config.memprofile = memprofile
+    status_port = status_port if status_port is not None else daemon_config.status_port
+    status_socket = status_socket if status_socket else daemon_config.status_socket
+    status, server = None, None
+    if status_port is not None or status_socket:
+        status = DaemonStatus()
+        server = StatusServer(status, port=status_port, socket_path=status_socket).start()
+    try:
+        if loop:
+            repo_daemon(daemon_config=daemon_config, status=status, interval=interval)
+        else:
+            repo_run(daemon_config=daemon_config, status=status)
+    finally:
+        if server:
+            server.stop()
@@ -1,2 +1,3 @@
 
-from .api import repo_status, repo_run
+from .api import repo_status, repo_run, repo_daemon
+from .status import DaemonStatus, StatusServer, fetch_status
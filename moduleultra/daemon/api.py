@@ -1,4 +1,5 @@
 
+from time import sleep, time
 from random import choice
 from os import chdir, getcwd
 from multiprocessing import Pool, TimeoutError
@@ -6,13 +7,21 @@ from multiprocessing import Pool, TimeoutError
 from .config import DaemonConfig
 
 
-def repo_status(daemon_config=None, timeout=3600):
-    """Return a dict of repo_config -> [((pipeline_name, version), number_outstanding_jobs)]."""
+PROBE_FAILED = -1000
+
+
+def repo_status(daemon_config=None, timeout=3600, skip=None):
+    """Return a dict of repo_config -> [((pipeline_name, version), number_outstanding_jobs)].
+
+    Pipelines whose status could not be found get PROBE_FAILED jobs.
+    Pipelines in `skip`, a set of (repo_name, pipeline_name), are not
+    probed and left out.
+    """
     daemon_config = daemon_config if daemon_config else DaemonConfig.load_from_yaml()
     original_dir = getcwd()
     pool = Pool(daemon_config.total_jobs)
     async_results = [
-        pool.apply_async(handle_one_repo, (repo_config, daemon_config, original_dir))
+        pool.apply_async(handle_one_repo, (repo_config, daemon_config, original_dir, skip))
         for repo_config in daemon_config.list_repos()
     ]
     for result in async_results:
@@ -22,12 +31,15 @@ def repo_status(daemon_config=None, timeout=3600):
             pass
 
 
-def handle_one_repo(repo_config, daemon_config, original_dir):
+def handle_one_repo(repo_config, daemon_config, original_dir, skip=None):
     try:
         chdir(repo_config.repo_path)
-        return repo_config, list(_status_one_repo(daemon_config, repo_config))
+        return repo_config, list(_status_one_repo(daemon_config, repo_config, skip=skip))
     except Exception:
-        pass
+        return repo_config, [
+            (pipe, PROBE_FAILED) for pipe in repo_config.get_pipeline_list()
+            if not skip or (repo_config.repo_name, pipe[0]) not in skip
+        ]
     finally:
         chdir(original_dir)
 
@@ -54,15 +66,27 @@ class _SnakemakeInfoGrabber:
             self.num_outstanding_jobs += count
 
 
-def _status_one_repo(daemon_config, repo_config):
+class _FinishedJobCounter:
+    """Count the jobs a snakemake run finishes."""
+
+    def __init__(self):
+        self.num_finished_jobs = 0
+
+    def handle_msg(self, msg):
+        if msg['level'] == 'job_finished':
+            self.num_finished_jobs += 1
+
+
+def _status_one_repo(daemon_config, repo_config, skip=None):
     for pipe_name, pipe_version in repo_config.get_pipeline_list():
+        if skip and (repo_config.repo_name, pipe_name) in skip:
+            continue
         try:
             yield (pipe_name, pipe_version), _status_one_repo_one_pipeline(
                 daemon_config, repo_config, pipe_name, pipe_version
             )
         except Exception:
-            raise
-            yield (pipe_name, pipe_version), -1000
+            yield (pipe_name, pipe_version), PROBE_FAILED
 
 
 def _status_one_repo_one_pipeline(daemon_config, repo_config, pipe_name, pipe_version):
@@ -81,26 +105,84 @@ def _status_one_repo_one_pipeline(daemon_config, repo_config, pipe_name, pipe_ve
         custom_config_file=daemon_config.get_pipeline_run_config(pipe_name, pipe_version),
         dryrun=True,
         logger=lambda x: x,
-        loghandler=count.handle_msg
+        loghandler=count.handle_msg,
+        memprofile=daemon_config.memprofile,
     )
     return count.num_outstanding_jobs
 
 
-def repo_run(daemon_config=None):
+def repo_run(daemon_config=None, status=None, backoff=None):
     """Run unfished pipelines in the repo.
 
-    Only run one pipeline per repo at a time.
+    Only run one pipeline per repo at a time. If `status` (a
+    DaemonStatus) is given keep it up to date as the cycle goes.
+
+    Pipelines that fail, either their status probe or their run, are
+    paused by `backoff` (a FailureBackoff, by default the one in the
+    daemon config) and not probed or run until the pause is over. A run
+    only fails if it raises or finishes no job at all, so one bad sample
+    does not pause the others. A probe that finds nothing to run, or a
+    run that is not a failure, clears the failures of its pipeline.
     """
     daemon_config = daemon_config if daemon_config else DaemonConfig.load_from_yaml()
+    backoff = backoff if backoff else daemon_config.get_backoff()
     jobs_per_repo = daemon_config.total_jobs / len(daemon_config.repos)
-    for repo_config, pipelines in repo_status(daemon_config=daemon_config):
+    if status:
+        status.start_cycle()
+    paused = backoff.paused()
+    for repo_config, pipelines in repo_status(daemon_config=daemon_config, skip=paused):
+        _record_probes(backoff, repo_config, pipelines)
+        if status:
+            _record_status(status, repo_config, pipelines, backoff)
+        pipelines = [p for p in pipelines if p[1] != PROBE_FAILED]
         try:
-            _run_one_repo(daemon_config, repo_config, pipelines, jobs_per_repo)
+            _run_one_repo(daemon_config, repo_config, pipelines, jobs_per_repo,
+                          status=status, backoff=backoff)
         except Exception:
             continue
+    if status:
+        status.finish_cycle()
+
+
+def repo_daemon(daemon_config=None, status=None, interval=None, max_cycles=None):
+    """Run cycles of `repo_run` forever, or for `max_cycles`.
 
+    Wait until `interval` seconds have passed since the start of a cycle
+    before starting the next one.
+    """
+    daemon_config = daemon_config if daemon_config else DaemonConfig.load_from_yaml()
+    interval = daemon_config.cycle_interval if interval is None else interval
+    cycles = 0
+    while max_cycles is None or cycles < max_cycles:
+        start = time()
+        repo_run(daemon_config=daemon_config, status=status)
+        cycles += 1
+        if max_cycles is None or cycles < max_cycles:
+            sleep(max(0, interval - (time() - start)))
+
+
+def _record_status(status, repo_config, pipelines, backoff):
+    for (pipe_name, pipe_version), num_jobs in pipelines:
+        if num_jobs != PROBE_FAILED:
+            status.set_outstanding(
+                repo_config.repo_name, pipe_name, pipe_version, num_jobs,
+                tolerance=repo_config.get_pipeline_tolerance(pipe_name)
+            )
+    for pipe_name, pipe_version in repo_config.get_pipeline_list():
+        reason = backoff.pause_reason(repo_config.repo_name, pipe_name)
+        if reason:
+            status.set_paused(repo_config.repo_name, pipe_name, pipe_version, reason)
 
-def _run_one_repo(daemon_config, repo_config, pipelines, njobs):
+
+def _record_probes(backoff, repo_config, pipelines):
+    for (pipe_name, _), num_jobs in pipelines:
+        if num_jobs == PROBE_FAILED:
+            backoff.record_failure(repo_config.repo_name, pipe_name, 'status probe failed')
+        elif num_jobs <= repo_config.get_pipeline_tolerance(pipe_name):
+            backoff.record_success(repo_config.repo_name, pipe_name)
+
+
+def _run_one_repo(daemon_config, repo_config, pipelines, njobs, status=None, backoff=None):
     (pipe_name, pipe_version), _ = choice([
         p for p in pipelines if p[1] > repo_config.get_pipeline_tolerance(p[0][0])
     ])
@@ -111,10 +193,41 @@ def _run_one_repo(daemon_config, repo_config, pipelines, njobs):
         repo.addPipeline(pipe_name, version=pipe_version)
         pipe = repo.getPipelineInstance(pipe_name)
     assert pipe.pipelineVersion == pipe_version
-    pipe.run(
-        endpts=repo_config.get_pipeline_endpts(pipe_name),
-        excludeEndpts=repo_config.get_pipeline_excluded_endpts(pipe_name),
-        local=daemon_config.run_local,
-        jobs=njobs,
-        custom_config_file=daemon_config.get_pipeline_run_config(pipe_name, pipe_version),
-    )
+    finished = _FinishedJobCounter()
+    if status:
+        status.start_run(repo_config.repo_name, pipe_name)
+    try:
+        success = pipe.run(
+            endpts=repo_config.get_pipeline_endpts(pipe_name),
+            excludeEndpts=repo_config.get_pipeline_excluded_endpts(pipe_name),
+            local=daemon_config.run_local,
+            jobs=njobs,
+            custom_config_file=daemon_config.get_pipeline_run_config(pipe_name, pipe_version),
+            memprofile=daemon_config.memprofile,
+            loghandler=finished.handle_msg,
+        )
+    except Exception as exc:
+        _record_failure(backoff, status, repo_config, pipe_name, pipe_version, repr(exc))
+        raise
+    finally:
+        if status:
+            status.finish_run(repo_config.repo_name, pipe_name)
+    _record_run(backoff, status, repo_config, pipe_name, pipe_version,
+                success, finished.num_finished_jobs)
+
+
+def _record_run(backoff, status, repo_config, pipe_name, pipe_version, success, num_finished):
+    if success is False and num_finished == 0:
+        _record_failure(backoff, status, repo_config, pipe_name, pipe_version,
+                        'run failed without finishing a job')
+    elif backoff:
+        backoff.record_success(repo_config.repo_name, pipe_name)
+
+
+def _record_failure(backoff, status, repo_config, pipe_name, pipe_version, error):
+    if not backoff:
+        return
+    backoff.record_failure(repo_config.repo_name, pipe_name, error)
+    if status:
+        reason = backoff.pause_reason(repo_config.repo_name, pipe_name)
+        status.set_paused(repo_config.repo_name, pipe_name, pipe_version, reason)
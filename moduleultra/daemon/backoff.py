@@ -0,0 +1,86 @@
+"""Back off from pipelines that keep failing."""
+
+import os
+import json
+from time import time
+from tempfile import NamedTemporaryFile
+
+
+class FailureBackoff:
+    """Track failures per (repo, pipeline) and pause the failing ones.
+
+    After `n` failures in a row a pipeline is paused for
+    `base_seconds * 2 ** (n - 1)` seconds, at most `max_seconds`. A
+    success clears its record. Records are kept as JSON in `path` so
+    they outlive the daemon.
+    """
+
+    def __init__(self, path=None, base_seconds=600, max_seconds=24 * 3600):
+        self.path = path
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.records = self._load()
+
+    @staticmethod
+    def _key(repo_name, pipe_name):
+        return f'{repo_name}::{pipe_name}'
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        with NamedTemporaryFile('w', dir=dirname, delete=False) as f:
+            json.dump(self.records, f, indent=2)
+        os.replace(f.name, self.path)
+
+    def delay(self, failures):
+        """Return the seconds to pause after `failures` failures in a row."""
+        if failures <= 0:
+            return 0
+        return min(self.max_seconds, self.base_seconds * 2 ** (failures - 1))
+
+    def record_failure(self, repo_name, pipe_name, error, now=None):
+        """Record a failure and return the time the pipeline may run again."""
+        now = time() if now is None else now
+        record = self.records.get(self._key(repo_name, pipe_name), {'failures': 0})
+        record['failures'] += 1
+        record['last_error'] = str(error)[-1000:]
+        record['last_failure'] = now
+        record['retry_after'] = now + self.delay(record['failures'])
+        self.records[self._key(repo_name, pipe_name)] = record
+        self._save()
+        return record['retry_after']
+
+    def record_success(self, repo_name, pipe_name):
+        if self.records.pop(self._key(repo_name, pipe_name), None) is not None:
+            self._save()
+
+    def pause_reason(self, repo_name, pipe_name, now=None):
+        """Return why a pipeline is paused or None if it may run."""
+        now = time() if now is None else now
+        record = self.records.get(self._key(repo_name, pipe_name))
+        if not record or record['retry_after'] <= now:
+            return None
+        return '{} failures in a row, retry in {:.0f}s: {}'.format(
+            record['failures'], record['retry_after'] - now, record['last_error']
+        )
+
+    def paused(self, now=None):
+        """Return a set of (repo_name, pipe_name) that are paused."""
+        now = time() if now is None else now
+        out = set()
+        for key, record in self.records.items():
+            if record['retry_after'] > now:
+                repo_name, pipe_name = key.split('::', 1)
+                out.add((repo_name, pipe_name))
+        return out
@@ -5,6 +5,7 @@ from os.path import join, isfile
 
 from ..module_ultra_repo import ModuleUltraRepo
 from ..module_ultra_config import ModuleUltraConfig
+from .backoff import FailureBackoff
 
 
 class RepoDaemonConfig:
@@ -41,11 +42,21 @@ class RepoDaemonConfig:
 class DaemonConfig:
     """Store config information for the MU daemon."""
 
-    def __init__(self, repos, total_jobs=10, run_local=True, pipeline_configs={}):
+    def __init__(self, repos, total_jobs=10, run_local=True, pipeline_configs={},
+                 status_port=None, status_socket=None, cycle_interval=600,
+                 backoff_file=None, backoff_base_seconds=600, backoff_max_seconds=24 * 3600,
+                 memprofile=False):
         self.repos = repos
         self.total_jobs = int(total_jobs)
         self.run_local = run_local
         self.pipeline_configs = pipeline_configs
+        self.status_port = status_port
+        self.status_socket = status_socket
+        self.cycle_interval = int(cycle_interval)
+        self.backoff_file = backoff_file
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.memprofile = memprofile
 
     def list_repos(self):
         """Return a list of RepoDaemonConfigs."""
@@ -62,6 +73,19 @@ class DaemonConfig:
         """Return a filepath for the config to be used or None."""
         return None
 
+    def get_backoff(self):
+        """Return the FailureBackoff for this daemon.
+
+        Failures are kept in `backoff_file` or daemon_backoff.json in
+        the config dir.
+        """
+        backoff_file = self.backoff_file
+        if not backoff_file:
+            backoff_file = join(ModuleUltraConfig.getConfigDir(), 'daemon_backoff.json')
+        return FailureBackoff(backoff_file,
+                              base_seconds=self.backoff_base_seconds,
+                              max_seconds=self.backoff_max_seconds)
+
     @classmethod
     def get_daemon_config_filename(ctype):
         try:
@@ -86,5 +110,12 @@ class DaemonConfig:
             repo_list,
             total_jobs=raw_config.get('num_jobs', 10),
             run_local=raw_config.get('run_on_cluster', True),
-            pipeline_configs=raw_config.get('pipeline_configs', {})
+            pipeline_configs=raw_config.get('pipeline_configs', {}),
+            status_port=raw_config.get('status_port', None),
+            status_socket=raw_config.get('status_socket', None),
+            cycle_interval=raw_config.get('cycle_interval', 600),
+            backoff_file=raw_config.get('backoff_file', None),
+            backoff_base_seconds=raw_config.get('backoff_base_seconds', 600),
+            backoff_max_seconds=raw_config.get('backoff_max_seconds', 24 * 3600),
+            memprofile=raw_config.get('memprofile', False),
         )
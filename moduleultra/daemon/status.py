@@ -0,0 +1,248 @@
+"""Cached daemon status served over a local HTTP or Unix socket endpoint."""
+
+import os
+import json
+import socket
+import threading
+from time import time
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.request import urlopen
+
+
+class DaemonStatus:
+    """Thread safe record of what the daemon is doing.
+
+    The daemon updates this as it goes so reading it never triggers a
+    dry run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time()
+        self.pipelines = {}  # (repo_name, pipe_name) -> dict
+        self.running = {}  # (repo_name, pipe_name) -> start time
+        self.cycles = 0
+        self.cycle_started = None
+        self.last_cycle_seconds = None
+        self.total_cycle_seconds = 0.
+
+    def start_cycle(self):
+        with self._lock:
+            self.cycle_started = time()
+
+    def finish_cycle(self):
+        with self._lock:
+            if self.cycle_started is None:
+                return
+            self.last_cycle_seconds = time() - self.cycle_started
+            self.total_cycle_seconds += self.last_cycle_seconds
+            self.cycles += 1
+            self.cycle_started = None
+
+    def set_outstanding(self, repo_name, pipe_name, version, num_jobs, tolerance=0):
+        """Record the number of outstanding jobs found by a dry run."""
+        with self._lock:
+            self.pipelines[(repo_name, pipe_name)] = {
+                'repo': repo_name,
+                'pipeline': pipe_name,
+                'version': version,
+                'outstanding_jobs': num_jobs,
+                'queued': num_jobs > (tolerance or 0),
+                'paused_reason': None,
+                'updated': time(),
+            }
+
+    def set_paused(self, repo_name, pipe_name, version, reason):
+        """Record that a pipeline is not probed or run, and why."""
+        with self._lock:
+            pipeline = self.pipelines.setdefault((repo_name, pipe_name), {
+                'repo': repo_name,
+                'pipeline': pipe_name,
+                'version': version,
+                'outstanding_jobs': None,
+            })
+            pipeline['queued'] = False
+            pipeline['paused_reason'] = reason
+            pipeline['updated'] = time()
+
+    def start_run(self, repo_name, pipe_name):
+        with self._lock:
+            self.running[(repo_name, pipe_name)] = time()
+
+    def finish_run(self, repo_name, pipe_name):
+        with self._lock:
+            self.running.pop((repo_name, pipe_name), None)
+            pipeline = self.pipelines.get((repo_name, pipe_name))
+            if pipeline:
+                pipeline['queued'] = False
+
+    def to_dict(self):
+        """Return a JSON serializable snapshot of the status."""
+        now = time()
+        with self._lock:
+            pipelines = [dict(pipe) for _, pipe in sorted(self.pipelines.items())]
+            running = [
+                {'repo': repo_name, 'pipeline': pipe_name, 'seconds': now - started}
+                for (repo_name, pipe_name), started in sorted(self.running.items())
+            ]
+            return {
+                'uptime_seconds': now - self.started,
+                'pipelines': pipelines,
+                'running': running,
+                'queue_depth': sum(1 for pipe in pipelines if pipe['queued']),
+                'cycles': self.cycles,
+                'cycle_running': self.cycle_started is not None,
+                'last_cycle_seconds': self.last_cycle_seconds,
+                'total_cycle_seconds': self.total_cycle_seconds,
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Return the status in the Prometheus text exposition format."""
+        status = self.to_dict()
+        lines = []
+
+        def metric(name, mtype, helpstr, samples):
+            lines.append(f'# HELP moduleultra_daemon_{name} {helpstr}')
+            lines.append(f'# TYPE moduleultra_daemon_{name} {mtype}')
+            for labels, value in samples:
+                label_str = ','.join(
+                    '{}="{}"'.format(key, str(val).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, val in labels.items()
+                )
+                label_str = '{' + label_str + '}' if label_str else ''
+                lines.append(f'moduleultra_daemon_{name}{label_str} {value}')
+
+        metric('uptime_seconds', 'gauge', 'Seconds since the daemon started.',
+               [({}, status['uptime_seconds'])])
+        metric('outstanding_jobs', 'gauge', 'Outstanding jobs found by the last dry run.',
+               [({'repo': pipe['repo'], 'pipeline': pipe['pipeline']},
+                 pipe['outstanding_jobs'])
+                for pipe in status['pipelines'] if pipe['outstanding_jobs'] is not None])
+        metric('paused', 'gauge', '1 if a pipeline is paused after failing.',
+               [({'repo': pipe['repo'], 'pipeline': pipe['pipeline']},
+                 int(bool(pipe['paused_reason'])))
+                for pipe in status['pipelines']])
+        metric('running', 'gauge', 'Seconds each running pipeline has been running.',
+               [({'repo': run['repo'], 'pipeline': run['pipeline']}, run['seconds'])
+                for run in status['running']])
+        metric('queue_depth', 'gauge', 'Pipelines waiting to be run.',
+               [({}, status['queue_depth'])])
+        metric('cycles_total', 'counter', 'Completed daemon cycles.',
+               [({}, status['cycles'])])
+        metric('cycle_seconds_total', 'counter', 'Time spent in completed cycles.',
+               [({}, status['total_cycle_seconds'])])
+        if status['last_cycle_seconds'] is not None:
+            metric('last_cycle_seconds', 'gauge', 'Duration of the last cycle.',
+                   [({}, status['last_cycle_seconds'])])
+        return '\n'.join(lines) + '\n'
+
+
+def _make_handler(status):
+
+    class StatusHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            path = self.path.split('?')[0].rstrip('/')
+            if path in ('', '/status'):
+                body, ctype = status.to_json(), 'application/json'
+            elif path == '/metrics':
+                body, ctype = status.to_prometheus(), 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return str(self.client_address or 'unix')
+
+        def log_message(self, format, *args):
+            pass
+
+    return StatusHandler
+
+
+class _TCPHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ''
+
+
+class StatusServer:
+    """Serve a DaemonStatus on localhost or a Unix socket in a thread.
+
+    `/status` gives JSON and `/metrics` the Prometheus text format.
+    """
+
+    def __init__(self, status, port=None, socket_path=None):
+        assert port is not None or socket_path, 'Need a port or a socket path'
+        handler = _make_handler(status)
+        self.socket_path = socket_path
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.server = _UnixHTTPServer(socket_path, handler)
+        else:
+            self.server = _TCPHTTPServer(('127.0.0.1', port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        if self.socket_path:
+            return None
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def fetch_status(endpoint, path='/status', timeout=10):
+    """Return the body served by a daemon at `endpoint`.
+
+    `endpoint` is a port number, a URL or the path of a Unix socket.
+    """
+    endpoint = str(endpoint)
+    if endpoint.isdigit():
+        endpoint = f'http://127.0.0.1:{endpoint}'
+    if endpoint.startswith('http'):
+        with urlopen(endpoint.rstrip('/') + path, timeout=timeout) as response:
+            return response.read().decode('utf-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(endpoint)
+        sock.sendall(f'GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n'.encode('utf-8'))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    header, _, body = b''.join(chunks).partition(b'\r\n\r\n')
+    status_line = header.split(b'\r\n')[0].decode('utf-8')
+    if status_line.split()[1:2] != ['200']:
+        raise IOError(f'Bad response from {endpoint}: {status_line}')
+    return body.decode('utf-8')
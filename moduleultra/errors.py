@@ -18,3 +18,19 @@ class PipelineAlreadyInstalledError(Exception):
 
 class PipelineAlreadyInRepoError(Exception):
     pass
+
+
+class NotALinkFarmError(Exception):
+    pass
+
+
+class RecipeBuildError(Exception):
+    pass
+
+
+class RunLockedError(Exception):
+    pass
+
+
+class PipelineCycleError(Exception):
+    pass
@@ -0,0 +1,235 @@
+'''Ways to execute the jobs of a run.
+
+An executor tells `PipelineInstance.run` whether jobs run on the local
+machine and, if not, how they are submitted:
+
+    LocalExecutor: snakemake runs the jobs itself.
+    SubmitScriptExecutor: every job, or bundle of jobs, is handed to a
+        cluster submit script.
+    ArrayJobExecutor: jobs of the same rule are batched into array jobs,
+        one submission for up to `arraySize` jobs.
+    FakeClusterExecutor: a simulated cluster on the local machine with
+        queue latency and node failures, for tests and for benchmarking
+        scheduling at scale without a scheduler.
+
+Executors other than the local and plain submit script ones always
+route jobs through the spool of a `JobBundler`, which groups spooled
+jobscripts and calls `submit` for each group.
+'''
+
+import os
+import os.path
+import heapq
+import random
+import subprocess as sp
+from abc import ABC, abstractmethod
+from time import time
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+
+from .job_bundler import markJobFailed, submitScript, writeBundleScript
+
+
+ARRAY_TASK_VAR = 'MU_ARRAY_TASK_ID'
+
+
+def writeArrayScript(path, jobscripts):
+    '''Write a script that runs one of `jobscripts` per array task.
+
+    The task index is 1-based and read from MU_ARRAY_TASK_ID or from
+    the variable set by SLURM, SGE, PBS or LSF.
+    '''
+    with open(path, 'w') as script:
+        script.write('#!/bin/sh\n')
+        script.write('task=${{{}:-${{SLURM_ARRAY_TASK_ID:-${{SGE_TASK_ID:-'
+                     '${{PBS_ARRAYID:-$LSB_JOBINDEX}}}}}}}}\n'.format(ARRAY_TASK_VAR))
+        script.write('case "$task" in\n')
+        for index, jobscript in enumerate(jobscripts, 1):
+            script.write('    {}) sh "{}" ;;\n'.format(index, jobscript))
+        script.write('    *) echo "unknown array task: $task" >&2; exit 1 ;;\n')
+        script.write('esac\n')
+
+
+class Executor(ABC):
+    '''Base class of executors.
+
+    `local` executors let snakemake run jobs itself, others are given
+    to snakemake as a cluster command. If `spools` is True jobs always
+    go through a `JobBundler`; `arraySize` is then its default bundle
+    size. Subclasses must implement `submit`.
+    '''
+
+    name = None
+    local = False
+    spools = False
+    arraySize = None
+
+    def clusterCommand(self):
+        '''Return the cluster command for snakemake when not spooling.'''
+        return None
+
+    def statusCommand(self):
+        '''Return the cluster status command or None.'''
+        return None
+
+    @abstractmethod
+    def submit(self, scriptPath, jobscripts):
+        '''Submit a group of jobscripts, written to `scriptPath`, return a job id.'''
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+
+class LocalExecutor(Executor):
+    '''Run jobs on this machine through snakemake.'''
+
+    name = 'local'
+    local = True
+
+    def submit(self, scriptPath, jobscripts):
+        raise TypeError('The {} executor runs jobs through snakemake and '
+                        'cannot submit them'.format(self.name))
+
+
+class SubmitScriptExecutor(Executor):
+    '''Submit jobs, or bundles of jobs, through a cluster submit script.
+
+    The script is called with the path of a job script and prints a job
+    id. If a status script is given it is called with that id.
+    '''
+
+    name = 'cluster'
+
+    def __init__(self, submitCmd, statusCmd=None):
+        self.submitCmd = submitCmd
+        self.statusCmd = statusCmd
+
+    def clusterCommand(self):
+        return self.submitCmd
+
+    def statusCommand(self):
+        return self.statusCmd
+
+    def submit(self, scriptPath, jobscripts):
+        writeBundleScript(scriptPath, jobscripts)
+        return submitScript('{} "{}"'.format(self.submitCmd, scriptPath), jobscripts)
+
+
+class ArrayJobExecutor(SubmitScriptExecutor):
+    '''Submit jobs of the same rule as array jobs.
+
+    The array submit script is called with the number of tasks and the
+    path of the array script and prints a job id. The status script, if
+    any, is called with that id and answers for the whole array.
+    '''
+
+    name = 'array'
+    spools = True
+
+    def __init__(self, submitCmd, statusCmd=None, arraySize=100):
+        super(ArrayJobExecutor, self).__init__(submitCmd, statusCmd=statusCmd)
+        self.arraySize = arraySize
+
+    def submit(self, scriptPath, jobscripts):
+        writeArrayScript(scriptPath, jobscripts)
+        cmd = '{} {} "{}"'.format(self.submitCmd, len(jobscripts), scriptPath)
+        return submitScript(cmd, jobscripts)
+
+
+class FakeClusterExecutor(Executor):
+    '''A simulated cluster that runs submissions on this machine.
+
+    Each submission (or each task of an array submission) waits in a
+    queue for a random time, exponentially distributed around `latency`
+    seconds, then runs in one of `slots` slots. With probability
+    `failureRate` a task is lost instead, as if its node failed, and
+    its jobs are marked failed.
+
+    Counts of submissions, tasks and lost tasks are kept in `counts`.
+    '''
+
+    name = 'fake'
+    spools = True
+
+    def __init__(self, latency=1.0, failureRate=0.0, slots=4, seed=None, arraySize=None):
+        self.latency = latency
+        self.failureRate = failureRate
+        self.slots = slots
+        self.arraySize = arraySize
+        self.rng = random.Random(seed)
+        self.queue = []
+        self.condition = Condition()
+        self.pool = None
+        self.scheduler = None
+        self.stopping = False
+        self.counts = {'submissions': 0, 'tasks': 0, 'lost': 0, 'run': 0}
+
+    def submit(self, scriptPath, jobscripts):
+        if self.arraySize:
+            writeArrayScript(scriptPath, jobscripts)
+            tasks = [(index, [jobscript]) for index, jobscript in enumerate(jobscripts, 1)]
+        else:
+            writeBundleScript(scriptPath, jobscripts)
+            tasks = [(None, jobscripts)]
+        with self.condition:
+            self.counts['submissions'] += 1
+            jobId = 'fake-{}'.format(self.counts['submissions'])
+            for index, taskJobs in tasks:
+                delay = self.rng.expovariate(1.0 / self.latency) if self.latency else 0
+                self.counts['tasks'] += 1
+                heapq.heappush(self.queue, (time() + delay, self.counts['tasks'],
+                                            scriptPath, index, taskJobs))
+            self.condition.notify()
+        return jobId
+
+    def start(self):
+        self.pool = ThreadPoolExecutor(max_workers=self.slots)
+        self.scheduler = Thread(target=self._schedule, daemon=True)
+        self.scheduler.start()
+        return self
+
+    def stop(self):
+        '''Drop queued tasks and wait for running ones.'''
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.scheduler:
+            self.scheduler.join()
+        if self.pool:
+            self.pool.shutdown(wait=True)
+
+    def _schedule(self):
+        while True:
+            with self.condition:
+                while not self.stopping and \
+                        (not self.queue or self.queue[0][0] > time()):
+                    timeout = self.queue[0][0] - time() if self.queue else None
+                    self.condition.wait(timeout)
+                if self.stopping:
+                    return
+                _, _, scriptPath, index, taskJobs = heapq.heappop(self.queue)
+                lost = self.rng.random() < self.failureRate
+                if lost:
+                    self.counts['lost'] += 1
+            if lost:
+                for jobscript in taskJobs:
+                    markJobFailed(jobscript)
+            else:
+                self.pool.submit(self._runTask, scriptPath, index)
+
+    def _runTask(self, scriptPath, index):
+        env = dict(os.environ)
+        logPath = scriptPath + '.log'
+        if index is not None:
+            env[ARRAY_TASK_VAR] = str(index)
+            logPath = '{}.{}.log'.format(scriptPath, index)
+        with open(logPath, 'w') as log:
+            sp.call(['sh', scriptPath], env=env, stdout=log, stderr=sp.STDOUT)
+        with self.condition:
+            self.counts['run'] += 1
+
+
+EXECUTORS = ['local', 'cluster', 'array', 'fake']
@@ -0,0 +1,99 @@
+import os
+import os.path
+import shutil
+from hashlib import sha1
+from subprocess import call, check_call
+
+
+def mirrorName(uri):
+    '''Return a directory name for the mirror of `uri`.'''
+    uri = uri.rstrip('/')
+    hname = uri.split('/')[-1].split('.')[0]
+    key = sha1(uri.encode('utf-8')).hexdigest()[:12]
+    return '{}_{}'.format(hname, key)
+
+
+def updateGitMirror(uri, mirrorDir):
+    '''Create or update a bare mirror of the git repo at `uri`.
+
+    Return the path to the mirror. If the mirror exists but cannot be
+    updated (e.g. offline) the cached copy is used as is. Raises
+    `CalledProcessError` if there is no mirror yet and cloning fails.
+    '''
+    os.makedirs(mirrorDir, exist_ok=True)
+    mirror = os.path.join(mirrorDir, mirrorName(uri) + '.git')
+    if os.path.isdir(mirror):
+        if call(['git', '--git-dir', mirror, 'fetch', '--prune', '--quiet']) != 0:
+            print('Could not update mirror of {}, using cached copy.'.format(uri))
+    else:
+        check_call(['git', 'clone', '--mirror', '--quiet', uri, mirror])
+    return mirror
+
+
+def cloneFromMirror(mirror, uri, dest):
+    '''Check out `mirror` into `dest` with `uri` as its origin.
+
+    Clones from a local path hardlink git objects instead of copying.
+    Raises `CalledProcessError` if the clone fails.
+    '''
+    check_call(['git', 'clone', '--quiet', mirror, dest])
+    call(['git', '-C', dest, 'remote', 'set-url', 'origin', uri])
+    return dest
+
+
+def _sameFile(srcStat, destPath):
+    try:
+        destStat = os.stat(destPath)
+    except FileNotFoundError:
+        return False
+    return (srcStat.st_size == destStat.st_size and
+            srcStat.st_mtime_ns == destStat.st_mtime_ns)
+
+
+def syncTree(src, dest):
+    '''Make `dest` a copy of `src`, copying only files that changed.
+
+    Files are compared by size and mtime. Changed files are written to
+    a temp file and renamed into place so that hardlinks to the old
+    version (e.g. in an installed pipeline) are left untouched.
+    Files and directories not in `src` are removed from `dest`.
+
+    Return the number of files copied.
+    '''
+    nCopied = 0
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+        relDir = os.path.relpath(dirpath, src)
+        destDir = os.path.normpath(os.path.join(dest, relDir))
+        os.makedirs(destDir, exist_ok=True)
+        seen.add(destDir)
+        for fname in filenames:
+            srcPath = os.path.join(dirpath, fname)
+            destPath = os.path.join(destDir, fname)
+            seen.add(destPath)
+            if _sameFile(os.stat(srcPath), destPath):
+                continue
+            tmpPath = destPath + '.mu_sync_tmp'
+            shutil.copy2(srcPath, tmpPath)
+            os.replace(tmpPath, destPath)
+            nCopied += 1
+
+    for dirpath, dirnames, filenames in os.walk(dest, topdown=False):
+        for fname in filenames:
+            path = os.path.join(dirpath, fname)
+            if path not in seen:
+                os.remove(path)
+        if os.path.normpath(dirpath) not in seen:
+            os.rmdir(dirpath)
+    return nCopied
+
+
+def linkTree(src, dest):
+    '''Copy the tree at `src` to `dest` using hardlinks where possible.'''
+    def linkOrCopy(srcPath, destPath):
+        try:
+            os.link(srcPath, destPath)
+        except OSError:
+            shutil.copy2(srcPath, destPath)
+    shutil.copytree(src, dest, copy_function=linkOrCopy)
+    return dest
@@ -1,3 +1,5 @@
+import os
+from math import ceil
 
 
 def resolveCmd(cmd):
@@ -8,9 +10,32 @@ def fromPipelineDir(path):
     pass
 
 
-def threadsToRAM(threads):
-    pass
+def machineCores():
+    '''Return the number of cores of this machine.'''
+    return os.cpu_count() or 1
 
 
-def ramToThreads(threads):
-    pass
+def machineMemMB():
+    '''Return the physical memory of this machine in megabytes.'''
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+
+def threadsToRAM(threads, cores=None, memMB=None):
+    '''Return the megabytes of memory that go with `threads` cores.
+
+    Memory is shared evenly between cores, of this machine unless
+    `cores` and `memMB` are given.
+    '''
+    cores = cores or machineCores()
+    memMB = memMB or machineMemMB()
+    return int(threads * memMB / cores)
+
+
+def ramToThreads(ramMB, cores=None, memMB=None):
+    '''Return the number of cores, at least one, that go with `ramMB` megabytes.
+
+    See `threadsToRAM`.
+    '''
+    cores = cores or machineCores()
+    memMB = memMB or machineMemMB()
+    return max(1, int(ceil(ramMB * cores / memMB)))
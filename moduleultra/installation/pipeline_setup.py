@@ -1,12 +1,19 @@
+import sys
 import shutil
-from subprocess import call
+from time import time
+from concurrent.futures import ThreadPoolExecutor
 import os.path
 from os import symlink
 from yaml import load as yload
 from moduleultra.utils import *
-from moduleultra.errors import PipelineAlreadyInstalledError
-import packagemega as pm
-from gimme_input import BoolUserInput
+from moduleultra.errors import PipelineAlreadyInstalledError, RecipeBuildError
+from .mirror import (
+    mirrorName,
+    updateGitMirror,
+    cloneFromMirror,
+    syncTree,
+    linkTree,
+)
 
 
 class PipelineInstaller:
@@ -16,10 +23,28 @@ class PipelineInstaller:
 
     stagingDir = 'staging'
 
-    def __init__(self, muConfig, uri, dev=False):
+    def __init__(self, muConfig, uri, dev=False, recipeJobs=1, skipInstalled=None):
+        '''Set up an installer.
+
+        Args:
+            muConfig (ModuleUltraConfig): Config to install into.
+            uri (str): Local path or git url of the pipeline.
+            dev (:obj:`bool`, optional): Symlink local pipelines instead of
+                copying them.
+            recipeJobs (:obj:`int`, optional): Number of PackageMega recipes
+                to build at once. Defaults to one. Builds share the
+                PackageMega repo which is not known to be thread safe, so
+                only use more than one for recipes that do not write the
+                same files.
+            skipInstalled (:obj:`bool`, optional): If True skip recipes that
+                are already installed, if False rebuild them. If None (the
+                default) ask the user.
+        '''
         self.uri = uri
         self.muConfig = muConfig
         self.dev = dev
+        self.recipeJobs = max(1, recipeJobs)
+        self.skipInstalled = skipInstalled
 
     def install(self):
         staged = self.stagePipeline()
@@ -37,6 +62,12 @@ class PipelineInstaller:
             return self.stageFromGithub()
 
     def stageFromLocal(self):
+        '''Stage a pipeline from a local directory.
+
+        In dev mode the directory is symlinked. Otherwise it is synced
+        into a mirror in the config (copying only files that changed)
+        and staged from the mirror with hardlinks.
+        '''
         dest = self.muConfig.getInstalledPipelinesDir()
         dest = os.path.join(dest, PipelineInstaller.stagingDir)
         uri = os.path.abspath(self.uri)
@@ -47,18 +78,26 @@ class PipelineInstaller:
         if self.dev:
             symlink(self.uri, dest)
         else:
-            shutil.copytree(self.uri, dest)
+            mirror = os.path.join(self.muConfig.getMirrorDir(), mirrorName(uri))
+            syncTree(uri, mirror)
+            linkTree(mirror, dest)
         return os.path.join(dest)
 
     def stageFromGithub(self):
+        '''Stage a pipeline from a git repo.
+
+        The repo is cloned once into a bare mirror in the config. Later
+        installs fetch into the mirror (or use it as is when offline)
+        and clone locally from it.
+        '''
         if self.dev:
             assert False and 'Dev mode can only be applied to local pipelines'
         dest = self.muConfig.getInstalledPipelinesDir()
         dest = os.path.join(dest, PipelineInstaller.stagingDir)
         hname = self.uri.split('/')[-1].split('.')[0]
         dest = os.path.join(dest, hname)
-        cmd = 'git clone {} {}'.format(self.uri, dest)
-        call(cmd, shell=True)
+        mirror = updateGitMirror(self.uri, self.muConfig.getMirrorDir())
+        cloneFromMirror(mirror, self.uri, dest)
         return os.path.join(dest)
 
     def provisionallyLoadPipeline(self, staged):
@@ -88,25 +127,85 @@ class PipelineInstaller:
     def addPipelineToManifest(self, pipeDef):
         pipeName = pipeDef['NAME']
         pipeVersion = pipeDef['VERSION']
-        if pipeName in self.muConfig.installedPipes:
-            if pipeVersion in self.muConfig.installedPipes[pipeName]:
-                raise PipelineAlreadyInstalledError()
-            self.muConfig.installedPipes[pipeName] += [pipeVersion]
-        else:
-            self.muConfig.installedPipes[pipeName] = [pipeVersion]
+        with self.muConfig.store.transaction():
+            if pipeName in self.muConfig.installedPipes:
+                if pipeVersion in self.muConfig.installedPipes[pipeName]:
+                    raise PipelineAlreadyInstalledError()
+                self.muConfig.installedPipes[pipeName] += [pipeVersion]
+            else:
+                self.muConfig.installedPipes[pipeName] = [pipeVersion]
 
     def runPipelineRecipes(self, pipeDef, pipeDir):
+        import packagemega as pm
+        from gimme_input import BoolUserInput
+
         try:
             recipeDir = pipeDef['PACKAGE_MEGA']['RECIPE_DIR']
         except KeyError:
             return
         recipeDir = os.path.join(pipeDir, recipeDir)
         pmRepo = pm.Repo.loadRepo()
-        recipes = pmRepo.addFromLocal(recipeDir, dev=self.dev)
         installedRecipes = pmRepo.allRecipes()
+        recipes = pmRepo.addFromLocal(recipeDir, dev=self.dev)
         nInstall = len([recipe for recipe in recipes if recipe in installedRecipes])
-        inp = BoolUserInput('Skip {} recipes that are already installed?'.format(nInstall), True)
-        doskip = (nInstall > 0) and inp.resolve()
-        for recipe in recipes:
-            if (not doskip) or (recipe not in installedRecipes):
+        doskip = self.skipInstalled
+        if nInstall == 0:
+            doskip = False
+        elif doskip is None:
+            inp = BoolUserInput('Skip {} recipes that are already installed?'.format(nInstall), True)
+            doskip = inp.resolve()
+
+        report, toBuild = planRecipes(recipes, installedRecipes, doskip)
+        report += self.buildRecipes(pmRepo, toBuild)
+        self.printRecipeReport(report)
+        checkRecipeReport(report)
+
+    def buildRecipes(self, pmRepo, recipes):
+        '''Build `recipes` concurrently, return a list of build reports.
+
+        Each report is a tuple of (recipe, status, seconds, error).
+        One recipe failing does not stop the others, see
+        `checkRecipeReport` to fail the install afterwards.
+        '''
+        def build(recipe):
+            start = time()
+            try:
                 pmRepo.makeRecipe(recipe)
+                return recipe, 'built', time() - start, None
+            except Exception as exc:
+                return recipe, 'failed', time() - start, exc
+
+        with ThreadPoolExecutor(max_workers=self.recipeJobs) as executor:
+            return list(executor.map(build, recipes))
+
+    def printRecipeReport(self, report):
+        '''Print the status and build time of each recipe.'''
+        if not report:
+            return
+        print('PackageMega recipes:', file=sys.stderr)
+        for recipe, status, seconds, error in report:
+            line = '    {}\t{}\t{:.1f}s'.format(recipe, status, seconds)
+            if error is not None:
+                line += '\t{}'.format(error)
+            print(line, file=sys.stderr)
+
+
+def planRecipes(recipes, installedRecipes, skipInstalled):
+    '''Return reports of skipped recipes and a list of recipes to build.
+
+    Installed recipes are skipped if `skipInstalled` is True.
+    '''
+    report, toBuild = [], []
+    for recipe in recipes:
+        if skipInstalled and (recipe in installedRecipes):
+            report.append((recipe, 'skipped', 0, None))
+        else:
+            toBuild.append(recipe)
+    return report, toBuild
+
+
+def checkRecipeReport(report):
+    '''Raise a `RecipeBuildError` if any recipe in a report failed.'''
+    failed = [recipe for recipe, status, _, _ in report if status == 'failed']
+    if failed:
+        raise RecipeBuildError('Failed to build recipes: {}'.format(', '.join(failed)))
@@ -0,0 +1,262 @@
+'''Bundle many small cluster jobs into a few scheduler submissions.
+
+Snakemake submits every job on its own by calling the cluster command
+with the path of a jobscript. When bundling, the cluster command given
+to snakemake is this file run as a script: it only copies the jobscript
+into a spool directory. A `JobBundler` thread in the main ModuleUltra
+process collects spooled jobscripts, groups them and submits each group
+as a single script through the real cluster submit script.
+
+How a bundle is submitted is up to the executor of the run (see
+`moduleultra.executors`), by default the bundle is one script handed to
+the cluster submit script.
+
+Each jobscript still touches its own finished/failed marker so snakemake
+tracks the jobs of a bundle individually. If a cluster status script is
+used, status queries for a job are answered from its markers and from
+the status of the bundle it was submitted in.
+
+This file is run by snakemake for every job so it may only import
+from the standard library.
+'''
+
+import os
+import os.path
+import sys
+import json
+import re
+import shutil
+import subprocess as sp
+from uuid import uuid4
+from time import time
+from threading import Thread, Event
+
+
+INCOMING_DIR = 'incoming'
+JOB_DIR = 'jobs'
+BUNDLE_DIR = 'bundles'
+ID_DIR = 'ids'
+STATUS_CMD_FILE = 'status_cmd'
+PROPERTIES_PREFIX = '# properties = '
+FINISHED_MARKER = re.compile(r'&& touch "([^"]+)" \|\|')
+FAILED_MARKER = re.compile(r'\(touch "([^"]+)"; exit 1\)')
+
+
+def spoolJobscript(spoolDir, jobscript):
+    '''Copy `jobscript` into the spool and return a placeholder job id.'''
+    jobId = 'mubundle-{}'.format(uuid4().hex)
+    incoming = os.path.join(spoolDir, INCOMING_DIR)
+    tmpPath = os.path.join(spoolDir, jobId + '.tmp')
+    shutil.copyfile(jobscript, tmpPath)
+    os.rename(tmpPath, os.path.join(incoming, jobId + '.sh'))
+    return jobId
+
+
+def readJobProperties(jobscript):
+    '''Return the job properties snakemake writes into a jobscript.'''
+    with open(jobscript) as js:
+        for line in js:
+            if line.startswith(PROPERTIES_PREFIX):
+                return json.loads(line[len(PROPERTIES_PREFIX):])
+    return {}
+
+
+def markJobFailed(jobscript):
+    '''Touch the failed marker of a jobscript so snakemake stops waiting.'''
+    with open(jobscript) as js:
+        match = FAILED_MARKER.search(js.read())
+    if match:
+        open(match.group(1), 'a').close()
+
+
+def writeBundleScript(path, jobscripts):
+    '''Write a script that runs `jobscripts` one after the other.'''
+    with open(path, 'w') as bundle:
+        bundle.write('#!/bin/sh\n')
+        for jobscript in jobscripts:
+            bundle.write('sh "{}"\n'.format(jobscript))
+
+
+def submitScript(cmd, jobscripts):
+    '''Run a submit command and return the job id it prints.
+
+    If the command fails the jobs are marked failed and '' is returned.
+    '''
+    try:
+        out = sp.check_output(cmd, shell=True).decode('utf-8')
+    except sp.CalledProcessError:
+        print('[ModuleUltra] Failed to submit: {}'.format(cmd), file=sys.stderr)
+        for jobscript in jobscripts:
+            markJobFailed(jobscript)
+        return ''
+    return out.split('\n')[0].strip()
+
+
+def jobStatus(spoolDir, jobId):
+    '''Return 'success', 'failed' or 'running' for a spooled job.'''
+    jobscript = os.path.join(spoolDir, JOB_DIR, jobId + '.sh')
+    if not os.path.isfile(jobscript):
+        return 'running'  # not picked up by the bundler yet
+    with open(jobscript) as js:
+        jobscriptStr = js.read()
+    for status, marker in [('success', FINISHED_MARKER), ('failed', FAILED_MARKER)]:
+        match = marker.search(jobscriptStr)
+        if match and os.path.exists(match.group(1)):
+            return status
+
+    try:
+        with open(os.path.join(spoolDir, ID_DIR, jobId)) as idFile:
+            externalId = idFile.read().strip()
+        with open(os.path.join(spoolDir, STATUS_CMD_FILE)) as cmdFile:
+            statusCmd = cmdFile.read().strip()
+    except FileNotFoundError:
+        return 'running'  # bundle not submitted yet
+    try:
+        cmd = '{} {}'.format(statusCmd, externalId)
+        bundleStatus = sp.check_output(cmd, shell=True).decode('utf-8')
+        bundleStatus = bundleStatus.split('\n')[0].strip()
+    except sp.CalledProcessError:
+        return 'running'
+    if bundleStatus == 'running':
+        return 'running'
+    # the bundle is over but this job never touched a marker
+    return 'failed'
+
+
+class JobBundler(Thread):
+    '''Collect spooled jobscripts and submit them in bundles.
+
+    Jobs are keyed by rule (`groupBy='rule'`) or by the sample or group
+    they belong to (`groupBy='sample'`). A bundle is submitted once it
+    reaches the group size of its rules or once its oldest job has waited
+    `maxWait` seconds. Jobs of rules without a group size are submitted
+    on their own as soon as they are spooled, unless `defaultSize` is
+    more than one.
+
+    If an `executor` is given bundles are submitted through its `submit`
+    method instead of through `submitCmd`.
+    '''
+
+    def __init__(self, spoolDir, submitCmd, groupSizes,
+                 groupBy='rule', maxWait=30, pollInterval=1, statusCmd=None,
+                 executor=None, defaultSize=1):
+        super(JobBundler, self).__init__(daemon=True)
+        self.spoolDir = spoolDir
+        self.submitCmd = submitCmd
+        self.groupSizes = groupSizes
+        self.groupBy = groupBy
+        self.maxWait = maxWait
+        self.pollInterval = pollInterval
+        self.pending = {}
+        self.externalIds = {}
+        self.nBundles = 0
+        self.stopEvent = Event()
+        self.statusCmd = statusCmd
+        self.executor = executor
+        self.defaultSize = defaultSize
+
+        for dirName in [INCOMING_DIR, JOB_DIR, BUNDLE_DIR, ID_DIR]:
+            os.makedirs(os.path.join(self.spoolDir, dirName), exist_ok=True)
+        if self.statusCmd:
+            with open(os.path.join(self.spoolDir, STATUS_CMD_FILE), 'w') as cmdFile:
+                cmdFile.write(self.statusCmd)
+
+    def spoolCommand(self):
+        '''Return the cluster command snakemake should call.'''
+        return '{} {} spool {}'.format(sys.executable,
+                                       os.path.abspath(__file__),
+                                       self.spoolDir)
+
+    def statusCommand(self):
+        '''Return the cluster status command snakemake should call or None.'''
+        if not self.statusCmd:
+            return None
+        return '{} {} status {}'.format(sys.executable,
+                                        os.path.abspath(__file__),
+                                        self.spoolDir)
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            self.poll()
+            self.stopEvent.wait(self.pollInterval)
+
+    def stop(self, cleanup=True):
+        '''Submit anything still pending and stop polling.'''
+        self.stopEvent.set()
+        self.join()
+        self.poll(flushAll=True)
+        if cleanup:
+            shutil.rmtree(self.spoolDir, ignore_errors=True)
+
+    def poll(self, flushAll=False):
+        '''Pick up newly spooled jobs and submit any bundles that are due.'''
+        incoming = os.path.join(self.spoolDir, INCOMING_DIR)
+        for fname in sorted(os.listdir(incoming)):
+            if not fname.endswith('.sh'):
+                continue
+            jobscript = os.path.join(self.spoolDir, JOB_DIR, fname)
+            os.rename(os.path.join(incoming, fname), jobscript)
+            properties = readJobProperties(jobscript)
+            rule = properties.get('rule', '')
+            jobId = fname[:-len('.sh')]
+            size = self.groupSizes.get(rule, self.defaultSize)
+            if size <= 1:
+                self.submit([(jobId, jobscript)])
+                continue
+            key = self._bundleKey(rule, properties.get('wildcards', {}))
+            bundle = self.pending.setdefault(key, {'started': time(),
+                                                   'size': None,
+                                                   'jobs': []})
+            bundle['size'] = size if bundle['size'] is None else min(size, bundle['size'])
+            bundle['jobs'].append((jobId, jobscript))
+            if len(bundle['jobs']) >= bundle['size']:
+                del self.pending[key]
+                self.submit(bundle['jobs'])
+
+        now = time()
+        for key, bundle in list(self.pending.items()):
+            due = flushAll or len(bundle['jobs']) >= bundle['size']
+            due = due or (now - bundle['started']) >= self.maxWait
+            if due:
+                del self.pending[key]
+                self.submit(bundle['jobs'])
+
+    def _bundleKey(self, rule, wildcards):
+        if self.groupBy == 'sample':
+            for wildcard in ['sample_name', 'group_name']:
+                if wildcard in wildcards:
+                    return wildcards[wildcard]
+        return rule
+
+    def submit(self, jobs):
+        '''Submit a list of (job id, jobscript) as one cluster job.'''
+        self.nBundles += 1
+        bundlePath = os.path.join(self.spoolDir, BUNDLE_DIR,
+                                  'bundle_{}.sh'.format(self.nBundles))
+        jobscripts = [jobscript for _, jobscript in jobs]
+        if self.executor:
+            externalId = self.executor.submit(bundlePath, jobscripts)
+        else:
+            writeBundleScript(bundlePath, jobscripts)
+            externalId = submitScript('{} "{}"'.format(self.submitCmd, bundlePath),
+                                      jobscripts)
+        for jobId, _ in jobs:
+            self.externalIds[jobId] = externalId
+            if externalId:
+                with open(os.path.join(self.spoolDir, ID_DIR, jobId), 'w') as idFile:
+                    idFile.write(externalId)
+
+
+def main(args):
+    command, spoolDir = args[0], args[1]
+    if command == 'spool':
+        print(spoolJobscript(spoolDir, args[2]))
+    elif command == 'status':
+        print(jobStatus(spoolDir, args[2]))
+    else:
+        print('Unknown command: {}'.format(command), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
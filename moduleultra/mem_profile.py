@@ -0,0 +1,169 @@
+'''Record the memory used by each stage of a run.
+
+For each stage the profiler records the peak RSS of the process so
+far, the current RSS, the peak and net memory traced by tracemalloc
+during the stage and the lines that allocated the most during the
+stage. Reports are small JSON files, see `ModuleUltraRepo.getRunLogDir`.
+'''
+
+import os
+import sys
+import json
+import resource
+import tracemalloc
+from time import time
+from contextlib import contextmanager
+
+
+def peakRSS():
+    '''Return the peak resident set size of this process in bytes.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak  # already in bytes
+    return peak * 1024
+
+
+def currentRSS():
+    '''Return the resident set size of this process in bytes, or None.'''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemProfiler:
+    '''Profile memory by stage. Does nothing unless `enabled`.
+
+    If `path` is given the report is written there after each stage.
+    `meta` is added to the report as is.
+
+    Args:
+        path (:obj:`str`, optional): Where to write the report.
+        enabled (:obj:`bool`, optional): Defaults to True.
+        topN (:obj:`int`, optional): Number of allocation sites to keep
+            for each stage. Defaults to 10.
+        frames (:obj:`int`, optional): Frames of traceback tracemalloc
+            keeps per allocation. Defaults to 1, more is much slower.
+    '''
+
+    def __init__(self, path=None, enabled=True, topN=10, frames=1, **meta):
+        self.path = path
+        self.meta = meta
+        self.enabled = enabled
+        self.topN = topN
+        self.frames = frames
+        self.stages = []
+        self.started = time()
+        self._startedTracing = False
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._startedTracing = True
+        return self
+
+    def stop(self):
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    @contextmanager
+    def stage(self, name):
+        '''Record the memory used by the code in the block.'''
+        if not self.enabled:
+            yield
+            return
+        self.start()
+        before = self._snapshot()
+        startTraced, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start = time()
+        try:
+            yield
+        except BaseException:
+            self._record(name, start, startTraced, before)
+            self.stop()
+            raise
+        self._record(name, start, startTraced, before)
+
+    def _record(self, name, start, startTraced, before):
+        seconds = time() - start
+        traced, tracedPeak = tracemalloc.get_traced_memory()
+        after = self._snapshot()
+        self.stages.append({
+            'stage': name,
+            'seconds': round(seconds, 3),
+            'peak_rss': peakRSS(),
+            'rss': currentRSS(),
+            'traced_peak': tracedPeak,
+            'traced_net': traced - startTraced,
+            'top_sites': self._topSites(before, after),
+        })
+        if self.path:
+            self.write(self.path)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ])
+
+    def _topSites(self, before, after):
+        stats = after.compare_to(before, 'lineno')
+        stats = [stat for stat in stats if stat.size_diff > 0]
+        stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+        out = []
+        for stat in stats[:self.topN]:
+            frame = stat.traceback[0]
+            out.append({
+                'site': '{}:{}'.format(frame.filename, frame.lineno),
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+            })
+        return out
+
+    def report(self):
+        '''Return the report as a dict.'''
+        report = dict(self.meta)
+        report['started'] = self.started
+        report['peak_rss'] = peakRSS()
+        report['stages'] = self.stages
+        return report
+
+    def write(self, path):
+        '''Write the report to `path` as compact JSON. Return the report.'''
+        report = self.report()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'w') as reportFile:
+            json.dump(report, reportFile, separators=(',', ':'))
+        os.replace(tmpPath, path)
+        return report
+
+    def finish(self, logger=None):
+        '''Stop tracing and log a summary of the report, if enabled.'''
+        if not self.enabled:
+            return
+        self.stop()
+        if logger:
+            logger(summarize(self.report()))
+            if self.path:
+                logger('Memory report written to {}'.format(self.path))
+
+
+def summarize(report):
+    '''Return a short human readable summary of a report.'''
+    lines = []
+    for stage in report['stages']:
+        line = '{:<20} peak RSS {:>8.1f} MB  traced peak {:>8.1f} MB  {:.1f}s'.format(
+            stage['stage'], stage['peak_rss'] / 2 ** 20,
+            stage['traced_peak'] / 2 ** 20, stage['seconds'])
+        lines.append(line)
+        if stage['top_sites']:
+            top = stage['top_sites'][0]
+            lines.append('    top site {} +{:.1f} MB'.format(top['site'], top['size_diff'] / 2 ** 20))
+    return '\n'.join(lines)
@@ -1,11 +1,13 @@
-from yaml_backed_structs import PersistentDict
 import os.path
 import os
-from yaml import load as yload
 from .errors import *
-from .installation import *
 from shutil import rmtree
-from .utils import findFileInDirRecursively
+from .state_store import StateStore
+from .utils import (
+    findFileInDirRecursively,
+    getHighestVersion,
+    joinPipelineNameVersion,
+)
 
 
 class ModuleUltraConfig:
@@ -17,22 +19,33 @@ class ModuleUltraConfig:
 
 
     Typically this directory is in $HOME/.module_ultra_config
+
+    Config variables and the list of installed pipelines are kept in
+    a SQLite state store in the config directory. Older configs kept
+    them in YAML files, these are migrated when first loaded.
     '''
     configDirName = '.module_ultra_config'
     pipelineDirName = 'installed_pipelines'
     stagingDirName = 'staging'
+    mirrorDirName = 'mirrors'
     pipelineSetName = 'installed_pipelines.yml'
     configVarsRoot = 'config_variables.yml'
+    stateDbName = 'state.sqlite'
 
-    def __init__(self, abspath):
+    def __init__(self, abspath, readOnly=False):
         self.abspath = abspath
 
+        readOnly = readOnly or not os.path.isdir(self.abspath)
+        dbPath = os.path.join(self.abspath, ModuleUltraConfig.stateDbName)
+        self.store = StateStore(dbPath, readOnly=readOnly)
+
         varPath = os.path.join(self.abspath, ModuleUltraConfig.configVarsRoot)
-        self.configVars = PersistentDict(varPath)
+        self.configVars = self.store.table('config_variables', yamlPath=varPath)
 
         pipePath = os.path.join(self.abspath,
                                 ModuleUltraConfig.pipelineSetName)
-        self.installedPipes = PersistentDict(pipePath)
+        self.installedPipes = self.store.table('installed_pipelines',
+                                               yamlPath=pipePath)
 
     def listInstalledPipelines(self):
         return {k: v for k, v in self.installedPipes.items()}
@@ -51,6 +64,8 @@ class ModuleUltraConfig:
             pipeDef = os.path.join(pipeDefRoot, 'pipeline_definition.' + ext)
             if os.path.isfile(pipeDef):
                 break
+        from yaml import load as yload
+
         pipeDef = open(pipeDef).read()
         pipeDef = yload(pipeDef)
         return pipeDef
@@ -67,13 +82,122 @@ class ModuleUltraConfig:
         except KeyError:
             return None
 
+    def setClusterArraySubmitScript(self, script):
+        '''Set the abspath for the cluster array submit script.
+
+        The script is called with a number of tasks and the path of an
+        array script and must print a job id, see `ArrayJobExecutor`.
+        '''
+        self.configVars['CLUSTER_ARRAY_SUBMIT_SCRIPT'] = os.path.abspath(script)
+
+    def clusterArraySubmitScript(self):
+        '''Return the abspath to the cluster array submit script or None.'''
+        try:
+            return self.configVars['CLUSTER_ARRAY_SUBMIT_SCRIPT']
+        except KeyError:
+            return None
+
+    def setClusterStatusScript(self, script):
+        '''Set the abspath for the cluster_status_script.
+
+        The status script is called with a job id printed by the submit
+        script and must print one of 'success', 'failed' or 'running'.
+        '''
+        self.configVars['CLUSTER_STATUS_SCRIPT'] = os.path.abspath(script)
+
+    def clusterStatusScript(self):
+        '''Return the abspath to the cluster status script or None.'''
+        try:
+            return self.configVars['CLUSTER_STATUS_SCRIPT']
+        except KeyError:
+            return None
+
+    def setLatencyWait(self, seconds):
+        '''Set the max seconds to wait for output files of finished jobs.'''
+        self.configVars['LATENCY_WAIT'] = int(seconds)
+
+    def latencyWait(self):
+        '''Return the max seconds to wait for output files or None.'''
+        try:
+            return self.configVars['LATENCY_WAIT']
+        except KeyError:
+            return None
+
+    def setOriginStaging(self, stageDir, jobs=None, budgetGB=None):
+        '''Set where and how origin files are staged for local runs.
+
+        Origins are staged under `stageDir`, at most `jobs` files at a
+        time and up to `budgetGB` gigabytes at once.
+        '''
+        self.configVars['ORIGIN_STAGE_DIR'] = os.path.abspath(stageDir)
+        if jobs is not None:
+            self.configVars['ORIGIN_STAGE_JOBS'] = int(jobs)
+        if budgetGB is not None:
+            self.configVars['ORIGIN_STAGE_BUDGET_GB'] = float(budgetGB)
+
+    def originStaging(self):
+        '''Return a dict of origin staging settings or None.'''
+        try:
+            stageDir = self.configVars['ORIGIN_STAGE_DIR']
+        except KeyError:
+            return None
+        return {
+            'dir': stageDir,
+            'jobs': self.configVars.get('ORIGIN_STAGE_JOBS', 2),
+            'budget_gb': self.configVars.get('ORIGIN_STAGE_BUDGET_GB', None),
+        }
+
+    def setScratch(self, scratchDir, budgetGB=None):
+        '''Set the root of job scratch dirs and its disk budget.'''
+        self.configVars['SCRATCH_DIR'] = os.path.abspath(scratchDir)
+        if budgetGB is not None:
+            self.configVars['SCRATCH_BUDGET_GB'] = float(budgetGB)
+
+    def scratch(self):
+        '''Return a dict with the scratch dir and budget, either may be None.'''
+        return {
+            'dir': self.configVars.get('SCRATCH_DIR', None),
+            'budget_gb': self.configVars.get('SCRATCH_BUDGET_GB', None),
+        }
+
+    def setResultCache(self, cacheDir, maxGB=None, link=None):
+        '''Set the dir of the result cache shared by repos, its size and link mode.'''
+        self.configVars['RESULT_CACHE_DIR'] = os.path.abspath(cacheDir)
+        if maxGB is not None:
+            self.configVars['RESULT_CACHE_MAX_GB'] = float(maxGB)
+        if link is not None:
+            self.configVars['RESULT_CACHE_LINK'] = link
+
+    def resultCache(self):
+        '''Return a dict of result cache settings or None.'''
+        try:
+            cacheDir = self.configVars['RESULT_CACHE_DIR']
+        except KeyError:
+            return None
+        return {
+            'dir': cacheDir,
+            'max_gb': self.configVars.get('RESULT_CACHE_MAX_GB', None),
+            'link': self.configVars.get('RESULT_CACHE_LINK', 'hardlink'),
+        }
+
     def getInstalledPipelinesDir(self):
         '''Return the abspath to the directory with installed pipelines.'''
         return os.path.join(self.abspath, ModuleUltraConfig.pipelineDirName)
 
-    def installPipeline(self, uri, dev=False):
-        '''Install a new pipeline.'''
-        installer = PipelineInstaller(self, uri, dev=dev)
+    def getMirrorDir(self):
+        '''Return the abspath to the directory with cached pipeline sources.'''
+        return os.path.join(self.abspath, ModuleUltraConfig.mirrorDirName)
+
+    def installPipeline(self, uri, dev=False, recipeJobs=1, skipInstalled=None):
+        '''Install a new pipeline.
+
+        See `PipelineInstaller` for arguments.
+        '''
+        from .installation import PipelineInstaller
+
+        installer = PipelineInstaller(self, uri, dev=dev,
+                                      recipeJobs=recipeJobs,
+                                      skipInstalled=skipInstalled)
         installer.install()
 
     def uninstallPipeline(self, pipeName, version=None):
@@ -166,9 +290,9 @@ class ModuleUltraConfig:
         return os.path.abspath(configRoot)
 
     @classmethod
-    def load(ctype):
+    def load(ctype, readOnly=False):
         '''Return the ModuleUltraConfig.'''
-        return ModuleUltraConfig(ctype.getConfigDir())
+        return ModuleUltraConfig(ctype.getConfigDir(), readOnly=readOnly)
 
     @classmethod
     def initConfig(ctype, dest=None):
@@ -182,5 +306,8 @@ class ModuleUltraConfig:
             stagingDir = os.path.join(pipeDir, ctype.stagingDirName)
             os.mkdir(stagingDir)
 
+            mirrorDir = os.path.join(ctype.getConfigDir(), ctype.mirrorDirName)
+            os.mkdir(mirrorDir)
+
         except FileExistsError:
             raise ModuleUltraConfigAlreadyExists()
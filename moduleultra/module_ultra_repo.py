@@ -1,28 +1,50 @@
-from yaml_backed_structs import PersistentDict
 from .utils import *
 from .errors import *
 import os.path
-import datasuper as ds
 from .module_ultra_config import ModuleUltraConfig
-from .pipeline_instance import PipelineInstance
+from .origin_manifest import OriginManifest
+from .run_lock import RunLock
+from .scratch import ScratchManager
+from .state_store import StateStore
+from .virtual_dirs import buildLinkFarm, groupLinks, sampleLinks
 
 
 class ModuleUltraRepo:
-    '''Represents a directory where moduleultra pipelines are run.'''
+    '''Represents a directory where moduleultra pipelines are run.
+
+    The pipelines in a repo are kept in a SQLite state store in the repo
+    directory. Older repos kept them in a YAML file, which is migrated
+    when the repo is first loaded. Open a repo with `readOnly=True` when
+    it will not be modified, this never takes a write lock.
+    '''
 
     repoDirName = '.module_ultra'
     resultDirName = 'core_results'
+    runDirName = 'runs'
+    lockDirName = 'locks'
+    runLogDirName = 'run_logs'
     pipeRoot = 'pipelines.yml'
+    stateDbName = 'state.sqlite'
+    scratchDirName = 'scratch'
 
-    def __init__(self, abspath):
+    def __init__(self, abspath, readOnly=False):
         self.abspath = abspath
-        self.muConfig = ModuleUltraConfig.load()
+        self.muConfig = ModuleUltraConfig.load(readOnly=readOnly)
 
+        dbPath = os.path.join(self.abspath, ModuleUltraRepo.stateDbName)
+        self.store = StateStore(dbPath, readOnly=readOnly)
         pipePath = os.path.join(self.abspath, ModuleUltraRepo.pipeRoot)
-        self.pipelines = PersistentDict(pipePath)
+        self.pipelines = self.store.table('pipelines', yamlPath=pipePath)
 
     def datasuperRepo(self):
-        return ds.Repo(self.abspath)
+        '''Return the datasuper repo in the same root as this repo.'''
+        import datasuper as ds
+
+        return ds.Repo.loadRepo(os.path.dirname(self.abspath))
+
+    def selectSamples(self, selection):
+        '''Return the names of the samples a `SampleSelection` selects.'''
+        return list(selection.resolve(self.datasuperRepo().db))
 
     def addPipeline(self, pipelineName, version=None, modify=False):
         '''Add an installed pipeline to this repo.
@@ -53,8 +75,10 @@ class ModuleUltraRepo:
 
     def addPipelineTypes(self, pipelineName, version, pipelineDef, modify=False):
         '''Add file, result, and sample types from a pipeline.'''
+        from .pipeline_instance import PipelineInstance
+
         instance = PipelineInstance(self, pipelineName, version, pipelineDef)
-        with ds.Repo(self.abspath) as dsRepo:
+        with self.datasuperRepo() as dsRepo:
             for fileTypeName in instance.listFileTypes():
                 dsRepo.addFileType(fileTypeName)
 
@@ -67,6 +91,8 @@ class ModuleUltraRepo:
 
     def getPipelineInstance(self, pipelineName, version=None):
         '''Return a pipeline instance for a pipeline that is in this repo.'''
+        from .pipeline_instance import PipelineInstance
+
         assert pipelineName in self.pipelines
         if version is not None:
             assert version == self.pipelines[pipelineName]
@@ -81,35 +107,103 @@ class ModuleUltraRepo:
         '''Return a list of pipelines that have been added to this repo.'''
         return [p for p in self.pipelines.keys()]
 
-    def snakemakeFilepath(self, pipelineName):
-        '''Return the path to use for a snakemake file for a pipeline.'''
-        snakeFile = 'snakemake_{}.smk'.format(pipelineName)
-        return os.path.join(self.abspath, snakeFile)
+    def snakemakeFilepath(self, pipelineName, runId=None):
+        '''Return the path to use for a snakemake file for a pipeline.
+
+        If `runId` is given the path is unique to that run so concurrent
+        runs of the same pipeline do not overwrite each others snakefile
+        (or the config that is embedded in it).
+        '''
+        if runId is None:
+            snakeFile = 'snakemake_{}.smk'.format(pipelineName)
+            return os.path.join(self.abspath, snakeFile)
+        runDir = os.path.join(self.abspath, ModuleUltraRepo.runDirName)
+        os.makedirs(runDir, exist_ok=True)
+        snakeFile = 'snakemake_{}_{}.smk'.format(pipelineName, runId)
+        return os.path.join(runDir, snakeFile)
+
+    def getLockDir(self):
+        '''Get the directory where run locks are kept.'''
+        return os.path.join(self.abspath, ModuleUltraRepo.lockDirName)
+
+    def runLock(self, pipelineName, runId, sampleNames, groupNames, groupMembers=None):
+        '''Return a lock claiming the named samples and groups for a run.
+
+        `groupMembers` maps group names to their samples, see `RunLock`.
+        '''
+        return RunLock(self.getLockDir(), pipelineName, runId,
+                       sampleNames, groupNames, groupMembers=groupMembers)
 
     def getResultDir(self):
         '''Get the directory where the actual result files are stored.'''
         return os.path.join(self.abspath, ModuleUltraRepo.resultDirName)
 
-    def makeTempDir(self):
-        '''Return a path to a temp dir within the result dir.'''
-        pass
+    def getScratchRoot(self):
+        '''Get the directory under which jobs get scratch dirs.
+
+        This is the SCRATCH_DIR config variable or a dir in the repo.
+        '''
+        configured = self.muConfig.scratch()['dir']
+        if configured:
+            return configured
+        return os.path.join(self.abspath, ModuleUltraRepo.scratchDirName)
+
+    def originManifest(self):
+        '''Return the `OriginManifest` of this repo.'''
+        return OriginManifest(self.store)
+
+    def getRunLogDir(self):
+        '''Get the directory where logs and reports of runs are kept.'''
+        return os.path.join(self.abspath, ModuleUltraRepo.runLogDirName)
+
+    def getScratchUsageLog(self):
+        '''Get the file where the disk usage of scratch dirs is logged.'''
+        return os.path.join(self.getRunLogDir(), 'scratch_usage.jsonl')
+
+    def scratchManager(self, budgetGB=None):
+        '''Return a `ScratchManager` for this repo.'''
+        if budgetGB is None:
+            budgetGB = self.muConfig.scratch()['budget_gb']
+        budget = int(budgetGB * 1024 * 1024 * 1024) if budgetGB else None
+        return ScratchManager(self.getScratchRoot(),
+                              budget=budget,
+                              usageLog=self.getScratchUsageLog())
+
+    def makeTempDir(self, name='tmp'):
+        '''Return a path to a new temp dir under the scratch root.
+
+        The caller should give it back with `scratchManager().leave`.
+        '''
+        return self.scratchManager().enter(name)
 
-    def makeVirtualSampleDir(self, dname, sample):
+    def makeVirtualSampleDir(self, dname, sample, hardlink=False):
         '''
         Create a directory named <dname>
         with all the results for a given sample
+
+        Results are linked, not copied, see `buildLinkFarm`.
+        `sample` may be a datasuper record or a name. Return
+        the number of links made, kept and removed.
         '''
-        pass
+        if type(sample) == str:
+            sample = self.datasuperRepo().db.sampleTable.get(sample)
+        return buildLinkFarm(dname, sampleLinks(sample), hardlink=hardlink)
 
-    def makeVirtualGroupDir(self, dname, group, flat=False):
+    def makeVirtualGroupDir(self, dname, group, flat=False, hardlink=False):
         '''
         Create a directory named <dname> with all the
         results for a given groups
 
         unless flat is true make subdirectories for
         each sample plus a 'group_result' dir
+
+        Results are linked, not copied, see `buildLinkFarm`.
+        `group` may be a datasuper record or a name. Return
+        the number of links made, kept and removed.
         '''
-        pass
+        if type(group) == str:
+            group = self.datasuperRepo().db.sampleGroupTable.get(group)
+        return buildLinkFarm(dname, groupLinks(group, flat=flat), hardlink=hardlink)
 
     @staticmethod
     def repoDir(startDir='.'):
@@ -124,10 +218,10 @@ class ModuleUltraRepo:
         return ModuleUltraRepo.repoDir(startDir=up)
 
     @staticmethod
-    def loadRepo(startDir='.'):
+    def loadRepo(startDir='.', readOnly=False):
         '''Return the first repo at or above `startDir`.'''
         repoPath = ModuleUltraRepo.repoDir(startDir=startDir)
-        return ModuleUltraRepo(repoPath)
+        return ModuleUltraRepo(repoPath, readOnly=readOnly)
 
     @staticmethod
     def initRepo(root='.'):
@@ -138,6 +232,8 @@ class ModuleUltraRepo:
             Create a .module_ultra directory
             Create a .module_ultra/core_results directory
         '''
+        import datasuper as ds
+
         try:
             ds.Repo.initRepo(targetDir=root)
         except ds.RepoAlreadyExistsError:
@@ -147,7 +243,7 @@ class ModuleUltraRepo:
             p = os.path.abspath(root)
             p = os.path.join(p, ModuleUltraRepo.repoDirName)
             os.makedirs(p)
-            logDir = os.path.join(p, 'run_logs')
+            logDir = os.path.join(p, ModuleUltraRepo.runLogDirName)
             os.makedirs(logDir)
             p = os.path.join(p, ModuleUltraRepo.resultDirName)
             os.makedirs(p)
@@ -0,0 +1,163 @@
+from hashlib import sha1
+
+
+def resultKeys(sample):
+    '''Return the sorted keys of the results a sample holds.
+
+    The keys are part of the sample record so this does not read any
+    result or file records.
+    '''
+    return sorted(str(key) for key in sample.to_dict()['results'])
+
+
+def keysFingerprint(keys):
+    '''Return a digest of a list of result keys.'''
+    return sha1('\n'.join(sorted(keys)).encode('utf-8')).hexdigest()
+
+
+def resultKeysFingerprint(sample):
+    '''Return a digest of the keys of the results a sample holds.'''
+    return keysFingerprint(resultKeys(sample))
+
+
+class OriginManifest:
+    '''The result file paths of each sample, kept between runs.
+
+    Finding the origin files of a sample takes a read of every result
+    and file record it holds. The manifest keeps the answer in a table
+    of the repo `StateStore`, keyed by sample name:
+
+        {'fingerprint': digest of 'keys',
+         'keys': the keys of the results in the entry,
+         'results': {result type: {file key: path}},
+         'checksums': {path: checksum of the file record}}
+
+    An entry is used as long as the result keys of the sample have not
+    changed, otherwise it is rebuilt from the records. Register rules
+    update entries in place (see `recordResult`) and `sync` validates
+    every entry against the checksums of datasuper file records.
+
+    The whole table is read at once the first time it is needed.
+    Changes are kept in memory until `save`.
+    '''
+
+    tableName = 'origin_manifest'
+
+    def __init__(self, store):
+        self.store = store
+        self.table = store.table(OriginManifest.tableName)
+        self._entries = None
+        self.changed = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = dict(self.table.items())
+        return self._entries
+
+    def sampleResults(self, sample):
+        '''Return a dict of result type -> {file key: path} for a sample.'''
+        entry = self.entries.get(sample.name)
+        if entry and entry['fingerprint'] == resultKeysFingerprint(sample):
+            self.hits += 1
+            return entry['results']
+        self.misses += 1
+        return self.refresh(sample)['results']
+
+    def refresh(self, sample):
+        '''Rebuild the entry of a sample from its records. Return the entry.'''
+        keys = resultKeys(sample)
+        entry = {'fingerprint': keysFingerprint(keys), 'keys': keys,
+                 'results': {}, 'checksums': {}}
+        for result in sample.results():
+            files = {}
+            for key, fileRec in result.files():
+                path = fileRec.filepath()
+                files[key] = path
+                entry['checksums'][path] = fileRec.checksum
+            entry['results'][result.resultType()] = files
+        self.entries[sample.name] = entry
+        self.changed[sample.name] = entry
+        return entry
+
+    def recordResult(self, sample, result):
+        '''Add a result just added to `sample` to its entry and save it.
+
+        Samples without an entry are left for the next run to build.
+        Register jobs of one sample may run at once so the entry is
+        read and written in one transaction. Its fingerprint is made
+        from the keys of the results the entry holds rather than from
+        `sample`, which may hold results whose jobs have not recorded
+        them yet. Such an entry does not match its sample until every
+        job has recorded its result, so it is rebuilt if one never does.
+        '''
+        with self.store.transaction():
+            entry = self.table.get(sample.name)
+            if entry is None or 'keys' not in entry:
+                return
+            files = {}
+            for key, fileRec in result.files():
+                path = fileRec.filepath()
+                files[key] = path
+                entry['checksums'][path] = fileRec.checksum
+            entry['results'][result.resultType()] = files
+            entry['keys'] = sorted(set(entry['keys']) | {str(result.name)})
+            entry['fingerprint'] = keysFingerprint(entry['keys'])
+            self.table[sample.name] = entry
+        if self._entries is not None:
+            self._entries[sample.name] = entry
+
+    def save(self):
+        '''Write changed entries in one transaction.'''
+        if not self.changed:
+            return
+        with self.store.transaction():
+            for name, entry in self.changed.items():
+                self.table[name] = entry
+        self.changed = {}
+
+    def sync(self, samples, fileChecksums):
+        '''Check every entry against datasuper and rebuild stale ones.
+
+        `samples` are the sample records in the repo and `fileChecksums`
+        maps the path of every file record to its checksum. An entry is
+        stale if the result keys of its sample changed or if a file
+        in it is no longer registered with the same checksum. Entries
+        of samples that no longer exist are removed.
+
+        Return a dict with the number of entries 'ok', 'rebuilt' and
+        'removed'.
+        '''
+        counts = {'ok': 0, 'rebuilt': 0, 'removed': 0}
+        seen = set()
+        for sample in samples:
+            seen.add(sample.name)
+            entry = self.entries.get(sample.name)
+            stale = entry is None or entry['fingerprint'] != resultKeysFingerprint(sample)
+            if not stale:
+                stale = any(fileChecksums.get(path, False) != checksum
+                            for path, checksum in entry['checksums'].items())
+            if stale:
+                self.refresh(sample)
+                counts['rebuilt'] += 1
+            else:
+                counts['ok'] += 1
+        with self.store.transaction():
+            for name in list(self.entries):
+                if name not in seen:
+                    if name in self.table:
+                        del self.table[name]
+                    del self.entries[name]
+                    self.changed.pop(name, None)
+                    counts['removed'] += 1
+            self.save()
+        return counts
+
+    def clear(self):
+        with self.store.transaction():
+            for name in self.table.keys():
+                del self.table[name]
+        self._entries = {}
+        self.changed = {}
@@ -0,0 +1,76 @@
+'''Stage origin files to local scratch before the jobs that read them.
+
+When staging is on, `getOriginResultFiles` points module rules at a
+path under the stage dir instead of the shared filesystem. A staging
+rule (see `makeOriginStagingRule`) produces that path by hardlinking
+or copying the origin file. Its outputs are marked temp so snakemake
+removes them once every job that reads them has finished.
+
+This file is imported by master snakefiles so it may only import from
+the standard library.
+'''
+
+import os
+import os.path
+import sys
+import shutil
+from time import sleep, time
+
+
+STAGE_RESOURCE = 'mu_stage_origins'
+
+
+def stagedOriginPath(stageDir, name, resultType, fileKey, remotePath):
+    '''Return the staged path of an origin file.'''
+    return os.path.join(stageDir, name, resultType, fileKey,
+                        os.path.basename(remotePath))
+
+
+def dirSize(path):
+    '''Return the total size in bytes of the files under `path`.'''
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for fname in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, fname)).st_size
+            except FileNotFoundError:
+                pass  # removed by a finished job
+    return total
+
+
+def waitForBudget(stageDir, size, budget, maxWait=600, pollInterval=5):
+    '''Wait until `size` more bytes fit in the stage dir.
+
+    Staged files are removed as the jobs that read them finish so space
+    frees up over time. Give up waiting after `maxWait` seconds, or at
+    once if nothing is staged, and return False. Return True if the
+    file fits.
+    '''
+    start = time()
+    while True:
+        used = dirSize(stageDir)
+        if used + size <= budget:
+            return True
+        if used == 0 or (time() - start) >= maxWait:
+            return False
+        sleep(pollInterval)
+
+
+def stageFile(src, dest, stageDir, budget=None, maxWait=600):
+    '''Hardlink or copy `src` to `dest`, within a size budget in bytes.
+
+    Hardlinks are used when `src` is on the same filesystem as the
+    stage dir. Copies are written to a temp file and renamed into place.
+    '''
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if budget is not None:
+        size = os.stat(src).st_size
+        if not waitForBudget(stageDir, size, budget, maxWait=maxWait):
+            print('[ModuleUltra] Staging {} over budget'.format(src), file=sys.stderr)
+    tmpPath = dest + '.mu_stage_tmp'
+    try:
+        os.link(src, tmpPath)
+    except OSError:
+        shutil.copyfile(src, tmpPath)
+    os.replace(tmpPath, dest)
+    return dest
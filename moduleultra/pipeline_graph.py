@@ -0,0 +1,105 @@
+from .errors import PipelineCycleError
+
+
+class PipelineGraph:
+    '''The dependency graph between the result types of a pipeline.
+
+    Built once per pipeline instance. Nodes are result type names and
+    there is an edge from each result type to its dependencies. Names
+    that are depended on but not defined are kept as nodes without
+    dependencies.
+
+    Upstream and downstream closures are computed on demand and cached.
+    '''
+
+    def __init__(self, dependencies):
+        '''Build a graph from a dict of name -> list of dependency names.
+
+        Raises `PipelineCycleError` if the dependencies form a cycle.
+        '''
+        self.dependencies = {}
+        for name, deps in dependencies.items():
+            self.dependencies[name] = list(deps)
+            for dep in deps:
+                self.dependencies.setdefault(dep, [])
+
+        self.dependents = {name: [] for name in self.dependencies}
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(name)
+
+        self.order = self._topologicalOrder()
+        self.rank = {name: i for i, name in enumerate(self.order)}
+        self._upstream = {}
+        self._downstream = {}
+
+    @classmethod
+    def fromResultSchema(ctype, resultSchema):
+        '''Return the graph of a list of `ResultSchema`.'''
+        return ctype({schema.name: schema.dependencies for schema in resultSchema})
+
+    def _topologicalOrder(self):
+        '''Return names with every name after its dependencies.
+
+        Ties are broken by the order names were added so the order is
+        stable from run to run.
+        '''
+        nDeps = {name: len(set(deps)) for name, deps in self.dependencies.items()}
+        ready = [name for name, n in nDeps.items() if n == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in self.dependents[name]:
+                nDeps[dependent] -= 1
+                if nDeps[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.dependencies):
+            cycle = sorted(name for name, n in nDeps.items() if n > 0)
+            raise PipelineCycleError(cycle)
+        return order
+
+    def topologicalOrder(self):
+        '''Return a list of names with every name after its dependencies.'''
+        return list(self.order)
+
+    def sortNames(self, names):
+        '''Return `names` in topological order.'''
+        return sorted(names, key=lambda name: self.rank[name])
+
+    def upstream(self, name):
+        '''Return the set of names that `name` depends on, directly or not.'''
+        return self._closure(name, self.dependencies, self._upstream)
+
+    def downstream(self, name):
+        '''Return the set of names that depend on `name`, directly or not.'''
+        return self._closure(name, self.dependents, self._downstream)
+
+    def _closure(self, name, edges, cache):
+        if name in cache:
+            return cache[name]
+        out = set()
+        for other in edges[name]:
+            out.add(other)
+            out |= self._closure(other, edges, cache)
+        cache[name] = frozenset(out)
+        return cache[name]
+
+    def withDependencies(self, names):
+        '''Return `names` plus everything they depend on.'''
+        out = set(names)
+        for name in names:
+            out |= self.upstream(name)
+        return out
+
+    def withDownstream(self, names):
+        '''Return `names` plus everything that depends on them.'''
+        out = set(names)
+        for name in names:
+            out |= self.downstream(name)
+        return out
+
+    def closedSubset(self, names):
+        '''Return the names in `names` whose dependencies are all in `names`.'''
+        names = set(names)
+        return {name for name in names if self.upstream(name) <= names}
@@ -1,4 +1,3 @@
-from snakemake import snakemake
 from .utils import *
 from datasuper.utils import parsers as dsparsers
 from .result_schema import ResultSchema
@@ -9,8 +8,21 @@ from .snakemake_rule_builder import SnakemakeRuleBuilder
 from time import time
 from .pipeline_instance_utils import *
 from .pipeline_instance_snakemake_utils import *
-from .snakemake_log_handler import CompactMultiProgressBars
-from os import getcwd
+from .run_lock import RunLock, makeRunId
+from .job_bundler import JobBundler
+from .pipeline_graph import PipelineGraph
+from .origin_staging import STAGE_RESOURCE
+from .mem_profile import MemProfiler
+from .result_cache import staticKey
+from .installation.pipeline_config_utils import machineCores, machineMemMB
+from .executors import (
+    ArrayJobExecutor,
+    FakeClusterExecutor,
+    LocalExecutor,
+    SubmitScriptExecutor,
+)
+from os import getcwd, remove
+import os.path
 
 
 class PipelineInstance:
@@ -55,6 +67,7 @@ class PipelineInstance:
         for schema in self.resultSchema:
             if schema.name in self.origins:
                 schema.origin = True
+        self.graph = PipelineGraph.fromResultSchema(self.resultSchema)
 
         allEnds = [schema.name
                    for schema in self.resultSchema
@@ -68,7 +81,14 @@ class PipelineInstance:
             endpts=None, excludeEndpts=None, groups=None, samples=None,
             dryrun=False, reason=True, unlock=False, jobs=1, local=False,
             custom_config_file=None, compact_logger=False, benchmark=False,
-            logger=None, loghandler=None):
+            logger=None, loghandler=None, latency_wait=None, delta=False,
+            group_size=None, group_by='rule', group_wait=30,
+            downstreamOf=None, withDependencies=False,
+            stage_origins=False, stage_dir=None, stage_jobs=None,
+            stage_budget_gb=None, scratch=False, scratch_budget_gb=None,
+            memprofile=False, manifest=True, result_cache=False,
+            result_cache_dir=None, result_cache_max_gb=None, executor=None,
+            cores=None, mem_mb=None):
         '''Run this pipeline.
 
         To do this:
@@ -80,6 +100,10 @@ class PipelineInstance:
             Get the jobname template.
             Run snakemake.
 
+        Each run gets its own snakefile and claims its samples and groups
+        for this pipeline, so runs that do not overlap can go in parallel
+        in the same repo. Dry runs do not claim anything.
+
         Args:
             endpts (:obj:`[str]`, optional): A list of endpoints that should
                 be run. If None run all endpoints.
@@ -93,62 +117,208 @@ class PipelineInstance:
                 May be a list of strings or datasuper group objects.
             dryrun (:obj:`bool`, optional): Do not actually run the pipeline.
                 Just print out a list of jobs that would be run.
-            unlock (:obj:`bool`, optional): Unlock the snakemake directory.
-                Do nothing else.
+            unlock (:obj:`bool`, optional): Unlock the snakemake directory
+                and drop all claims on this pipeline. Do nothing else.
             jobs (:obj:`int`, optional): The number of jobs that should be
                 run at once. Defaults to one.
             local (:obj:`bool`, optional): Run all jobs on the local machine.
                 Defaults to False.
+            latency_wait (:obj:`int`, optional): Max seconds to wait for the
+                output files of a finished job. See `getLatencyWait`.
+            delta (:obj:`bool`, optional): Only put (sample, endpoint) pairs
+                that are not finished into the DAG. A pair is finished once
+                its registration flag exists, so jobs whose inputs changed
+                since are not rerun. Defaults to False.
+            group_size (:obj:`int`, optional): On a cluster, bundle up to
+                this many jobs of a module into one submission. Modules
+                that set CLUSTER_GROUP_SIZE in the pipeline definition
+                use their own size. Defaults to no bundling.
+            group_by (:obj:`str`, optional): Bundle jobs of the same 'rule'
+                or of the same 'sample'. Defaults to 'rule'.
+            group_wait (:obj:`int`, optional): Seconds to wait for a bundle
+                to fill before submitting it anyway. Defaults to 30.
+            downstreamOf (:obj:`[str]`, optional): Only run endpoints that
+                depend on one of these, see `preprocessEndpoints`.
+            withDependencies (:obj:`bool`, optional): Also run everything
+                the selected endpoints depend on. Defaults to False.
+            stage_origins (:obj:`bool`, optional): Copy or hardlink origin
+                files to local scratch before the jobs that read them.
+                Only for local runs. Defaults to False.
+            stage_dir (:obj:`str`, optional): Where to stage origins.
+                Defaults to the ORIGIN_STAGE_DIR config variable.
+            stage_jobs (:obj:`int`, optional): Max origin files to stage
+                at once. Defaults to ORIGIN_STAGE_JOBS or 2.
+            stage_budget_gb (:obj:`float`, optional): Max gigabytes of
+                staged origins at once. Defaults to ORIGIN_STAGE_BUDGET_GB
+                or no limit.
+            scratch (:obj:`bool`, optional): Give each shell job its own
+                scratch dir as $TMPDIR, see `ModuleUltraRepo.getScratchRoot`.
+                Set SCRATCH_DIR to node local disk on clusters. Defaults
+                to False.
+            scratch_budget_gb (:obj:`float`, optional): Delay new jobs while
+                scratch dirs hold more than this. Defaults to the
+                SCRATCH_BUDGET_GB config variable or no limit.
+            memprofile (:obj:`bool`, optional): Record peak RSS and the top
+                allocation sites of each stage in a report in the run log
+                dir, see `getMemProfiler`. Defaults to False.
+            manifest (:obj:`bool`, optional): Read the origin files of
+                samples from the repo's `OriginManifest` instead of their
+                records. Defaults to True.
+            result_cache (:obj:`bool`, optional): Reuse the outputs of
+                module jobs whose inputs, code and config were seen before,
+                from any repo, see `ResultCache`. Defaults to False.
+            result_cache_dir (:obj:`str`, optional): The cache dir.
+                Defaults to the RESULT_CACHE_DIR config variable.
+            result_cache_max_gb (:obj:`float`, optional): Evict least
+                recently used entries past this size. Defaults to
+                RESULT_CACHE_MAX_GB or no limit.
+            executor (:obj:`Executor`, optional): How jobs are executed,
+                see `getExecutor`. Takes precedence over `local`.
+                Defaults to local or cluster submit script execution.
+            cores (:obj:`int`, optional): For local runs, the cores jobs
+                may use in total, 0 for all cores of this machine. Jobs
+                are then packed by the threads of their modules instead
+                of being limited to `jobs` at once.
+            mem_mb (:obj:`int`, optional): For local runs, the megabytes
+                of memory jobs may use in total, 0 for all of this
+                machine. Modules declare theirs with MEM_MB.
+
+        Returns:
+            bool: False if snakemake reported an error.
         '''
+        from snakemake import snakemake
+        from .snakemake_log_handler import CompactMultiProgressBars
+
         if not logger:
             logger = lambda s: print(s, file=sys.stderr)
         if benchmark:
             for schema in self.resultSchema:
                 schema.benchmark = True
-        samples, groups = preprocessSamplesAndGroups(self.origins,
-                                                     samples, groups)
-        endpts = self.preprocessEndpoints(endpts, excludeEndpts)
-        preprocessedConf = self.preprocessConf(
-            self.origins,
-            samples,
-            groups,
-            endpts,
-            custom_config_file=custom_config_file
-        )
+        profiler = self.getMemProfiler(memprofile, dryrun)
+        if executor is None:
+            executor = self.getExecutor(local)
+        local = executor.local
+        with profiler.stage('samples_and_groups'):
+            plan = preprocessSamplesAndGroups(
+                self.origins, samples, groups,
+                manifest=self.muRepo.originManifest() if manifest else None
+            )
+        with profiler.stage('endpoints'):
+            endpts = self.preprocessEndpoints(endpts, excludeEndpts,
+                                              downstreamOf=downstreamOf,
+                                              withDependencies=withDependencies)
+        targets = None
+        if delta and not unlock:
+            with profiler.stage('delta'):
+                plan, targets = self.planDelta(endpts, plan)
+        runId = makeRunId(self.pipelineName,
+                          self.pipelineVersion,
+                          plan.sampleNames,
+                          plan.groupNames)
+        profiler.meta['run_id'] = runId
+        if unlock:
+            RunLock.clear(self.muRepo.getLockDir(), self.pipelineName)
+        staging = None
+        if stage_origins:
+            staging = self.getOriginStaging(local, logger, stage_dir,
+                                            stage_jobs, stage_budget_gb)
+        scratchConf = None
+        if scratch:
+            scratchConf = self.getScratchConf(scratch_budget_gb)
+        resultCache = None
+        if result_cache:
+            resultCache = self.getResultCacheSettings(logger, result_cache_dir,
+                                                      result_cache_max_gb)
+        with profiler.stage('config'):
+            preprocessedConf = self.preprocessConf(
+                plan,
+                endpts,
+                custom_config_file=custom_config_file,
+                targets=targets,
+                staging=staging,
+                scratch=scratchConf,
+                resultCache=resultCache
+            )
         endpt_names = ', '.join([endpt.name for endpt in endpts])
         logger(f'Running Endpoints: {endpt_names}')
-        snakefile = self.preprocessSnakemake(preprocessedConf,
-                                             endpts,
-                                             samples,
-                                             groups)
-        clusterScript = self.getClusterSubmitScript(local)
+        with profiler.stage('snakefile'):
+            snakefile = self.preprocessSnakemake(preprocessedConf,
+                                                 endpts,
+                                                 plan,
+                                                 runId=runId,
+                                                 staging=staging,
+                                                 scratch=scratchConf is not None,
+                                                 resultCache=resultCache is not None)
+        clusterScript = executor.clusterCommand()
+        statusScript = executor.statusCommand()
+        latency_wait = self.getLatencyWait(local, latency_wait,
+                                           hasStatus=statusScript is not None)
         snkmkJobnameTemplate = self.getSnakemakeJobnameTemplate()
 
         if not loghandler and compact_logger:
             name = f'{getcwd()} :: {self.pipelineName} :: {self.pipelineVersion}'
             loghandler = CompactMultiProgressBars(name=name).handle_msg
 
-        cores = 1
-        if local:
-            cores = jobs
-
-        snakemake(
-            snakefile,
-            config={},
-            workdir=self.muRepo.getResultDir(),
-            cluster=clusterScript,
-            keepgoing=True,
-            printshellcmds=True,
-            dryrun=dryrun,
-            printreason=reason,
-            unlock=unlock,
-            force_incomplete=True,
-            latency_wait=100,
-            jobname=snkmkJobnameTemplate,
-            nodes=jobs,
-            log_handler=loghandler,
-            cores=cores,
-        )
+        snkmkCores, resources = self.getLocalResources(local, jobs, cores, mem_mb)
+        nodes = jobs
+        if local and cores is not None:
+            nodes = snkmkCores  # every job takes at least a core
+        if staging:
+            resources[STAGE_RESOURCE] = staging['jobs']
+
+        bundler = None
+        groupSizes = self.getClusterGroupSizes(endpts, group_size)
+        spool = executor.spools or (clusterScript and groupSizes)
+        if not local and spool and not (dryrun or unlock):
+            spoolDir = os.path.join(os.path.dirname(snakefile),
+                                    'bundles_{}'.format(runId))
+            bundler = JobBundler(spoolDir, clusterScript, groupSizes,
+                                 groupBy=group_by, maxWait=group_wait,
+                                 statusCmd=statusScript, executor=executor,
+                                 defaultSize=executor.arraySize or 1)
+            clusterScript = bundler.spoolCommand()
+            statusScript = bundler.statusCommand()
+
+        groupMembers = {name: plan.groupSampleNames(index)
+                        for index, name in enumerate(plan.groupNames)}
+        runLock = self.muRepo.runLock(self.pipelineName, runId,
+                                      plan.sampleNames, plan.groupNames,
+                                      groupMembers=groupMembers)
+        try:
+            if not (dryrun or unlock):
+                runLock.acquire()
+            if bundler:
+                executor.start()
+                bundler.start()
+            with profiler.stage('dryrun' if dryrun else 'snakemake'):
+                success = snakemake(
+                    snakefile,
+                    config={},
+                    workdir=self.muRepo.getResultDir(),
+                    cluster=clusterScript,
+                    cluster_status=statusScript,
+                    keepgoing=True,
+                    printshellcmds=True,
+                    dryrun=dryrun,
+                    printreason=reason,
+                    unlock=unlock,
+                    lock=False,  # runs are locked by sample set, see RunLock
+                    force_incomplete=True,
+                    latency_wait=latency_wait,
+                    jobname=snkmkJobnameTemplate,
+                    nodes=nodes,
+                    log_handler=loghandler,
+                    cores=snkmkCores,
+                    resources=resources,
+                )
+        finally:
+            if bundler and bundler.is_alive():
+                executor.stop()
+                bundler.stop()
+            runLock.release()
+            remove(snakefile)
+            profiler.finish(logger)
+        return success
 
     def getSnakemakeJobnameTemplate(self):
         '''Return a jobname template based on this pipeline instance.'''
@@ -159,6 +329,194 @@ class PipelineInstance:
         snkmkJobnameTemplate = ''.join(snkmkJobnameTemplate)
         return snkmkJobnameTemplate
 
+    def getLatencyWait(self, local, latency_wait=None, hasStatus=False):
+        '''Return the max seconds to wait for output files of a finished job.
+
+        Snakemake polls for outputs every second so successful jobs only
+        wait as long as the filesystem needs. The max is what a job that
+        did not produce its outputs costs, so it is kept as low as the
+        mode allows:
+            An explicit `latency_wait` always wins.
+            Then the LATENCY_WAIT config variable.
+            Local jobs write to the same filesystem so 5s is plenty.
+            On a cluster with a status script failed and killed jobs
+            are reported by the scheduler so 30s is enough.
+            Otherwise 100s, to allow for slow network filesystems.
+        '''
+        if latency_wait is not None:
+            return latency_wait
+        configured = self.muConfig.latencyWait()
+        if configured is not None:
+            return configured
+        if local:
+            return 5
+        if hasStatus:
+            return 30
+        return 100
+
+    def getClusterStatusScript(self, local):
+        '''Return the cluster status script to use for jobs or None.'''
+        if local:
+            return None
+        return self.muConfig.clusterStatusScript()
+
+    def getClusterGroupSizes(self, endpts, defaultSize=None):
+        '''Return a dict of rule name -> cluster group size.
+
+        Only rules that should be bundled (size > 1) are included.
+        '''
+        groupSizes = {}
+        for schema in endpts:
+            size = schema.clusterGroupSize
+            if size <= 1 and defaultSize:
+                size = defaultSize
+            if size <= 1:
+                continue
+            for ruleName in schema.ruleNames():
+                groupSizes[ruleName] = size
+        return groupSizes
+
+    def getMemProfiler(self, enabled, dryrun=False):
+        '''Return a `MemProfiler` for a run, that does nothing unless `enabled`.
+
+        The report is rewritten after each stage so a run that runs
+        out of memory still leaves the stages before.
+        '''
+        name = 'memprofile_{}_{}_{}.json'.format(self.pipelineName, int(time()), os.getpid())
+        path = os.path.join(self.muRepo.getRunLogDir(), name)
+        return MemProfiler(path=path, enabled=enabled,
+                           pipeline=self.pipelineName,
+                           version=self.pipelineVersion,
+                           dryrun=dryrun).start()
+
+    def getOriginStaging(self, local, logger, stageDir=None, jobs=None, budgetGB=None):
+        '''Return the settings for staging origins or None if not possible.
+
+        Explicit arguments take precedence over config variables.
+        Staging is to local scratch so it is only done for local runs.
+        '''
+        if not local:
+            logger('Origin staging is only done for local runs, skipping')
+            return None
+        configured = self.muConfig.originStaging() or {}
+        stageDir = stageDir or configured.get('dir')
+        if not stageDir:
+            logger('No origin stage dir set, skipping origin staging')
+            return None
+        jobs = jobs or configured.get('jobs', 2)
+        budgetGB = budgetGB or configured.get('budget_gb')
+        budget = None
+        if budgetGB:
+            budget = int(budgetGB * 1024 * 1024 * 1024)
+        return {
+            'dir': os.path.abspath(stageDir),
+            'jobs': jobs,
+            'budget': budget,
+            'wait': 600,
+        }
+
+    def getScratchConf(self, budgetGB=None):
+        '''Return the scratch settings to put in the master config.'''
+        manager = self.muRepo.scratchManager(budgetGB=budgetGB)
+        return {
+            'root': manager.root,
+            'budget': manager.budget,
+            'usage_log': manager.usageLog,
+        }
+
+    def getResultCacheSettings(self, logger, cacheDir=None, maxGB=None):
+        '''Return the result cache settings or None if no cache dir is set.
+
+        Explicit arguments take precedence over config variables.
+        '''
+        configured = self.muConfig.resultCache() or {}
+        cacheDir = cacheDir or configured.get('dir')
+        if not cacheDir:
+            logger('No result cache dir set, not using the result cache')
+            return None
+        maxGB = maxGB or configured.get('max_gb')
+        maxBytes = None
+        if maxGB:
+            maxBytes = int(maxGB * 1024 * 1024 * 1024)
+        return {
+            'root': os.path.abspath(cacheDir),
+            'max_bytes': maxBytes,
+            'link': configured.get('link', 'hardlink'),
+        }
+
+    def getResultCacheConf(self, settings, endpts, pconf):
+        '''Return the 'result_cache' section of the master config.
+
+        Lists the rules of each module in `endpts` and the part of the
+        job key shared by every job of a module.
+        '''
+        out = dict(settings, rules={}, modules={})
+        for schema in endpts:
+            if schema.isOrigin():
+                continue
+            with open(schema.snakeFilepath) as sf:
+                snakefileText = sf.read()
+            out['modules'][schema.module] = staticKey(self.pipelineName,
+                                                      self.pipelineVersion,
+                                                      schema.module,
+                                                      snakefileText,
+                                                      pconf.get(schema.module, {}))
+            for ruleName in schema.ruleNames():
+                out['rules'][ruleName] = schema.module
+        return out
+
+    def getLocalResources(self, local, jobs, cores=None, memMB=None):
+        '''Return the cores and the resources snakemake may use.
+
+        Cluster runs use one local core. Local runs use `jobs` cores
+        unless `cores` is given. Local runs are limited to `memMB`
+        megabytes of the mem_mb resource if it is given. A `cores` or
+        `memMB` of 0 means all of this machine.
+        '''
+        if not local:
+            return 1, {}
+        resources = {}
+        if memMB is not None:
+            resources['mem_mb'] = memMB or machineMemMB()
+        if cores is None:
+            return jobs, resources
+        return cores or machineCores(), resources
+
+    def getExecutor(self, local, name=None, arraySize=None,
+                    latency=1.0, failureRate=0.0, slots=None):
+        '''Return the executor of a run.
+
+        Args:
+            local (bool): Without a `name` run locally or submit jobs
+                through the cluster submit script.
+            name (:obj:`str`, optional): One of 'local', 'cluster',
+                'array' or 'fake', see `moduleultra.executors`.
+            arraySize (:obj:`int`, optional): Max tasks per array job.
+                Defaults to 100 for 'array' and to no arrays for 'fake'.
+            latency (:obj:`float`, optional): Mean queue wait in seconds
+                of the fake cluster.
+            failureRate (:obj:`float`, optional): Share of fake cluster
+                tasks that are lost.
+            slots (:obj:`int`, optional): Tasks the fake cluster runs at
+                once. Defaults to 4.
+        '''
+        if name is None:
+            name = 'local' if local else 'cluster'
+        if name == 'local':
+            return LocalExecutor()
+        if name == 'fake':
+            return FakeClusterExecutor(latency=latency, failureRate=failureRate,
+                                       slots=slots or 4, arraySize=arraySize)
+        statusScript = self.getClusterStatusScript(False)
+        if name == 'array':
+            arrayScript = self.muConfig.clusterArraySubmitScript()
+            assert arrayScript, 'No cluster array submit script set'
+            return ArrayJobExecutor(arrayScript, statusCmd=statusScript,
+                                    arraySize=arraySize or 100)
+        assert name == 'cluster', f'Unknown executor: {name}'
+        return SubmitScriptExecutor(self.getClusterSubmitScript(False),
+                                    statusCmd=statusScript)
+
     def getClusterSubmitScript(self, local):
         '''Return the cluster submit script to use for jobs.'''
         clusterScript = None
@@ -167,58 +525,104 @@ class PipelineInstance:
             clusterScript += ' {}'.format(int(time()))
         return clusterScript
 
-    def preprocessEndpoints(self, endpts, excludeEndpts):
-        '''Return the correct list of endpoints to run.
+    def preprocessEndpoints(self, endpts, excludeEndpts,
+                            downstreamOf=None, withDependencies=False):
+        '''Return the correct list of endpoints to run in dependency order.
 
         If `endpts` is not None only return endpoints that are
         in `endpts` but never return endpoints in `excludeEndpts`.
+        If `downstreamOf` is given only endpoints that are in it or
+        depend on it are selected. If `withDependencies` is True every
+        dependency of a selected endpoint is selected as well.
+
+        Endpoints whose dependencies are not all selected are dropped.
         '''
+        defined = {schema.name for schema in self.resultSchema}
         if not endpts:
-            endpts = {schema for schema in self.resultSchema if schema.name in self.endpoints}
-        else:
-            endpts = {schema for schema in self.resultSchema if schema.name in endpts}
+            endpts = self.endpoints
+        selected = defined & set(endpts)
+        if downstreamOf:
+            selected &= self.graph.withDownstream(defined & set(downstreamOf))
+        if withDependencies:
+            selected = defined & self.graph.withDependencies(selected)
         if excludeEndpts:
-            endpts = {schema for schema in endpts if schema.name not in excludeEndpts}
-
-        num_endpts = -1
-        while len(endpts) != num_endpts:
-            num_endpts = len(endpts)
-            endpt_names = {schema.name for schema in endpts}
-            new_endpts = set()
-            for schema in endpts:
-                all_in = True
-                for depends in schema.dependencies:
-                    if depends not in endpt_names:
-                        all_in = False
-                if all_in:
-                    new_endpts.add(schema)
-            endpts = new_endpts
-
-        return list(endpts)
-
-    def preprocessSnakemake(self, confStr, endpts, samples, groups):
-        '''Return the abspath to a master snakefile that can be run.'''
+            selected -= set(excludeEndpts)
+        selected = self.graph.closedSubset(selected)
+
+        return [schema for schema in self.orderedResultSchema() if schema.name in selected]
+
+    def orderedResultSchema(self):
+        '''Return the result schema with each after its dependencies.'''
+        byName = {schema.name: schema for schema in self.resultSchema}
+        return [byName[name] for name in self.graph.topologicalOrder() if name in byName]
+
+    def planDelta(self, endpts, plan):
+        '''Return the `PlanningSet` and final targets that still need work.
+
+        Targets are the registration flags of each (sample or group,
+        endpoint) pair that do not exist yet. A sample is kept if it
+        has a pending target or is in a group with a pending target.
+        '''
+        sampleTargets, groupTargets = findPendingTargets(self.muRepo.getResultDir(),
+                                                         endpts,
+                                                         plan.sampleNames,
+                                                         plan.groupNames)
+        neededSamples = set(sampleTargets.keys())
+        for index, name in enumerate(plan.groupNames):
+            if name in groupTargets:
+                neededSamples |= set(plan.groupSampleNames(index))
+        plan = plan.subset(neededSamples, groupTargets.keys())
+
+        targets = []
+        for pending in [sampleTargets, groupTargets]:
+            for name in sorted(pending.keys()):
+                targets += pending[name]
+        return plan, targets
+
+    def preprocessSnakemake(self, confStr, endpts, plan, runId=None, staging=None,
+                            scratch=False, resultCache=False):
+        '''Return the abspath to a master snakefile that can be run.
+
+        If `staging` is given add a rule to stage origin files.
+        If `scratch` is True run shell jobs in scratch dirs.
+        If `resultCache` is True serve module jobs from the result cache.
+        '''
         preprocessed = initialImports()
         preprocessed += wildcardConstraints()
         preprocessed += '\nconfig={}\n\n'.format(confStr)  # add conf
-        preprocessed += makeSnakemakeAllRule(endpts, samples, groups)
+        if scratch:
+            preprocessed += "shell.prefix(scratchShellPrefix(config['scratch']))\n\n"
+        preprocessed += makeSnakemakeAllRule(endpts, plan.sampleNames, plan.groupNames)
 
-        # add individual results
-        for resultSchema in self.resultSchema:
+        # add individual results, upstream modules first
+        for resultSchema in self.orderedResultSchema():
             if (resultSchema in endpts) and (not resultSchema.isOrigin()):
                 preprocessed += resultSchema.preprocessSnakemake()
                 preprocessed += '\n'
+        if staging:
+            preprocessed += makeOriginStagingRule(staging['dir'])
+        if resultCache:
+            preprocessed += '\nenableResultCache(workflow, config)\n'
         preprocessed = tabify(preprocessed)
 
         # write to a file
-        sfile = self.muRepo.snakemakeFilepath(self.pipelineName)
+        sfile = self.muRepo.snakemakeFilepath(self.pipelineName, runId=runId)
         with open(sfile, 'w') as sf:
             sf.write(preprocessed)
         return sfile
 
-    def preprocessConf(self, origins, samples, groups, endpts,
-                       custom_config_file=None):
-        '''Make a config object and return a JSON str of that object.'''
+    def preprocessConf(self, plan, endpts, custom_config_file=None, targets=None,
+                       staging=None, scratch=None, resultCache=None):
+        '''Make a config object and return a JSON str of that object.
+
+        If `targets` is given only those files are requested by the
+        all rule, otherwise every endpoint of every sample and group.
+        If `staging` is given origins are read from staged copies.
+        If `scratch` is given modules can find their scratch settings
+        under the 'scratch' key.
+        If `resultCache` is given add the settings and module keys of
+        the result cache, see `getResultCacheConf`.
+        '''
         pconf = openConfF(self.snakemakeConf)
         if custom_config_file:
             customConf = openConfF(custom_config_file)
@@ -229,9 +633,18 @@ class PipelineInstance:
             if resultSchema in endpts:
                 resultSchema.preprocessConf(pconf)
 
-        pconf = addFinalPatternsToConf(pconf, endpts, samples, groups)
-        pconf = addDataToSnakemakeConf(pconf, samples, groups)
-        pconf = addOriginsToSnakemakeConf(pconf, origins, samples, groups)
+        pconf = addFinalPatternsToConf(pconf, endpts,
+                                       plan.sampleNames, plan.groupNames,
+                                       targets=targets)
+        pconf = addDataToSnakemakeConf(pconf, plan)
+        pconf = addOriginsToSnakemakeConf(pconf, plan)
+        if staging:
+            pconf['origin_staging'] = {key: staging[key]
+                                       for key in ['dir', 'budget', 'wait']}
+        if scratch:
+            pconf['scratch'] = scratch
+        if resultCache:
+            pconf['result_cache'] = self.getResultCacheConf(resultCache, endpts, pconf)
         pipeDir = self.muConfig.getPipelineDir(self.pipelineName,
                                                self.pipelineVersion)
         pconf['pipeline_dir'] = pipeDir
@@ -1,5 +1,8 @@
+import os
+import re
 import sys
 from .snakemake_rule_builder import SnakemakeRuleBuilder
+from .origin_staging import STAGE_RESOURCE
 
 
 def initialImports():
@@ -39,9 +42,114 @@ def makeSnakemakeAllRule(endpts, samples, groups):
     return allRule
 
 
-def addFinalPatternsToConf(conf, endpts, samples, groups):
+def makeOriginStagingRule(stageDir):
+    '''Return a rule that stages origin files to `stageDir`.
+
+    Staged files are temp outputs so snakemake removes them once the
+    jobs that read them are done. Staging jobs each take one unit of
+    a resource so the number that run at once can be limited.
+    '''
+    pattern = os.path.join(stageDir,
+                           '{stage_name,[^/]+}',
+                           '{stage_type,[^/]+}',
+                           '{stage_key,[^/]+}',
+                           '{stage_file,[^/]+}')
+    rule = '\nlocalrules: mu_stage_origin\n'
+    rule += '\nrule mu_stage_origin:\n'
+    rule += '    input: originToStage(config)\n'
+    rule += '    output: temp("{}")\n'.format(pattern)
+    rule += '    resources: {}=1\n'.format(STAGE_RESOURCE)
+    rule += '    run:\n'
+    rule += '        stageOriginFile(config, input[0], output[0])\n\n'
+    return rule
+
+
+RULE_DOCSTRING = re.compile(r'\A\s*?\n[ \t]+(' + '|'.join([
+    r'"""[\s\S]*?"""', r"'''[\s\S]*?'''", r'"[^"\n]*"', r"'[^'\n]*'",
+]) + r')[ \t]*$', flags=re.MULTILINE)
+RULE_RESOURCES = re.compile(r'^[ \t]*resources\s*:', flags=re.MULTILINE)
+
+
+def addRuleResources(snakefileStr, threads=None, memMB=None):
+    '''Return a snakefile with threads and mem_mb declared by each rule.
+
+    New directives go after the docstring of a rule, if it has one. Rules
+    that declare their own threads or mem_mb keep them, rules with other
+    resources get mem_mb added to them.
+    '''
+    headers = list(re.finditer(r'^[ \t]*rule\s+\w+\s*:[ \t]*$', snakefileStr,
+                               flags=re.MULTILINE))
+    out, last = [], 0
+    for index, header in enumerate(headers):
+        end = len(snakefileStr)
+        if index + 1 < len(headers):
+            end = headers[index + 1].start()
+        body = snakefileStr[header.end():end]
+        indent = re.search(r'\n([ \t]+)\S', body)
+        indent = indent.group(1) if indent else '    '
+        docstring = RULE_DOCSTRING.match(body)
+        start = docstring.end() if docstring else 0
+        directives = ''
+        if threads and not re.search(r'^\s*threads\s*:', body, flags=re.MULTILINE):
+            directives += '\n{}threads: {}'.format(indent, int(threads))
+        resources = RULE_RESOURCES.search(body)
+        if memMB and not resources:
+            directives += '\n{}resources: mem_mb={}'.format(indent, int(memMB))
+        elif memMB and not re.search(r'\bmem_mb\s*=', body):
+            body = '{} mem_mb={},{}'.format(body[:resources.end()], int(memMB),
+                                            body[resources.end():])
+        out.append(snakefileStr[last:header.end()] + body[:start] + directives + body[start:])
+        last = end
+    out.append(snakefileStr[last:])
+    return ''.join(out)
+
+
+def findPendingTargets(resultDir, endpts, sampleNames, groupNames):
+    '''Return the final targets in `resultDir` that do not exist yet.
+
+    Return two dicts, sample name -> [target] and group name -> [target].
+    Names with nothing pending are left out. Each directory is listed
+    once instead of checking every target on its own.
+    '''
+    samplePatterns, groupPatterns = [], []
+    for schema in endpts:
+        if schema.isOrigin():
+            continue
+        if schema.level == 'SAMPLE':
+            samplePatterns.append(schema.getOutputFilePattern())
+        elif schema.level == 'GROUP':
+            groupPatterns.append(schema.getOutputFilePattern())
+
+    listings = {}
+
+    def exists(target):
+        dirname, basename = os.path.split(target)
+        if dirname not in listings:
+            try:
+                listings[dirname] = set(os.listdir(os.path.join(resultDir, dirname)))
+            except FileNotFoundError:
+                listings[dirname] = set()
+        return basename in listings[dirname]
+
+    def pending(names, patterns, wildcard):
+        out = {}
+        for name in names:
+            targets = [pattern.format(**{wildcard: name}) for pattern in patterns]
+            targets = [target for target in targets if not exists(target)]
+            if targets:
+                out[name] = targets
+        return out
+
+    sampleTargets = pending(sampleNames, samplePatterns, 'sample_name')
+    groupTargets = pending(groupNames, groupPatterns, 'group_name')
+    return sampleTargets, groupTargets
+
+
+def addFinalPatternsToConf(conf, endpts, samples, groups, targets=None):
     allInps = {'sample_patterns': [],
                'group_patterns': []}
+    if targets is not None:
+        allInps['targets'] = targets
     for schema in endpts:
         if schema.isOrigin():
             continue
@@ -61,41 +169,19 @@ def addFinalPatternsToConf(conf, endpts, samples, groups):
     return conf
 
 
-def addDataToSnakemakeConf(conf, samples, groups):
+def addDataToSnakemakeConf(conf, plan):
     sampleConf = {}
-    for sample in samples:
-        sampleConf[sample.name] = {'sample_type': sample.sampleType}
+    for index, name in enumerate(plan.sampleNames):
+        sampleConf[name] = {'sample_type': plan.sampleType(index)}
     conf['samples'] = sampleConf
     groupConf = {}
-    for group in groups:
-        groupConf[group.name] = [sample.name
-                                 for sample in group.allSamples()]
+    for index, name in enumerate(plan.groupNames):
+        groupConf[name] = plan.groupSampleNames(index)
     conf['groups'] = groupConf
 
     return conf
 
 
-def addOriginsToSnakemakeConf(conf, origins, samples, groups):
-    flat_origins = []
-    for origin_group in origins:
-        if type(origin_group) == str:
-            origin_group = [origin_group]
-        for origin in origin_group:
-            flat_origins.append(origin)
-
-    originConf = {origin: {} for origin in flat_origins}
-
-    for sample in samples:
-        for result in sample.results(resultTypes=flat_origins):
-            recs = {}
-            for fileRecName, fileRec in result.files():
-                recs[fileRecName] = fileRec.filepath()
-            originConf[result.resultType()][sample.name] = recs
-    for group in groups:
-        for result in group.allResults(resultTypes=flat_origins):
-            recs = {}
-            for fileRecName, fileRec in result.files():
-                recs[fileRecName] = fileRec.filepath()
-            originConf[result.resultType()][group.name] = recs
-    conf['origins'] = originConf
+def addOriginsToSnakemakeConf(conf, plan):
+    conf['origins'] = plan.origins
     return conf
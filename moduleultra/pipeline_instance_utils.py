@@ -5,6 +5,7 @@ import sys
 import os.path
 from inspect import getmembers
 import datasuper as ds
+from .planning_set import PlanningSet
 
 
 def mergeConfs(priority, base):
@@ -34,59 +35,42 @@ def openJSONConf(confF):
     return json.loads(open(confF).read())
 
 
-def preprocessSamplesAndGroups(origins, samples, groups):
-    '''Return the appropriate list of samples and groups.
+def preprocessSamplesAndGroups(origins, samples, groups, manifest=None):
+    '''Return a `PlanningSet` of the appropriate samples and groups.
 
-    If `groups` is None return a list of all available groups.
-    If `samples` is None return a list of all the samples
-    implied by `groups`. Otherwise return the samples in `samples`.
+    If `groups` is None use all available groups.
+    If `samples` is None use all the samples
+    implied by `groups`. Otherwise use the samples in `samples`.
 
-    Return everything as DataSuper records, not strings.
+    Records are loaded lazily and dropped once they are in the
+    PlanningSet. If `manifest` is given origin files of samples are
+    read from it and any entries it had to rebuild are saved.
     '''
 
     dsRepo = ds.Repo.loadRepo()
     if groups is None:
-        groups = dsRepo.db.sampleGroupTable.getAll()
+        groups = lazyRecords(dsRepo.db.sampleGroupTable)
         if samples is None:
-            samples = dsRepo.db.sampleTable.getAll()
+            samples = lazyRecords(dsRepo.db.sampleTable)
         else:
             samples = dsRepo.db.sampleTable.getMany(samples)
     else:
         groups = dsRepo.db.sampleGroupTable.getMany(groups)
         if samples is None:
-            samples = []
-            for group in groups:
-                samples += group.allSamples()
+            samples = (sample for group in groups for sample in group.allSamples())
         else:
             samples = dsRepo.db.sampleTable.getMany(samples)
 
-    filteredSamples = []
-    for sample in samples:
-        rtypes = {result.resultType() for result in sample.results()}
-        keep = True
-        for origin_group in origins:
-            if type(origin_group) == str:
-                origin_group = [origin_group]
-            has_group = False
-            for origin in origin_group:
-                if origin in rtypes:
-                    has_group = True
-            if not has_group:
-                keep = False
-        if keep:
-            filteredSamples.append(sample)
-
-    sampleSet = {sample.name for sample in filteredSamples}
-    filteredGroups = []
-    for group in groups:
-        keep = True
-        for sample in group.allSamples():
-            if sample.name not in sampleSet:
-                keep = False
-        if keep:
-            filteredGroups.append(group)
-
-    return filteredSamples, filteredGroups
+    plan = PlanningSet.fromRecords(origins, samples, groups, manifest=manifest)
+    if manifest is not None:
+        manifest.save()
+    return plan
+
+
+def lazyRecords(table):
+    '''Yield every record in a datasuper table without caching them.'''
+    for _, loader in table.getAllLazily():
+        yield loader()
 
 
 def openPythonConf(confF):
@@ -0,0 +1,140 @@
+from array import array
+
+
+def flattenOrigins(origins):
+    '''Return a flat list of origin names from a list of origin groups.'''
+    flat = []
+    for originGroup in origins:
+        if type(originGroup) == str:
+            originGroup = [originGroup]
+        flat += originGroup
+    return flat
+
+
+class PlanningSet:
+    '''The samples and groups of one run in a compact form.
+
+    Planning used to hold a datasuper record for every sample and group
+    and walk them again for every part of the config. A PlanningSet is
+    built in one pass over the records, after which the records can be
+    dropped. It keeps:
+        the names of samples and groups,
+        sample types as indices into a short list of type names,
+        group membership as arrays of sample indices,
+        origin file paths of each sample and group.
+    '''
+
+    __slots__ = ['sampleNames', 'sampleTypes', 'typeNames', 'sampleIndex',
+                 'groupNames', 'groupMembers', 'origins']
+
+    def __init__(self, flatOrigins):
+        self.sampleNames = []
+        self.sampleTypes = array('H')
+        self.typeNames = []
+        self.sampleIndex = {}
+        self.groupNames = []
+        self.groupMembers = []
+        self.origins = {origin: {} for origin in flatOrigins}
+
+    @classmethod
+    def fromRecords(ctype, origins, samples, groups, manifest=None):
+        '''Build a PlanningSet from datasuper records.
+
+        Samples that are missing any group of origins are left out,
+        as are groups with a sample that was left out. `samples` and
+        `groups` may be generators, each record is only used once.
+
+        If `manifest` (an `OriginManifest`) is given the origin files
+        of samples are read from it instead of from their results.
+        '''
+        plan = ctype(flattenOrigins(origins))
+        typeIndex = {}
+        for sample in samples:
+            if sample.name in plan.sampleIndex:
+                continue
+            if manifest is not None:
+                originFiles = manifest.sampleResults(sample)
+            else:
+                originFiles = {result.resultType(): result for result in sample.results()}
+            keep = True
+            for originGroup in origins:
+                if type(originGroup) == str:
+                    originGroup = [originGroup]
+                if not any(origin in originFiles for origin in originGroup):
+                    keep = False
+            if not keep:
+                continue
+
+            sampleType = str(sample.sampleType)
+            if sampleType not in typeIndex:
+                typeIndex[sampleType] = len(plan.typeNames)
+                plan.typeNames.append(sampleType)
+            plan.sampleIndex[sample.name] = len(plan.sampleNames)
+            plan.sampleNames.append(sample.name)
+            plan.sampleTypes.append(typeIndex[sampleType])
+            for origin in plan.origins:
+                if origin in originFiles:
+                    files = originFiles[origin]
+                    if manifest is None:
+                        files = filepaths(files)
+                    plan.origins[origin][sample.name] = files
+
+        for group in groups:
+            members = array('I')
+            keep = True
+            for sample in group.allSamples():
+                try:
+                    members.append(plan.sampleIndex[sample.name])
+                except KeyError:
+                    keep = False
+                    break
+            if not keep:
+                continue
+            plan.groupNames.append(group.name)
+            plan.groupMembers.append(members)
+            for result in group.allResults(resultTypes=list(plan.origins)):
+                plan.origins[result.resultType()][group.name] = filepaths(result)
+        return plan
+
+    def __len__(self):
+        return len(self.sampleNames) + len(self.groupNames)
+
+    def sampleType(self, index):
+        '''Return the sample type of the sample at `index`.'''
+        return self.typeNames[self.sampleTypes[index]]
+
+    def groupSampleNames(self, index):
+        '''Return the names of the samples in the group at `index`.'''
+        return [self.sampleNames[member] for member in self.groupMembers[index]]
+
+    def subset(self, sampleNames, groupNames):
+        '''Return a new PlanningSet with only the named samples and groups.'''
+        sampleNames, groupNames = set(sampleNames), set(groupNames)
+        plan = PlanningSet(list(self.origins))
+        plan.typeNames = self.typeNames
+        remap = {}
+        for index, name in enumerate(self.sampleNames):
+            if name not in sampleNames:
+                continue
+            remap[index] = len(plan.sampleNames)
+            plan.sampleIndex[name] = len(plan.sampleNames)
+            plan.sampleNames.append(name)
+            plan.sampleTypes.append(self.sampleTypes[index])
+        for index, name in enumerate(self.groupNames):
+            members = self.groupMembers[index]
+            if name not in groupNames or any(member not in remap for member in members):
+                continue
+            plan.groupNames.append(name)
+            plan.groupMembers.append(array('I', [remap[member] for member in members]))
+        keptGroups = set(plan.groupNames)
+        for origin, byName in self.origins.items():
+            plan.origins[origin] = {
+                name: files for name, files in byName.items()
+                if name in plan.sampleIndex or name in keptGroups
+            }
+        return plan
+
+
+def filepaths(result):
+    '''Return a dict of file key -> filepath for a datasuper result.'''
+    return {fileRecName: fileRec.filepath() for fileRecName, fileRec in result.files()}
@@ -0,0 +1,235 @@
+'''A content addressed cache of module outputs shared between repos.
+
+Each job of a module rule gets a key from
+    the pipeline name and version, the module snakefile text and the
+        resolved module config (see `PipelineInstance.getResultCacheConf`),
+    the sha256 of the content of each input file,
+    the params and wildcards of the job.
+If the key is in the cache the outputs are hardlinked (or copied) from
+it and the job is not run. Otherwise the job runs and its outputs are
+added to the cache. Once the cache is larger than its budget the least
+recently used entries are evicted. Errors of the cache never fail a job,
+a cached object that disappears is a miss and a job whose outputs can
+not be added is logged.
+
+Hardlinked outputs share their content with the cache so they must not
+be changed in place.
+
+The index, per module stats and the digests of input files are kept in
+a `StateStore` in the cache dir so several runs and repos can share it.
+This file is imported by master snakefiles so it may only import from
+the standard library and from modules of this package that do the same.
+'''
+
+import os
+import sys
+import json
+import shutil
+import os.path
+from time import time
+from uuid import uuid4
+from hashlib import sha256
+from functools import wraps
+
+from .state_store import StateStore
+from .result_verify import DigestCache, hashFile
+
+
+STAT_NAMES = ['hits', 'misses', 'stored', 'evicted', 'bytes_restored']
+
+
+def staticKey(pipelineName, pipelineVersion, module, snakefileText, moduleConf):
+    '''Return the part of a cache key that is the same for every job of a module.'''
+    blob = json.dumps([pipelineName, pipelineVersion, module, snakefileText, moduleConf],
+                      sort_keys=True, default=str)
+    return sha256(blob.encode('utf-8')).hexdigest()
+
+
+def _namedItems(namedList):
+    try:
+        return sorted((str(key), str(val)) for key, val in namedList.items())
+    except AttributeError:
+        return [str(val) for val in namedList]
+
+
+class ResultCache:
+    '''Module outputs keyed by their inputs, under `root`.
+
+    Args:
+        root (str): The cache dir.
+        maxBytes (:obj:`int`, optional): Evict entries once the cache
+            holds more than this. Defaults to no limit.
+        link (:obj:`str`, optional): 'hardlink' (falls back to copying
+            across filesystems) or 'copy'. Defaults to 'hardlink'.
+    '''
+
+    def __init__(self, root, maxBytes=None, link='hardlink'):
+        self.root = root
+        self.maxBytes = maxBytes
+        self.link = link
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.store = StateStore(os.path.join(root, 'cache.sqlite'))
+        self.index = self.store.table('entries')
+        self.stats = self.store.table('stats')
+        self.digests = DigestCache(self.store)
+
+    @classmethod
+    def fromConfig(ctype, cacheConf):
+        '''Return the cache for the 'result_cache' section of a master config.'''
+        return ctype(cacheConf['root'],
+                     maxBytes=cacheConf.get('max_bytes'),
+                     link=cacheConf.get('link', 'hardlink'))
+
+    def objectDir(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def fingerprint(self, path):
+        '''Return the sha256 of the content of a file, cached by stat.'''
+        stat = os.stat(path)
+        cached = self.digests.lookup(path, stat)
+        if cached is not None:
+            return cached[1]
+        head, full = hashFile(path)
+        self.digests.update([(path, stat, None, head, full)])
+        return full
+
+    def jobKey(self, static, inputs, params=(), wildcards=(), rule=''):
+        '''Return the key of a job or None if it can not be cached.
+
+        `rule` is the name of the rule of the job, so that rules of one
+        module with the same inputs get different keys. Jobs with an
+        input that is missing or not a regular file are not cached.
+        '''
+        key = sha256(static.encode('utf-8'))
+        for path in inputs:
+            path = os.path.abspath(path)
+            if not os.path.isfile(path):
+                return None
+            key.update(self.fingerprint(path).encode('utf-8'))
+        extra = json.dumps([rule, _namedItems(params), _namedItems(wildcards)], default=str)
+        key.update(extra.encode('utf-8'))
+        return key.hexdigest()
+
+    def _linkOrCopy(self, src, dest):
+        if self.link == 'hardlink':
+            try:
+                os.link(src, dest)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(src, dest)
+
+    def _place(self, src, dest):
+        if os.path.lexists(dest):
+            os.remove(dest)
+        destDir = os.path.dirname(dest)
+        if destDir:
+            os.makedirs(destDir, exist_ok=True)
+        self._linkOrCopy(src, dest)
+        os.utime(dest)  # so outputs are newer than their inputs
+
+    def restore(self, key, outputs, module):
+        '''Put the cached outputs of `key` in place. Return True on a hit.
+
+        Objects may be evicted by another job at any time, failing to
+        place them is a miss.
+        '''
+        entry = self.index.get(key)
+        objDir = self.objectDir(key)
+        srcs = [os.path.join(objDir, str(i)) for i in range(len(outputs))]
+        if entry is None or entry['files'] != len(outputs):
+            self.bump(module, misses=1)
+            return False
+        try:
+            for src, dest in zip(srcs, outputs):
+                self._place(src, dest)
+        except OSError:
+            self.bump(module, misses=1)
+            return False
+        with self.store.transaction():
+            if key in self.index:
+                entry['last_used'] = time()
+                self.index[key] = entry
+        self.bump(module, hits=1, bytes_restored=entry['size'])
+        return True
+
+    def add(self, key, outputs, module):
+        '''Add the outputs of a finished job to the cache.
+
+        Return False if an output is not a regular file.
+        '''
+        if not all(os.path.isfile(out) and not os.path.islink(out) for out in outputs):
+            return False
+        objDir = self.objectDir(key)
+        tmpDir = os.path.join(self.root, 'objects', 'tmp_{}'.format(uuid4().hex))
+        os.makedirs(tmpDir)
+        size = 0
+        for i, out in enumerate(outputs):
+            dest = os.path.join(tmpDir, str(i))
+            self._linkOrCopy(out, dest)
+            size += os.stat(dest).st_size
+        os.makedirs(os.path.dirname(objDir), exist_ok=True)
+        try:
+            os.rename(tmpDir, objDir)
+        except OSError:
+            shutil.rmtree(tmpDir, ignore_errors=True)  # added by another job
+        now = time()
+        self.index[key] = {'module': module, 'size': size, 'files': len(outputs),
+                           'created': now, 'last_used': now}
+        self.bump(module, stored=1)
+        self.evict()
+        return True
+
+    def evict(self, maxBytes=None):
+        '''Remove least recently used entries until the cache fits its budget.
+
+        Return the number of entries removed.
+        '''
+        maxBytes = self.maxBytes if maxBytes is None else maxBytes
+        if maxBytes is None:
+            return 0
+        evicted = []
+        with self.store.transaction():
+            entries = self.index.items()
+            total = sum(entry['size'] for _, entry in entries)
+            for key, entry in sorted(entries, key=lambda item: item[1]['last_used']):
+                if total <= maxBytes:
+                    break
+                if key not in self.index:
+                    continue  # evicted by another job
+                del self.index[key]
+                total -= entry['size']
+                evicted.append((key, entry))
+                self.bump(entry['module'], evicted=1)
+        for key, _ in evicted:
+            shutil.rmtree(self.objectDir(key), ignore_errors=True)
+        return len(evicted)
+
+    def bump(self, module, **counts):
+        with self.store.transaction():
+            stats = self.stats.get(module, {name: 0 for name in STAT_NAMES})
+            for name, count in counts.items():
+                stats[name] = stats.get(name, 0) + count
+            self.stats[module] = stats
+
+    def size(self):
+        return sum(entry['size'] for entry in self.index.values())
+
+    def wrapRunFunc(self, run, module, static, rule):
+        '''Return a snakemake run function of `rule` that uses this cache.'''
+
+        @wraps(run)
+        def cachedRun(input, output, params, wildcards, *args):
+            key = self.jobKey(static, input, params, wildcards, rule=rule)
+            if key is not None and self.restore(key, list(output), module):
+                return
+            run(input, output, params, wildcards, *args)
+            if key is None:
+                return
+            try:
+                self.add(key, list(output), module)
+            except Exception as exc:
+                print('[ModuleUltra] Could not add outputs of {} to the result cache: {}'
+                      .format(rule, exc), file=sys.stderr)
+
+        return cachedRun
@@ -0,0 +1,223 @@
+import os
+import os.path
+import io
+import json
+import time
+import shutil
+import tarfile
+import zipfile
+import subprocess as sp
+from hashlib import sha256
+from queue import Queue
+from threading import Thread
+
+
+MANIFEST_NAME = 'MANIFEST.json'
+GROUP_RESULT_DIR = 'group_result'
+
+
+class ExportEntry:
+    '''One file to put in an export archive.'''
+
+    __slots__ = ['arcname', 'path', 'resultName', 'resultType', 'fileKey']
+
+    def __init__(self, arcname, path, resultName, resultType, fileKey):
+        self.arcname = arcname
+        self.path = path
+        self.resultName = resultName
+        self.resultType = resultType
+        self.fileKey = fileKey
+
+
+def groupEntries(group, resultTypes=None):
+    '''Yield an `ExportEntry` for every file of a sample group record.
+
+    Files go under <group>/<sample>/ and the files of the group itself
+    under <group>/group_result/. If `resultTypes` is given only results
+    of those types are exported.
+    '''
+    def entries(results, prefix):
+        for result in results:
+            resultType = result.resultType()
+            if resultTypes is not None and resultType not in resultTypes:
+                continue
+            for fileKey, fileRec in result.files():
+                path = fileRec.filepath()
+                arcname = os.path.join(prefix, os.path.basename(path))
+                yield ExportEntry(arcname, path, result.name, resultType, fileKey)
+
+    for sample in group.allSamples():
+        yield from entries(sample.results(), os.path.join(group.name, sample.name))
+    yield from entries(group.directResults(),
+                       os.path.join(group.name, GROUP_RESULT_DIR))
+
+
+class ReadAhead:
+    '''Read files in a background thread a bounded amount ahead of a writer.
+
+    At most `maxChunks` chunks of `chunkSize` bytes are held in memory
+    at once so reading the next files overlaps with compressing and
+    writing the current one without staging anything on disk.
+    '''
+
+    def __init__(self, paths, chunkSize=1024 * 1024, maxChunks=16):
+        self.paths = paths
+        self.chunkSize = chunkSize
+        self.queue = Queue(maxsize=maxChunks)
+        self.reader = Thread(target=self._readAll, daemon=True)
+        self.reader.start()
+
+    def _readAll(self):
+        try:
+            for path in self.paths:
+                with open(path, 'rb') as f:
+                    while True:
+                        chunk = f.read(self.chunkSize)
+                        if not chunk:
+                            break
+                        self.queue.put(chunk)
+                self.queue.put(None)
+        except Exception as exc:
+            self.queue.put(exc)
+
+    def nextFile(self):
+        '''Return a file like object for the next file in `paths`.'''
+        return _QueuedFile(self.queue)
+
+
+class _QueuedFile:
+    '''Read one file out of a `ReadAhead` queue, hashing it on the way.'''
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.chunk = b''
+        self.pos = 0
+        self.done = False
+        self.digest = sha256()
+        self.size = 0
+
+    def _nextChunk(self):
+        chunk = self.queue.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        if chunk is None:
+            self.done = True
+            return b''
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.pos >= len(self.chunk):
+                if self.done:
+                    break
+                self.chunk, self.pos = self._nextChunk(), 0
+                continue
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.pos + size)
+            parts.append(self.chunk[self.pos:end])
+            if size > 0:
+                size -= end - self.pos
+            self.pos = end
+        return b''.join(parts)
+
+    def drain(self):
+        '''Read to the end of the file and return the hex digest.'''
+        while not self.done:
+            self._nextChunk()
+        return self.digest.hexdigest()
+
+
+class ArchiveWriter:
+    '''Write files to a tar or zip stream.
+
+    `compress` is one of 'none', 'gzip' or 'pigz'. For tar, 'pigz' pipes
+    the stream through pigz to compress on `threads` cores. Zip members
+    are always deflated unless `compress` is 'none'. `close` raises
+    `CalledProcessError` if pigz fails.
+    '''
+
+    def __init__(self, outfile, fmt='tar', compress='none', threads=1):
+        self.fmt = fmt
+        self.proc = None
+        self.closeOut = type(outfile) == str
+        if self.closeOut:
+            outfile = open(outfile, 'wb')
+        self.outfile = outfile
+        self.out = outfile
+        if compress == 'pigz' and fmt == 'tar':
+            self.proc = sp.Popen(['pigz', '-p', str(threads)],
+                                 stdin=sp.PIPE, stdout=outfile)
+            self.out = self.proc.stdin
+
+        if fmt == 'tar':
+            mode = 'w|gz' if compress == 'gzip' else 'w|'
+            self.archive = tarfile.open(fileobj=self.out, mode=mode)
+        elif fmt == 'zip':
+            method = zipfile.ZIP_STORED if compress == 'none' else zipfile.ZIP_DEFLATED
+            self.archive = zipfile.ZipFile(self.out, mode='w', compression=method,
+                                           allowZip64=True)
+        else:
+            raise ValueError('Unknown archive format: {}'.format(fmt))
+
+    def add(self, arcname, fileobj, size, mtime):
+        '''Add `size` bytes from `fileobj` as `arcname`.'''
+        if self.fmt == 'tar':
+            info = tarfile.TarInfo(arcname)
+            info.size = size
+            info.mtime = mtime
+            info.mode = 0o644
+            self.archive.addfile(info, fileobj)
+        else:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime(mtime)[:6])
+            info.compress_type = self.archive.compression
+            info.file_size = size
+            with self.archive.open(info, mode='w', force_zip64=True) as member:
+                shutil.copyfileobj(fileobj, member, 1024 * 1024)
+
+    def addBytes(self, arcname, data):
+        self.add(arcname, io.BytesIO(data), len(data), time.time())
+
+    def close(self):
+        self.archive.close()
+        returncode = 0
+        if self.proc:
+            self.proc.stdin.close()
+            returncode = self.proc.wait()
+        if self.closeOut:
+            self.outfile.close()
+        if returncode != 0:
+            raise sp.CalledProcessError(returncode, self.proc.args)
+
+
+def exportResults(entries, writer, chunkSize=1024 * 1024, maxChunks=16):
+    '''Stream the files of `entries` into an `ArchiveWriter`.
+
+    Files are read once, in the background, and hashed as they are
+    written. A manifest of every file, its result and its sha256 is
+    added at the end of the archive.
+
+    Return the manifest.
+    '''
+    entries = list(entries)
+    stats = [os.stat(entry.path) for entry in entries]
+    readAhead = ReadAhead([entry.path for entry in entries],
+                          chunkSize=chunkSize, maxChunks=maxChunks)
+    manifest = []
+    for entry, stat in zip(entries, stats):
+        fileobj = readAhead.nextFile()
+        writer.add(entry.arcname, fileobj, stat.st_size, stat.st_mtime)
+        checksum = fileobj.drain()
+        if fileobj.size != stat.st_size:
+            raise IOError('{} changed size during export'.format(entry.path))
+        manifest.append({
+            'path': entry.arcname,
+            'result': entry.resultName,
+            'result_type': entry.resultType,
+            'file_key': entry.fileKey,
+            'size': stat.st_size,
+            'sha256': checksum,
+        })
+    writer.addBytes(MANIFEST_NAME, json.dumps(manifest, indent=4).encode('utf-8'))
+    return manifest
@@ -0,0 +1,142 @@
+import os
+import os.path
+import gzip
+import shutil
+from fnmatch import fnmatchcase
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_KEEP_PATTERNS = ['*.timing', '*.flag.registered']
+
+
+def moduleOf(dirName, fname):
+    '''Return the module a file in a sample or group dir belongs to.
+
+    Result files are named <sample or group>.<module>.<...> so the
+    module is the field after the dir name, or 'unknown'.
+    '''
+    prefix = dirName + '.'
+    if not fname.startswith(prefix):
+        return 'unknown'
+    module = fname[len(prefix):].split('.')[0]
+    return module or 'unknown'
+
+
+def compressFile(path):
+    '''Gzip `path` in place. Return the number of bytes saved.
+
+    If `path`.gz already exists nothing is changed and None is returned.
+    '''
+    gzPath = path + '.gz'
+    if os.path.lexists(gzPath):
+        return None
+    before = os.stat(path).st_size
+    tmpPath = gzPath + '.mu_gc_tmp'
+    with open(path, 'rb') as src, gzip.open(tmpPath, 'wb') as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+    try:
+        os.link(tmpPath, gzPath)  # unlike a rename, never replaces gzPath
+    except FileExistsError:
+        return None
+    finally:
+        os.remove(tmpPath)
+    os.remove(path)
+    return before - os.stat(gzPath).st_size
+
+
+class GarbageCollector:
+    '''Find and clean up files in the result dir that nothing refers to.
+
+    A file in a sample or group dir is referenced if it is the file of
+    a datasuper file record, if it matches the result file pattern of a
+    pipeline in the repo (it may be registered soon) or if it matches
+    one of `keepPatterns`. Anything else was left behind by a module.
+
+    Dirs in `skipDirs`, e.g. samples claimed by a running run, and
+    hidden dirs are never touched.
+    '''
+
+    def __init__(self, resultDir, referenced, resultPatterns,
+                 keepPatterns=None, skipDirs=None):
+        self.resultDir = resultDir
+        self.referenced = {os.path.realpath(path) for path in referenced}
+        self.resultPatterns = resultPatterns
+        if keepPatterns is None:
+            keepPatterns = DEFAULT_KEEP_PATTERNS
+        self.keepPatterns = keepPatterns
+        self.skipDirs = set(skipDirs) if skipDirs else set()
+
+    def expectedNames(self, dirName):
+        '''Return the names of result files a dir may hold.'''
+        names = set()
+        for pattern in self.resultPatterns:
+            path = pattern.format(sample_name=dirName, group_name=dirName)
+            if os.path.dirname(path) == dirName:
+                names.add(os.path.basename(path))
+        return names
+
+    def scanDir(self, dirName):
+        '''Return a list of (path, module, size) of unreferenced files in a dir.'''
+        expected = self.expectedNames(dirName)
+        garbage = []
+        dirPath = os.path.join(self.resultDir, dirName)
+        for dirpath, dirnames, filenames in os.walk(dirPath):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for fname in filenames:
+                path = os.path.join(dirpath, fname)
+                if dirpath == dirPath and fname in expected:
+                    continue
+                if any(fnmatchcase(fname, pattern) for pattern in self.keepPatterns):
+                    continue
+                if os.path.realpath(path) in self.referenced:
+                    continue
+                try:
+                    size = os.lstat(path).st_size
+                except FileNotFoundError:
+                    continue
+                garbage.append((path, moduleOf(dirName, fname), size))
+        return garbage
+
+    def dirNames(self):
+        '''Return the sample and group dirs in the result dir.'''
+        return sorted(
+            name for name in os.listdir(self.resultDir)
+            if not name.startswith('.') and name not in self.skipDirs and
+            os.path.isdir(os.path.join(self.resultDir, name))
+        )
+
+    def collect(self, action='report', jobs=1):
+        '''Find unreferenced files and report, 'delete' or 'compress' them.
+
+        Dirs are handled in parallel by `jobs` threads. Return a dict of
+        module -> {'files', 'bytes', 'freed', 'skipped'} and a list of the
+        files. Files that could not be compressed because a .gz of the
+        same name exists are counted as skipped.
+        '''
+        def handleDir(dirName):
+            garbage = self.scanDir(dirName)
+            out = []
+            for path, module, size in garbage:
+                freed = 0
+                if action == 'delete':
+                    os.remove(path)
+                    freed = size
+                elif action == 'compress' and not path.endswith('.gz'):
+                    freed = compressFile(path)
+                out.append((path, module, size, freed))
+            return out
+
+        totals, files = {}, []
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for handled in pool.map(handleDir, self.dirNames()):
+                for path, module, size, freed in handled:
+                    total = totals.setdefault(module, {'files': 0, 'bytes': 0,
+                                                       'freed': 0, 'skipped': 0})
+                    total['files'] += 1
+                    total['bytes'] += size
+                    if freed is None:
+                        total['skipped'] += 1
+                    else:
+                        total['freed'] += freed
+                    files.append(path)
+        return totals, files
@@ -1,6 +1,8 @@
 from .utils import getOrDefault
+import re
 import datasuper as ds
 from .snakemake_rule_builder import SnakemakeRuleBuilder
+from .pipeline_instance_snakemake_utils import addRuleResources
 from .snakemake_utils import *
 from .utils import (
     joinResultNameType,
@@ -26,6 +28,9 @@ class ResultSchema:
         self.level = getOrDefault(schema, 'LEVEL', 'SAMPLE')
         self.options = getOrDefault(schema, 'OPTIONS', [])
         self.no_register = 'NO_REGISTER' in self.options
+        self.clusterGroupSize = int(getOrDefault(schema, 'CLUSTER_GROUP_SIZE', 1))
+        self.threads = getOrDefault(schema, 'THREADS', None)
+        self.memMB = getOrDefault(schema, 'MEM_MB', None)
 
         self.snakeFilename = getOrDefault(schema, 'SNAKEMAKE', '{}.smk'.format(self.module))
         if not origin:
@@ -90,6 +95,7 @@ class ResultSchema:
                     sample = dsrepo.db.sampleTable.get(sampleName)
                     sample.addResult(params.dsResultName)
                     sample.save(modify=True)
+                    recordResultInManifest(sample, result)
 
                 outStr = ' '.join(output)
                 shell('touch '+outStr)
@@ -189,6 +195,8 @@ class ResultSchema:
         snakefileStr = open(self.snakeFilepath).read()
         if self.isOrigin():
             snakefileStr = self.editOrigins(snakefileStr)
+        if self.threads or self.memMB:
+            snakefileStr = self.addResources(snakefileStr)
         if self.benchmark:
             snakefileStr = self.addBenchmark(snakefileStr)
         if not self.no_register:
@@ -198,6 +206,13 @@ class ResultSchema:
     def isOrigin(self):
         return self.origin
 
+    def ruleNames(self):
+        '''Return the names of the rules in the module snakefile.'''
+        if self.isOrigin():
+            return []
+        snakefileStr = open(self.snakeFilepath).read()
+        return re.findall(r'^\s*rule\s+(\w+)\s*:', snakefileStr, flags=re.MULTILINE)
+
     def _makeFilePattern(self, fname, ext):
         if self.level == 'SAMPLE':
             return '{{sample_name}}/{{sample_name}}.{}.{}.{}'.format(self.module, fname, ext)
@@ -205,6 +220,10 @@ class ResultSchema:
             return '{{group_name}}/{{group_name}}.{}.{}.{}'.format(self.module, fname, ext)
         assert False, f'Bad level for {self.name} {fname}'
 
+    def addResources(self, snakefileStr):
+        '''Give each rule the THREADS and MEM_MB of the pipeline definition.'''
+        return addRuleResources(snakefileStr, threads=self.threads, memMB=self.memMB)
+
     def addBenchmark(self, snakefileStr):
         """Hack."""
 
@@ -249,5 +268,15 @@ class ResultSchema:
                 conf[self.module] = {fname: fpattern}
         return conf
 
+    def getResultFilePatterns(self):
+        '''Return the patterns of every file this result makes, flag included.'''
+        if self.isOrigin():
+            return []
+        dsRepo = ds.Repo.loadRepo()
+        patterns = [self._makeFilePattern(fname, dsRepo.getFileTypeExt(ftype))
+                    for fname, ftype in self.files.items()]
+        patterns.append(self.getOutputFilePattern())
+        return patterns
+
     def getOutputFilePattern(self):
         return self._makeFilePattern('flag', 'registered')
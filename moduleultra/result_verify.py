@@ -0,0 +1,162 @@
+import os
+from hashlib import sha256
+from concurrent.futures import ProcessPoolExecutor
+
+
+HEAD_SIZE = 4096  # datasuper checksums the first 4096 bytes of a file
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def hashFile(path, blockSize=BLOCK_SIZE):
+    '''Return the sha256 of the head of a file and of the whole file.
+
+    The head digest is comparable to the checksum datasuper keeps for
+    a file record. Both are computed in one read of the file.
+    '''
+    head, full = sha256(), sha256()
+    with open(path, 'rb') as f:
+        block = f.read(max(blockSize, HEAD_SIZE))
+        head.update(block[:HEAD_SIZE])
+        while block:
+            full.update(block)
+            block = f.read(blockSize)
+    return head.hexdigest(), full.hexdigest()
+
+
+def statKey(stat):
+    '''Return the parts of a stat result that tell if a file changed.'''
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+class DigestCache:
+    '''Digests of files keyed by path, valid while (inode, size, mtime) hold.
+
+    Backed by a table in a `StateStore`. Use `lookup` to get a digest
+    that is still valid, `previous` for the last known digest of a path
+    whether or not it changed since, and `update` to save new digests.
+    '''
+
+    tableName = 'file_digests'
+
+    def __init__(self, store):
+        self.store = store
+        self.table = store.table(DigestCache.tableName)
+
+    def previous(self, path):
+        return self.table.get(path)
+
+    def lookup(self, path, stat):
+        '''Return the cached (head, full) digests of `path` or None.'''
+        cached = self.table.get(path)
+        if cached is None or cached['stat'] != statKey(stat):
+            return None
+        return cached['head'], cached['sha256']
+
+    def update(self, digests):
+        '''Save a list of (path, stat, registered checksum, head digest, full digest).'''
+        with self.store.transaction():
+            for path, stat, checksum, head, full in digests:
+                self.table[path] = {'stat': statKey(stat),
+                                    'checksum': checksum,
+                                    'head': head,
+                                    'sha256': full}
+
+
+class VerifyReport:
+    '''Counts of good files and lists of bad ones, per endpoint.'''
+
+    def __init__(self):
+        self.endpoints = {}
+
+    def _forEndpoint(self, endpoint):
+        return self.endpoints.setdefault(endpoint, {'ok': 0,
+                                                    'missing': [],
+                                                    'altered': []})
+
+    def ok(self, endpoint):
+        self._forEndpoint(endpoint)['ok'] += 1
+
+    def missing(self, endpoint, path):
+        self._forEndpoint(endpoint)['missing'].append(path)
+
+    def altered(self, endpoint, path):
+        self._forEndpoint(endpoint)['altered'].append(path)
+
+    def isClean(self):
+        return not any(report['missing'] or report['altered']
+                       for report in self.endpoints.values())
+
+
+def verifyFiles(files, cache, jobs=1, rehash=False):
+    '''Check that files exist and are unchanged. Return a `VerifyReport`.
+
+    `files` is an iterable of (endpoint, path, registered checksum). A
+    file is altered if the head of it does not match its registered
+    checksum or if its content changed since it was last verified
+    (and it was not registered again since).
+    Files whose (inode, size, mtime) match the cache are not read
+    again unless `rehash` is True. Other files are hashed by a pool of
+    `jobs` processes.
+
+    Digests of altered files are not cached so they are reported
+    until they are fixed.
+    '''
+    report = VerifyReport()
+    toHash = []
+    for endpoint, path, checksum in files:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            report.missing(endpoint, path)
+            continue
+        cached = None if rehash else cache.lookup(path, stat)
+        if cached is None:
+            toHash.append((endpoint, path, checksum, stat))
+        elif checksum and cached[0] != checksum:
+            report.altered(endpoint, path)
+        else:
+            report.ok(endpoint)
+
+    newDigests = []
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        paths = [path for _, path, _, _ in toHash]
+        chunksize = max(1, len(paths) // (16 * max(1, jobs)))
+        digests = pool.map(_safeHash, paths, chunksize=chunksize)
+        for (endpoint, path, checksum, stat), digest in zip(toHash, digests):
+            if digest is None:
+                report.missing(endpoint, path)
+                continue
+            head, full = digest
+            previous = cache.previous(path)
+            if checksum and head != checksum:
+                report.altered(endpoint, path)
+            elif (previous and previous['checksum'] == checksum and
+                  previous['sha256'] != full):
+                report.altered(endpoint, path)
+            else:
+                report.ok(endpoint)
+                newDigests.append((path, stat, checksum, head, full))
+    cache.update(newDigests)
+    return report
+
+
+def _safeHash(path):
+    try:
+        return hashFile(path)
+    except FileNotFoundError:
+        return None
+
+
+def registeredFiles(db, endpoints=None):
+    '''Yield (result type, path, checksum) for the file records of a repo.
+
+    If `endpoints` is given only results of those types are included.
+    Records are loaded one at a time.
+    '''
+    for _, loadResult in db.resultTable.getAllLazily():
+        result = loadResult()
+        resultType = result.resultType()
+        if endpoints is not None and resultType not in endpoints:
+            continue
+        for _, fileRec in result.files():
+            yield resultType, fileRec.filepath(), fileRec.checksum
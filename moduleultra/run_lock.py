@@ -0,0 +1,161 @@
+import os
+import os.path
+import json
+import fcntl
+import socket
+from hashlib import sha1
+from .errors import RunLockedError
+
+
+def makeRunId(pipelineName, pipelineVersion, sampleNames, groupNames):
+    '''Return an id for a run that is unique to this process.
+
+    The id starts with a digest of the pipeline and the sample set
+    so runs over the same data are easy to spot in the run dir.
+    '''
+    digest = sha1()
+    digest.update(pipelineName.encode('utf-8'))
+    digest.update(str(pipelineVersion).encode('utf-8'))
+    for name in sorted(sampleNames):
+        digest.update(b'\0s' + name.encode('utf-8'))
+    for name in sorted(groupNames):
+        digest.update(b'\0g' + name.encode('utf-8'))
+    return '{}_{}'.format(digest.hexdigest()[:12], os.getpid())
+
+
+class RunLock:
+    '''Claim a set of samples and groups for one run of a pipeline.
+
+    Snakemake locks the whole working directory which means only one
+    run can happen in a repo at a time. Since every sample writes to
+    its own subdirectory of the result dir runs over disjoint samples
+    (or of different pipelines) can safely go in parallel.
+
+    Claims for each pipeline are kept in a small JSON registry. The
+    registry is only read or written while holding an flock on a
+    sibling file so updates are atomic. Claims from dead processes
+    on this host are dropped when the registry is read.
+
+    Group results are made from the results of their samples so a run
+    over a group also claims the samples in `groupMembers`, a dict of
+    group name -> sample names.
+    '''
+
+    def __init__(self, lockDir, pipelineName, runId, sampleNames, groupNames,
+                 groupMembers=None):
+        self.lockDir = lockDir
+        self.pipelineName = pipelineName
+        self.runId = runId
+        self.sampleNames = set(sampleNames)
+        self.groupNames = set(groupNames)
+        for groupName in self.groupNames:
+            self.sampleNames |= set((groupMembers or {}).get(groupName, []))
+        self.held = False
+
+    def _registryPath(self):
+        return os.path.join(self.lockDir, '{}.json'.format(self.pipelineName))
+
+    def _guardPath(self):
+        return os.path.join(self.lockDir, '{}.lock'.format(self.pipelineName))
+
+    def _updateRegistry(self, func):
+        '''Call `func` on the live claims and save what it returns.'''
+        os.makedirs(self.lockDir, exist_ok=True)
+        with open(self._guardPath(), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            try:
+                claims = readClaims(self._registryPath())
+                claims = func(claims)
+                tmpPath = self._registryPath() + '.tmp'
+                with open(tmpPath, 'w') as tmp:
+                    json.dump(claims, tmp)
+                os.replace(tmpPath, self._registryPath())
+            finally:
+                fcntl.flock(guard, fcntl.LOCK_UN)
+
+    def acquire(self):
+        '''Claim the samples and groups of this run.
+
+        Raises `RunLockedError` if another live run of the same
+        pipeline has claimed any of them.
+        '''
+        def claim(claims):
+            for runId, other in claims.items():
+                overlap = self.sampleNames & set(other['samples'])
+                overlap |= self.groupNames & set(other['groups'])
+                if overlap:
+                    raise RunLockedError(runId, sorted(overlap))
+            claims[self.runId] = {
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'samples': sorted(self.sampleNames),
+                'groups': sorted(self.groupNames),
+            }
+            return claims
+
+        self._updateRegistry(claim)
+        self.held = True
+        return self
+
+    def release(self):
+        '''Drop the claims of this run.'''
+        if not self.held:
+            return
+
+        def unclaim(claims):
+            claims.pop(self.runId, None)
+            return claims
+
+        self._updateRegistry(unclaim)
+        self.held = False
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+    @staticmethod
+    def clear(lockDir, pipelineName):
+        '''Remove every claim for a pipeline, live or not.'''
+        registry = os.path.join(lockDir, '{}.json'.format(pipelineName))
+        if os.path.isfile(registry):
+            os.remove(registry)
+
+
+def readClaims(registryPath):
+    '''Return the claims in a registry that belong to live processes.'''
+    try:
+        with open(registryPath) as registry:
+            claims = json.load(registry)
+    except (FileNotFoundError, ValueError):
+        return {}
+    host = socket.gethostname()
+    return {
+        runId: claim
+        for runId, claim in claims.items()
+        if claim['host'] != host or _pidIsAlive(claim['pid'])
+    }
+
+
+def claimedNames(lockDir):
+    '''Return the names of samples and groups claimed by any live run.'''
+    names = set()
+    if not os.path.isdir(lockDir):
+        return names
+    for fname in os.listdir(lockDir):
+        if not fname.endswith('.json'):
+            continue
+        for claim in readClaims(os.path.join(lockDir, fname)).values():
+            names |= set(claim['samples']) | set(claim['groups'])
+    return names
+
+
+def _pidIsAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
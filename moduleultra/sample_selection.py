@@ -0,0 +1,108 @@
+import re
+from fnmatch import fnmatchcase
+
+
+class SampleSelection:
+    '''Pick samples by name, name pattern, sample type and group.
+
+    Selections work on raw datasuper records (plain dicts) and names so
+    choosing a few samples from a big repo never builds a record object
+    for every sample. Use the resulting names with `getMany` to load only
+    the records that are needed.
+
+    All given criteria must match. Within one kind of criterion any value
+    may match, e.g. `patterns=['a*', 'b*']` selects names starting with
+    'a' or 'b'.
+    '''
+
+    def __init__(self, names=None, patterns=None, regexes=None,
+                 sampleTypes=None, groups=None):
+        self.names = names
+        self.patterns = list(patterns) if patterns else []
+        self.regexes = [re.compile(regex) for regex in regexes] if regexes else []
+        self.sampleTypes = set(sampleTypes) if sampleTypes else set()
+        self.groups = list(groups) if groups else []
+
+    def isEmpty(self):
+        '''Return True if this selection does not filter anything.'''
+        return (self.names is None and
+                not (self.patterns or self.regexes or self.sampleTypes or self.groups))
+
+    def needsRecords(self):
+        '''Return True if names alone are not enough to resolve this selection.'''
+        return bool(self.patterns or self.regexes or self.sampleTypes or self.groups)
+
+    def matchesName(self, name):
+        '''Return True if `name` passes the pattern and regex filters.'''
+        if self.patterns and not any(fnmatchcase(name, pattern)
+                                     for pattern in self.patterns):
+            return False
+        if self.regexes and not any(regex.search(name) for regex in self.regexes):
+            return False
+        return True
+
+    def resolve(self, db):
+        '''Yield the names of selected samples in datasuper database `db`.
+
+        If only names are given each name is checked against the index
+        of the sample table, names are read lazily so `names` may be an
+        open file or any other iterable. Otherwise the raw sample records
+        are scanned once.
+        '''
+        if self.isEmpty():
+            yield from rawNames(db.sampleTable)
+            return
+        if not self.needsRecords():
+            for name in self.names:
+                name = name.strip()
+                if name and db.sampleTable.exists(name):
+                    yield name
+            return
+
+        members = None
+        if self.groups:
+            members = groupMembers(db.sampleGroupTable.getAllRaw(), self.groups)
+        names = None
+        if self.names is not None:
+            names = {name.strip() for name in self.names if name.strip()}
+
+        for rawSample in db.sampleTable.getAllRaw():
+            name = rawSample['name']
+            if names is not None and name not in names:
+                continue
+            if self.sampleTypes and rawSample['sample_type'] not in self.sampleTypes:
+                continue
+            if members is not None and not ({name, rawSample['primary_key']} & members):
+                continue
+            if self.matchesName(name):
+                yield name
+
+
+def groupMembers(rawGroups, groupNames):
+    '''Return the keys of every sample in the named groups.
+
+    Subgroups are followed recursively. Keys are whatever the raw
+    records store, primary keys or names, so check both.
+    '''
+    byKey = {}
+    for rawGroup in rawGroups:
+        byKey[rawGroup['name']] = rawGroup
+        byKey[rawGroup['primary_key']] = rawGroup
+
+    members, seen = set(), set()
+    stack = [byKey[name] for name in groupNames if name in byKey]
+    while stack:
+        rawGroup = stack.pop()
+        if rawGroup['primary_key'] in seen:
+            continue
+        seen.add(rawGroup['primary_key'])
+        members |= set(rawGroup.get('direct_samples', []))
+        for subgroup in rawGroup.get('subgroups', []):
+            if subgroup in byKey:
+                stack.append(byKey[subgroup])
+    return members
+
+
+def rawNames(table):
+    '''Return the names of every record in a datasuper table.'''
+    return [rawRec['name'] for rawRec in table.getAllRaw()]
@@ -0,0 +1,193 @@
+'''Give each job its own scratch dir under a shared root with a disk budget.
+
+Master snakefiles set a shell prefix (see `scratchShellPrefix`) that
+runs this file as a script before every shell job:
+
+    enter   make a scratch dir for the job, waiting while the scratch
+            root is over budget, and print its path. The job gets it
+            as $TMPDIR.
+    leave   on exit, record how much the dir holds in the usage log
+            and remove it if the job succeeded. Dirs of failed jobs
+            are kept to help debugging but do not count against the
+            budget.
+
+Run blocks can use `ScratchManager.job` directly.
+
+This file is run for every job so it may only import from the
+standard library and from modules of this package that do the same.
+'''
+
+import os
+import os.path
+import sys
+import json
+import fcntl
+import shlex
+import shutil
+import socket
+import tempfile
+from time import sleep, time
+from contextlib import contextmanager
+from .origin_staging import dirSize
+
+
+SCRATCH_PREFIX = 'mu_scratch_'
+START_FILE = '.mu_scratch_started'
+FAILED_FILE = '.mu_scratch_failed'
+
+
+class ScratchManager:
+    '''Hand out scratch dirs under `root` and track what they use.
+
+    If `budget` (bytes) is set a new dir is only handed out once
+    the dirs of running jobs under `root` are smaller than the budget,
+    or after `maxWait` seconds. Usage of each dir is appended to `usageLog`
+    as a line of JSON when the dir is given back.
+    '''
+
+    def __init__(self, root, budget=None, usageLog=None,
+                 maxWait=3600, pollInterval=5):
+        self.root = root
+        self.budget = budget
+        self.usageLog = usageLog
+        self.maxWait = maxWait
+        self.pollInterval = pollInterval
+
+    def usedBytes(self):
+        '''Return the bytes held by scratch dirs that are not from failed jobs.'''
+        total = 0
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            if not os.path.exists(os.path.join(path, FAILED_FILE)):
+                total += dirSize(path)
+        return total
+
+    def waitForBudget(self):
+        '''Wait until the scratch root is under budget.
+
+        Return False if it gave up waiting.
+        '''
+        if not self.budget:
+            return True
+        start = time()
+        while self.usedBytes() >= self.budget:
+            if (time() - start) >= self.maxWait:
+                return False
+            sleep(self.pollInterval)
+        return True
+
+    def enter(self, name='job'):
+        '''Make a new scratch dir and return its path.'''
+        os.makedirs(self.root, exist_ok=True)
+        if not self.waitForBudget():
+            print('[ModuleUltra] Scratch over budget, starting {} anyway'.format(name),
+                  file=sys.stderr)
+        path = tempfile.mkdtemp(prefix='{}{}_'.format(SCRATCH_PREFIX, name),
+                                dir=self.root)
+        with open(os.path.join(path, START_FILE), 'w') as startFile:
+            startFile.write(str(time()))
+        return path
+
+    def leave(self, path, success=True):
+        '''Record the usage of a scratch dir and remove it on success.
+
+        Dirs of failed jobs are marked so they no longer count against
+        the budget.
+        '''
+        size = dirSize(path)
+        try:
+            with open(os.path.join(path, START_FILE)) as startFile:
+                seconds = time() - float(startFile.read())
+        except (FileNotFoundError, ValueError):
+            seconds = None
+        self.recordUsage({
+            'dir': os.path.basename(path),
+            'host': socket.gethostname(),
+            'bytes': size,
+            'seconds': seconds,
+            'success': success,
+            'time': time(),
+        })
+        if success:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            open(os.path.join(path, FAILED_FILE), 'w').close()
+        return size
+
+    def recordUsage(self, usage):
+        if not self.usageLog:
+            return
+        os.makedirs(os.path.dirname(self.usageLog), exist_ok=True)
+        with open(self.usageLog, 'a') as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                log.write(json.dumps(usage) + '\n')
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+    @contextmanager
+    def job(self, name='job'):
+        '''Yield a scratch dir that is removed if the block succeeds.'''
+        path = self.enter(name)
+        try:
+            yield path
+        except BaseException:
+            self.leave(path, success=False)
+            raise
+        self.leave(path)
+
+    @classmethod
+    def fromConfig(ctype, scratchConf):
+        '''Return a manager for the 'scratch' section of a master config.'''
+        return ctype(scratchConf['root'],
+                     budget=scratchConf.get('budget'),
+                     usageLog=scratchConf.get('usage_log'))
+
+    @classmethod
+    def fromEnv(ctype):
+        '''Return a manager set up by the shell prefix.'''
+        budget = os.environ.get('MU_SCRATCH_BUDGET')
+        return ctype(os.environ['MU_SCRATCH_ROOT'],
+                     budget=int(budget) if budget else None,
+                     usageLog=os.environ.get('MU_SCRATCH_LOG') or None)
+
+
+def scratchShellPrefix(scratchConf):
+    '''Return a snakemake shell prefix that runs each job in a scratch dir.
+
+    It starts with snakemake's default prefix, 'set -euo pipefail; ',
+    which setting a prefix replaces. The prefix has no braces so
+    snakemake can format it as is.
+    '''
+    env = {
+        'MU_SCRATCH_PYTHON': sys.executable,
+        'MU_SCRATCH_ROOT': scratchConf['root'],
+        'MU_SCRATCH_BUDGET': str(scratchConf.get('budget') or ''),
+        'MU_SCRATCH_LOG': scratchConf.get('usage_log') or '',
+    }
+    prefix = 'set -euo pipefail; '
+    for key, val in env.items():
+        prefix += 'export {}={}; '.format(key, shlex.quote(val))
+    script = '"$MU_SCRATCH_PYTHON" -m moduleultra.scratch'
+    prefix += 'export TMPDIR="$({} enter)"; '.format(script)
+    prefix += 'trap \'{} leave "$TMPDIR" $?\' EXIT; '.format(script)
+    return prefix
+
+
+def main(args):
+    manager = ScratchManager.fromEnv()
+    if args[0] == 'enter':
+        print(manager.enter(*args[1:2]))
+    elif args[0] == 'leave':
+        manager.leave(args[1], success=(args[2] == '0'))
+    else:
+        print('Unknown command: {}'.format(args[0]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,10 +1,19 @@
 import datasuper as ds
 from os.path import isfile
+from .origin_staging import stagedOriginPath, stageFile
+from .scratch import ScratchManager, scratchShellPrefix
+from .result_cache import ResultCache
 
 
 def inputsToAllRule(config):
-    '''Return a function thats lists all final inputs based on a config.'''
+    '''Return a function thats lists all final inputs based on a config.
+
+    If the config lists the pending targets (see `findPendingTargets`)
+    those are used as is.
+    '''
     def aller(wcs):
+        if 'targets' in config['final_inputs']:
+            return config['final_inputs']['targets']
         out = []
         for sampleName in config['samples'].keys():
             for pattern in config['final_inputs']['sample_patterns']:
@@ -27,17 +36,77 @@ def getOriginResultFiles(config, resultType, fileType):
 
     N.B. This function returns another function!
     It does not return the filepath itself
+
+    If origins are staged (see `origin_staging`) return the path the
+    staging rule will put the file at.
     '''
 
     def getter(wcs):
         try:
-            return config['origins'][resultType][wcs.sample_name][fileType]
+            name = wcs.sample_name
         except AttributeError:
-            return config['origins'][resultType][wcs.group_name][fileType]
+            name = wcs.group_name
+        path = config['origins'][resultType][name][fileType]
+        if 'origin_staging' in config:
+            return stagedOriginPath(config['origin_staging']['dir'],
+                                    name, resultType, fileType, path)
+        return path
 
     return getter
 
 
+def originToStage(config):
+    '''Return a function that returns the origin file a staged path is for.
+
+    N.B. This function returns another function!
+    '''
+
+    def getter(wcs):
+        return config['origins'][wcs.stage_type][wcs.stage_name][wcs.stage_key]
+
+    return getter
+
+
+def stageOriginFile(config, src, dest):
+    '''Stage one origin file as configured in `config['origin_staging']`.'''
+    staging = config['origin_staging']
+    stageFile(src, dest, staging['dir'],
+              budget=staging['budget'], maxWait=staging['wait'])
+
+
+def jobScratch(config, name='job'):
+    '''Return a context manager that yields a scratch dir for a run block.
+
+    The dir is removed if the block succeeds. Shell commands already
+    get their own scratch dir as $TMPDIR.
+    '''
+    return ScratchManager.fromConfig(config['scratch']).job(name)
+
+
+def recordResultInManifest(sample, result):
+    '''Add a newly registered result of a sample to the origin manifest.'''
+    from .module_ultra_repo import ModuleUltraRepo
+
+    ModuleUltraRepo.loadRepo().originManifest().recordResult(sample, result)
+
+
+def enableResultCache(workflow, config):
+    '''Serve the jobs of module rules from the result cache when possible.
+
+    Wraps the run function of each rule listed in
+    `config['result_cache']['rules']`, so this must come after every
+    rule in the snakefile.
+    '''
+    cacheConf = config['result_cache']
+    cache = ResultCache.fromConfig(cacheConf)
+    for rule in workflow.rules:
+        module = cacheConf['rules'].get(rule.name)
+        if module is None or rule.run_func is None:
+            continue
+        rule.run_func = cache.wrapRunFunc(rule.run_func, module,
+                                          cacheConf['modules'][module], rule.name)
+
+
 def expandGroup(*samplePatterns, names=False):
     '''Return a function that returns all samples in a group.
 
@@ -0,0 +1,192 @@
+import os.path
+import json
+import sqlite3
+from threading import RLock
+from contextlib import contextmanager
+
+
+class StateStore:
+    '''An embedded SQLite database that holds persistent state.
+
+    State is kept as JSON values in named tables of key value pairs,
+    see `StoredDict`. Writes are atomic and several processes (e.g.
+    daemon workers) can safely read and update the same store. Use
+    `transaction()` to group several updates.
+
+    Stores used to be YAML files, one per table. `migrateYaml` copies
+    a YAML file into a table the first time the table is opened. The
+    YAML file is left in place.
+
+    If `readOnly` is True the database is opened read only, which never
+    takes a write lock. If it does not exist yet the YAML files are
+    read into an in memory database instead. Either way writes raise
+    `sqlite3.OperationalError` rather than being lost.
+    '''
+
+    def __init__(self, path, readOnly=False, timeout=30):
+        self.path = path
+        self.readOnly = readOnly
+        self.lock = RLock()
+        self.depth = 0
+        if readOnly and os.path.isfile(path):
+            uri = 'file:{}?mode=ro'.format(path)
+            self.conn = sqlite3.connect(uri, uri=True, timeout=timeout,
+                                        isolation_level=None,
+                                        check_same_thread=False)
+            self.migrateReadOnly = False
+        elif readOnly:
+            self.conn = sqlite3.connect(':memory:', isolation_level=None,
+                                        check_same_thread=False)
+            self._createTables()
+            self.conn.execute('PRAGMA query_only = ON')
+            self.migrateReadOnly = True
+        else:
+            self.conn = sqlite3.connect(path, timeout=timeout,
+                                        isolation_level=None,
+                                        check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self._createTables()
+            self.migrateReadOnly = False
+
+    def _createTables(self):
+        with self.transaction():
+            self.conn.execute('CREATE TABLE IF NOT EXISTS state ('
+                              'tbl TEXT NOT NULL, '
+                              'key TEXT NOT NULL, '
+                              'value TEXT NOT NULL, '
+                              'PRIMARY KEY (tbl, key))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS migrations ('
+                              'tbl TEXT PRIMARY KEY, '
+                              'source TEXT NOT NULL)')
+
+    @contextmanager
+    def transaction(self):
+        '''Group the updates made in this context into one transaction.
+
+        Transactions may be nested, only the outermost one commits.
+        '''
+        with self.lock:
+            if self.depth == 0:
+                self.conn.execute('BEGIN IMMEDIATE' if not self.readOnly else 'BEGIN')
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.execute('COMMIT')
+
+    def execute(self, sql, params=()):
+        '''Run one statement and return all rows.'''
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def table(self, name, yamlPath=None):
+        '''Return a `StoredDict` for table `name`.
+
+        If `yamlPath` is given migrate it into the table first.
+        '''
+        if yamlPath is not None:
+            self.migrateYaml(name, yamlPath)
+        return StoredDict(self, name)
+
+    def migrateYaml(self, name, yamlPath):
+        '''Copy a YAML backed dict into table `name` once.'''
+        if self.readOnly and not self.migrateReadOnly:
+            return
+        if not os.path.isfile(yamlPath):
+            return
+        if self.migrateReadOnly:
+            self.conn.execute('PRAGMA query_only = OFF')
+            try:
+                self._migrateYaml(name, yamlPath)
+            finally:
+                self.conn.execute('PRAGMA query_only = ON')
+        else:
+            self._migrateYaml(name, yamlPath)
+
+    def _migrateYaml(self, name, yamlPath):
+        with self.transaction():
+            done = self.conn.execute('SELECT 1 FROM migrations WHERE tbl = ?',
+                                     (name,)).fetchall()
+            if done:
+                return
+            from yaml import safe_load
+
+            with open(yamlPath) as yamlFile:
+                saved = safe_load(yamlFile) or {}
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO state (tbl, key, value) VALUES (?, ?, ?)',
+                [(name, key, json.dumps(val)) for key, val in saved.items()]
+            )
+            self.conn.execute('INSERT INTO migrations (tbl, source) VALUES (?, ?)',
+                              (name, os.path.abspath(yamlPath)))
+
+    def close(self):
+        self.conn.close()
+
+
+class StoredDict:
+    '''A dict like view of one table in a `StateStore`.
+
+    This is a drop in replacement for `yaml_backed_structs.PersistentDict`.
+    Values must be JSONable. Like PersistentDict, mutating a value that
+    was read does not change the store, it has to be set again.
+    '''
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self, key):
+        rows = self.store.execute('SELECT value FROM state WHERE tbl = ? AND key = ?',
+                                  (self.name, key))
+        if not rows:
+            raise KeyError(key)
+        return json.loads(rows[0][0])
+
+    def __setitem__(self, key, val):
+        self.store.execute('INSERT OR REPLACE INTO state (tbl, key, value) VALUES (?, ?, ?)',
+                           (self.name, key, json.dumps(val)))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.execute('DELETE FROM state WHERE tbl = ? AND key = ?',
+                           (self.name, key))
+
+    def __contains__(self, key):
+        rows = self.store.execute('SELECT 1 FROM state WHERE tbl = ? AND key = ?',
+                                  (self.name, key))
+        return len(rows) > 0
+
+    def __len__(self):
+        rows = self.store.execute('SELECT COUNT(*) FROM state WHERE tbl = ?',
+                                  (self.name,))
+        return rows[0][0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        rows = self.store.execute('SELECT key FROM state WHERE tbl = ? ORDER BY key',
+                                  (self.name,))
+        return [row[0] for row in rows]
+
+    def items(self):
+        rows = self.store.execute('SELECT key, value FROM state WHERE tbl = ? ORDER BY key',
+                                  (self.name,))
+        return [(key, json.loads(val)) for key, val in rows]
+
+    def values(self):
+        return [val for _, val in self.items()]
@@ -0,0 +1,148 @@
+import os
+import os.path
+import json
+from concurrent.futures import ThreadPoolExecutor
+from .errors import NotALinkFarmError
+
+
+GROUP_RESULT_DIR = 'group_result'
+FARM_MANIFEST = '.mu_link_farm.json'
+
+
+def resultLinks(results, prefix=''):
+    '''Return a dict of relative link path -> file path for datasuper results.
+
+    Links are named after the file they point to. If two files have
+    the same name the link is prefixed with the name of its result.
+    '''
+    links = {}
+    for result in results:
+        for _, fileRec in result.files():
+            target = os.path.abspath(fileRec.filepath())
+            linkName = os.path.basename(target)
+            if os.path.join(prefix, linkName) in links:
+                linkName = '{}.{}'.format(result.name, linkName)
+            links[os.path.join(prefix, linkName)] = target
+    return links
+
+
+def sampleLinks(sample, prefix=''):
+    '''Return the links for a virtual dir of a sample record.'''
+    return resultLinks(sample.results(), prefix=prefix)
+
+
+def groupLinks(group, flat=False):
+    '''Return the links for a virtual dir of a sample group record.
+
+    Unless `flat` is True the results of each sample go in a subdir
+    named after the sample and the results of the group itself in a
+    'group_result' subdir.
+    '''
+    links = {}
+    for sample in group.allSamples():
+        prefix = '' if flat else sample.name
+        links.update(sampleLinks(sample, prefix=prefix))
+    prefix = '' if flat else GROUP_RESULT_DIR
+    links.update(resultLinks(group.directResults(), prefix=prefix))
+    return links
+
+
+def _isLinkTo(path, target, hardlink):
+    try:
+        if hardlink:
+            return not os.path.islink(path) and os.path.samefile(path, target)
+        return os.path.islink(path) and os.readlink(path) == target
+    except OSError:
+        return False
+
+
+def readFarmManifest(dname):
+    '''Return the relative paths of the links a farm made, or None if not a farm.'''
+    try:
+        with open(os.path.join(dname, FARM_MANIFEST)) as manifest:
+            return set(json.load(manifest))
+    except FileNotFoundError:
+        return None
+
+
+def writeFarmManifest(dname, relPaths):
+    path = os.path.join(dname, FARM_MANIFEST)
+    with open(path + '.tmp', 'w') as manifest:
+        json.dump(sorted(relPaths), manifest)
+    os.replace(path + '.tmp', path)
+
+
+def buildLinkFarm(dname, links, hardlink=False):
+    '''Make `dname` a directory of links to files, changing only what differs.
+
+    `links` is a dict of relative path -> target path. Links are symlinks
+    unless `hardlink` is True; a hardlink that cannot be made (e.g. across
+    filesystems) falls back to a symlink. Links that already point at the
+    right file are left alone, others are replaced atomically. Symlinks,
+    and links this farm made, that are not in `links` are removed, as
+    are empty directories. Other files are never touched.
+
+    The links a farm made are recorded in a manifest in the farm. Raises
+    `NotALinkFarmError` if `dname` is a non empty dir without a manifest
+    or if a file that is not a link is in the way of a link.
+
+    Return a tuple of the number of links made, kept and removed.
+    '''
+    nMade, nKept, nRemoved = 0, 0, 0
+    recorded = readFarmManifest(dname)
+    if recorded is None:
+        if os.path.isdir(dname) and os.listdir(dname):
+            raise NotALinkFarmError(dname)
+        recorded = set()
+    os.makedirs(dname, exist_ok=True)
+    wanted = {os.path.normpath(relPath) for relPath in links}
+    writeFarmManifest(dname, recorded | wanted)
+
+    def isOurs(relPath):
+        return os.path.islink(os.path.join(dname, relPath)) or relPath in recorded
+
+    for relPath, target in links.items():
+        path = os.path.join(dname, relPath)
+        if _isLinkTo(path, target, hardlink):
+            nKept += 1
+            continue
+        if os.path.lexists(path) and not isOurs(os.path.normpath(relPath)):
+            raise NotALinkFarmError(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = path + '.mu_link_tmp'
+        if os.path.lexists(tmpPath):
+            os.remove(tmpPath)
+        try:
+            if not hardlink:
+                raise OSError()
+            os.link(target, tmpPath)
+        except OSError:
+            os.symlink(target, tmpPath)
+        os.replace(tmpPath, path)
+        nMade += 1
+
+    for dirpath, dirnames, filenames in os.walk(dname, topdown=False):
+        for fname in filenames + [dirname for dirname in dirnames
+                                  if os.path.islink(os.path.join(dirpath, dirname))]:
+            relPath = os.path.relpath(os.path.join(dirpath, fname), dname)
+            if relPath not in wanted and isOurs(relPath):
+                os.remove(os.path.join(dirpath, fname))
+                nRemoved += 1
+        if os.path.normpath(dirpath) != os.path.normpath(dname) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    writeFarmManifest(dname, wanted)
+    return nMade, nKept, nRemoved
+
+
+def buildLinkFarms(farms, hardlink=False, jobs=1):
+    '''Build many link farms at once.
+
+    `farms` is a dict of dir name -> links, see `buildLinkFarm`.
+    Return a dict of dir name -> (made, kept, removed).
+    '''
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {
+            dname: pool.submit(buildLinkFarm, dname, links, hardlink=hardlink)
+            for dname, links in farms.items()
+        }
+        return {dname: future.result() for dname, future in futures.items()}
@@ -22,7 +22,6 @@ requirements = [
     'snakemake~=4.1.0',
     'PyYAML~=3.12.0',
     'blessings~=1.7.0',
-    'yaml-backed-structs~=1.0.0',
     'datasuper~=0.10.0',
     'gimme_input==1.0.0',
     'PackageMega>=0.1.0',
@@ -60,7 +59,7 @@ setup(
     description=('Tools to make pipelines easier to run and distribute for '
                  'large biological datasets'),
 
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     install_requires=requirements,
     dependency_links=dependency_links,
 
@@ -0,0 +1,45 @@
+"""Test the synthetic pipelines and thresholds of the benchmark suite."""
+
+import os
+import unittest
+
+from benchmarks import synthetic
+from benchmarks.planning import checkThresholds, parseScale
+
+from .base_test import BaseTestDataSuper
+
+
+class TestBenchmarks(BaseTestDataSuper):
+
+    def test_pipeline_definition(self):
+        """Test that synthetic modules chain back to the origins."""
+        pipeDef = synthetic.pipelineDefinition(4, numOrigins=2, filesPerOrigin=3)
+        byName = {rtype['NAME']: rtype for rtype in pipeDef['RESULT_TYPES']}
+        self.assertEqual(byName['bench_mod_0']['DEPENDENCIES'], ['bench_raw_0', 'bench_raw_1'])
+        self.assertEqual(byName['bench_mod_3']['DEPENDENCIES'], ['bench_mod_2', 'bench_mod_1'])
+        self.assertEqual(byName['bench_group']['LEVEL'], 'GROUP')
+        self.assertEqual(len(byName['bench_raw_1']['FILES']), 3)
+
+    def test_write_pipeline(self):
+        """Test that a snakefile is written for every module."""
+        synthetic.writePipeline('pipe', 3, filesPerOrigin=2)
+        self.assertTrue(os.path.isfile('pipe/pipeline_definition.json'))
+        snakefiles = sorted(os.listdir('pipe/snakefiles'))
+        self.assertEqual(len(snakefiles), 4)
+        with open('pipe/snakefiles/bench_mod_0.smk') as f:
+            rule = f.read()
+        self.assertIn("getOriginResultFiles(config, 'bench_raw_0', 'f1')", rule)
+        with open('pipe/snakefiles/bench_group.smk') as f:
+            self.assertIn("expandGroup(config['bench_mod_2']['out'])", f.read())
+
+    def test_thresholds(self):
+        """Test that only stages slower than their threshold regress."""
+        self.assertEqual(parseScale('100x5x10'), (100, 5, 10))
+        results = [{'scale': '10x2x3', 'stages': {'tabify': {'best': 0.5},
+                                                   'planDelta': {'best': 0.01}}}]
+        regressions = checkThresholds(results, {'10x2x3': {'tabify': 0.1, 'planDelta': 0.1}})
+        self.assertEqual([reg['stage'] for reg in regressions], ['tabify'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Test CLI commands against a real repo."""
+
+import os
+import json
+import tarfile
+import unittest
+
+import datasuper as ds
+from click.testing import CliRunner
+
+from moduleultra.cli.cli import main
+from moduleultra.module_ultra_repo import ModuleUltraRepo
+from moduleultra.sample_selection import SampleSelection
+
+from .base_test import BaseTestDataSuper
+
+
+class TestCli(BaseTestDataSuper):
+    """Test CLI commands against a real repo."""
+
+    def setUp(self):
+        super().setUp()
+        self.oldConfig = os.environ.get('MODULE_ULTRA_CONFIG')
+        os.environ['MODULE_ULTRA_CONFIG'] = os.path.join(self.tdir, 'mu_config')
+        self.runner = CliRunner()
+        self.invoke('init')
+        self.resultDir = ModuleUltraRepo.loadRepo().getResultDir()
+        with ds.Repo.loadRepo() as dsRepo:
+            dsRepo.addSampleType('metagenome')
+            dsRepo.addFileType('txt')
+            dsRepo.addResultSchema('old_pipe', {'report': 'txt'})
+            for sampleName in ['s1', 's2']:
+                self.addResult(dsRepo, sampleName)
+
+    def tearDown(self):
+        if self.oldConfig is None:
+            del os.environ['MODULE_ULTRA_CONFIG']
+        else:
+            os.environ['MODULE_ULTRA_CONFIG'] = self.oldConfig
+        super().tearDown()
+
+    def invoke(self, *args, exitCode=0):
+        result = self.runner.invoke(main, list(args))
+        self.assertEqual(result.exit_code, exitCode, result.output)
+        return result
+
+    def resultPath(self, sampleName, fname):
+        return os.path.join(self.resultDir, sampleName, fname)
+
+    def addResult(self, dsRepo, sampleName):
+        path = self.resultPath(sampleName, '{}.old_pipe.report.txt'.format(sampleName))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(sampleName)
+        sample = ds.makeSample(dsRepo, sampleName, 'metagenome')
+        fileRec = ds.makeFile(dsRepo, os.path.basename(path), path, 'txt')
+        result = ds.makeResult(dsRepo, '{}_old_pipe'.format(sampleName), 'old_pipe',
+                               {'report': fileRec})
+        sample.addResult(result)
+        sample.save(modify=True)
+
+    def test_gc_keeps_registered_files(self):
+        """Ensure gc never removes a file that is registered in datasuper."""
+        registered = self.resultPath('s1', 's1.old_pipe.report.txt')
+        stray = self.resultPath('s1', 's1.old_pipe.tmp.sam')
+        with open(stray, 'w') as f:
+            f.write('x')
+        self.invoke('gc', '--delete')
+        self.assertTrue(os.path.isfile(registered))
+        self.assertFalse(os.path.exists(stray))
+
+    def test_verify(self):
+        """Ensure verify checks the registered files and fails if there are none."""
+        result = self.invoke('verify')
+        self.assertIn('old_pipe: 2 ok, 0 missing, 0 altered', result.output)
+        with open(self.resultPath('s2', 's2.old_pipe.report.txt'), 'w') as f:
+            f.write('changed')
+        result = self.invoke('verify', exitCode=1)
+        self.assertIn('old_pipe: 1 ok, 0 missing, 1 altered', result.output)
+        self.invoke('verify', '-e', 'no_such_endpoint', exitCode=1)
+
+    def test_select_samples(self):
+        """Ensure run selects samples from the datasuper repo of the repo."""
+        with ds.Repo.loadRepo() as dsRepo:
+            ds.SampleGroupRecord(dsRepo, name='g1', direct_samples=['s2']).save()
+        repo = ModuleUltraRepo.loadRepo()
+        self.assertEqual(repo.selectSamples(SampleSelection(names=['s1', 'nope'])), ['s1'])
+        self.assertEqual(repo.selectSamples(SampleSelection(patterns=['s*'])), ['s1', 's2'])
+        self.assertEqual(repo.selectSamples(SampleSelection(sampleTypes=['metagenome'],
+                                                            groups=['g1'])), ['s2'])
+
+    def test_link(self):
+        """Ensure link builds dirs of registered results and names missing records."""
+        result = self.invoke('link', '-o', 'virtual', '--all-samples')
+        self.assertIn('2 dirs: 2 links made', result.output)
+        self.assertEqual(os.readlink('virtual/s1/s1.old_pipe.report.txt'),
+                         self.resultPath('s1', 's1.old_pipe.report.txt'))
+        self.invoke('link', '-o', 'virtual', '-s', 's2')
+        result = self.invoke('link', '-o', 'virtual', '-s', 'nope', exitCode=1)
+        self.assertIn('No such sample or group: nope', result.output)
+
+        repo = ModuleUltraRepo.loadRepo()
+        self.assertEqual(repo.makeVirtualSampleDir('s1_dir', 's1'), (1, 0, 0))
+
+    def test_export(self):
+        """Ensure export writes the registered files of a group to an archive."""
+        with ds.Repo.loadRepo() as dsRepo:
+            ds.SampleGroupRecord(dsRepo, name='g1', direct_samples=['s1', 's2']).save()
+        result = self.invoke('export', '-g', 'g1', '-o', 'g1.tar')
+        self.assertIn('Exported 2 files', result.output)
+        with tarfile.open('g1.tar') as archive:
+            self.assertEqual(archive.extractfile('g1/s1/s1.old_pipe.report.txt').read(), b's1')
+            manifest = json.loads(archive.extractfile('MANIFEST.json').read().decode('utf-8'))
+        self.assertEqual(sorted(el['path'] for el in manifest),
+                         ['g1/s1/s1.old_pipe.report.txt', 'g1/s2/s2.old_pipe.report.txt'])
+        result = self.invoke('export', '-g', 'nope', '-o', 'nope.tar', exitCode=1)
+        self.assertIn('No such group: nope', result.output)
+        self.assertFalse(os.path.exists('nope.tar'))
+
+    def test_manifest_sync(self):
+        """Ensure manifest sync builds entries from the samples of the repo."""
+        result = self.invoke('manifest', 'sync')
+        self.assertIn('0 ok, 2 rebuilt, 0 removed', result.output)
+        result = self.invoke('manifest', 'sync')
+        self.assertIn('2 ok, 0 rebuilt, 0 removed', result.output)
+        manifest = ModuleUltraRepo.loadRepo().originManifest()
+        self.assertEqual(manifest.entries['s1']['results']['old_pipe'],
+                         {'report': self.resultPath('s1', 's1.old_pipe.report.txt')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Test failure backoff in the daemon."""
+
+import os
+import unittest
+
+from moduleultra.daemon.api import (
+    PROBE_FAILED,
+    _FinishedJobCounter,
+    _record_probes,
+    _record_run,
+)
+from moduleultra.daemon.backoff import FailureBackoff
+from moduleultra.daemon.status import DaemonStatus
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeRepoConfig:
+    """Stand in for a daemon repo config."""
+
+    repo_name = 'repo_a'
+
+    def get_pipeline_tolerance(self, pipe_name):
+        return 2
+
+
+class TestFailureBackoff(BaseTestDataSuper):
+
+    def test_delay(self):
+        """Test that the pause doubles with each failure up to a cap."""
+        backoff = FailureBackoff(base_seconds=10, max_seconds=60)
+        self.assertEqual([backoff.delay(n) for n in range(6)], [0, 10, 20, 40, 60, 60])
+
+    def test_pause_and_success(self):
+        """Test that failures pause a pipeline and a success clears them."""
+        backoff = FailureBackoff(base_seconds=10)
+        backoff.record_failure('repo_a', 'pipe_x', 'boom', now=100)
+        retry = backoff.record_failure('repo_a', 'pipe_x', 'boom again', now=100)
+        self.assertEqual(retry, 120)
+        self.assertIn('2 failures', backoff.pause_reason('repo_a', 'pipe_x', now=110))
+        self.assertIn('boom again', backoff.pause_reason('repo_a', 'pipe_x', now=110))
+        self.assertIsNone(backoff.pause_reason('repo_a', 'pipe_x', now=130))
+        self.assertIsNone(backoff.pause_reason('repo_a', 'pipe_y', now=110))
+        self.assertEqual(backoff.paused(now=110), {('repo_a', 'pipe_x')})
+        backoff.record_success('repo_a', 'pipe_x')
+        self.assertEqual(backoff.paused(now=110), set())
+
+    def test_persisted(self):
+        """Test that failures are kept across daemon restarts."""
+        path = os.path.join(self.tdir, 'state', 'backoff.json')
+        FailureBackoff(path, base_seconds=10).record_failure('repo_a', 'pipe_x', 'boom', now=0)
+        backoff = FailureBackoff(path, base_seconds=10)
+        self.assertEqual(backoff.paused(now=5), {('repo_a', 'pipe_x')})
+        retry = backoff.record_failure('repo_a', 'pipe_x', 'boom', now=10)
+        self.assertEqual(retry, 30)
+
+    def test_status_reason(self):
+        """Test that the status explains why a pipeline is paused."""
+        status = DaemonStatus()
+        status.set_paused('repo_a', 'pipe_x', '1.0', 'status probe failed')
+        pipe = status.to_dict()['pipelines'][0]
+        self.assertEqual(pipe['paused_reason'], 'status probe failed')
+        self.assertIn('moduleultra_daemon_paused{repo="repo_a",pipeline="pipe_x"} 1',
+                      status.to_prometheus())
+        status.set_outstanding('repo_a', 'pipe_x', '1.0', 3)
+        self.assertIsNone(status.to_dict()['pipelines'][0]['paused_reason'])
+
+    def test_probes(self):
+        """Test that a probe with nothing to run clears earlier failures."""
+        backoff = FailureBackoff(base_seconds=10)
+        repo_config = FakeRepoConfig()
+        _record_probes(backoff, repo_config, [(('pipe_x', '1.0'), PROBE_FAILED),
+                                              (('pipe_y', '1.0'), PROBE_FAILED)])
+        _record_probes(backoff, repo_config, [(('pipe_x', '1.0'), 2),
+                                              (('pipe_y', '1.0'), 3)])
+        self.assertEqual(backoff.paused(now=0), {('repo_a', 'pipe_y')})
+
+    def test_partial_failures(self):
+        """Test that only runs that finish no job count as failures."""
+        backoff = FailureBackoff(base_seconds=10)
+        status = DaemonStatus()
+        repo_config = FakeRepoConfig()
+        _record_run(backoff, status, repo_config, 'pipe_x', '1.0', False, 3)
+        self.assertEqual(backoff.paused(now=0), set())
+        _record_run(backoff, status, repo_config, 'pipe_x', '1.0', False, 0)
+        self.assertEqual(backoff.paused(now=0), {('repo_a', 'pipe_x')})
+        _record_run(backoff, status, repo_config, 'pipe_x', '1.0', True, 0)
+        self.assertEqual(backoff.paused(now=0), set())
+
+    def test_finished_job_counter(self):
+        """Test that only job_finished messages are counted."""
+        counter = _FinishedJobCounter()
+        for msg in [{'level': 'job_finished', 'jobid': 1}, {'level': 'info', 'msg': 'hi'},
+                    {'level': 'job_finished', 'jobid': 2}]:
+            counter.handle_msg(msg)
+        self.assertEqual(counter.num_finished_jobs, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Test the cached status endpoint of the daemon."""
+
+import os
+import json
+import unittest
+
+from moduleultra.daemon.status import DaemonStatus, StatusServer, fetch_status
+
+from .base_test import BaseTestDataSuper
+
+
+class TestDaemonStatus(BaseTestDataSuper):
+
+    def make_status(self):
+        status = DaemonStatus()
+        status.start_cycle()
+        status.set_outstanding('repo_a', 'pipe_x', '1.0', 12, tolerance=2)
+        status.set_outstanding('repo_a', 'pipe_y', '0.1', 1, tolerance=2)
+        status.start_run('repo_a', 'pipe_x')
+        status.finish_cycle()
+        return status
+
+    def test_snapshot(self):
+        """Test that the status records jobs, runs, queues and cycles."""
+        status = self.make_status().to_dict()
+        self.assertEqual(status['cycles'], 1)
+        self.assertEqual(status['queue_depth'], 1)
+        self.assertEqual([run['pipeline'] for run in status['running']], ['pipe_x'])
+        self.assertEqual([pipe['outstanding_jobs'] for pipe in status['pipelines']], [12, 1])
+
+    def test_prometheus(self):
+        """Test that metrics are in the Prometheus text format."""
+        metrics = self.make_status().to_prometheus()
+        self.assertIn('# TYPE moduleultra_daemon_outstanding_jobs gauge', metrics)
+        self.assertIn(
+            'moduleultra_daemon_outstanding_jobs{repo="repo_a",pipeline="pipe_x"} 12', metrics
+        )
+        self.assertIn('moduleultra_daemon_queue_depth 1', metrics)
+
+    def test_http_endpoint(self):
+        """Test that status is served on a localhost port."""
+        server = StatusServer(self.make_status(), port=0).start()
+        try:
+            status = json.loads(fetch_status(server.port))
+            self.assertEqual(status['queue_depth'], 1)
+            self.assertIn('cycles_total 1', fetch_status(server.port, path='/metrics'))
+        finally:
+            server.stop()
+
+    def test_unix_endpoint(self):
+        """Test that status is served on a Unix socket."""
+        socket_path = os.path.join(self.tdir, 'daemon.sock')
+        status = self.make_status()
+        server = StatusServer(status, socket_path=socket_path).start()
+        try:
+            status.finish_run('repo_a', 'pipe_x')
+            served = json.loads(fetch_status(socket_path))
+            self.assertEqual(served['running'], [])
+            self.assertEqual(served['queue_depth'], 0)
+        finally:
+            server.stop()
+        self.assertFalse(os.path.exists(socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
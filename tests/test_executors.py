@@ -0,0 +1,93 @@
+"""Test the executors that submit spooled jobs."""
+
+import os
+import subprocess as sp
+import unittest
+from time import sleep
+
+from moduleultra.executors import (
+    ArrayJobExecutor,
+    Executor,
+    FakeClusterExecutor,
+    LocalExecutor,
+    writeArrayScript,
+)
+from moduleultra.job_bundler import JobBundler, spoolJobscript
+
+from .base_test import BaseTestDataSuper
+from .test_job_bundler import write_jobscript
+
+
+class TestExecutors(BaseTestDataSuper):
+    """Test the executors that submit spooled jobs."""
+
+    def jobscripts(self, n, rule='small'):
+        return [write_jobscript(self.tdir, i, rule, 's{}'.format(i)) for i in range(n)]
+
+    def wait_for(self, paths, timeout=10):
+        for _ in range(int(timeout / 0.05)):
+            if all(os.path.exists(path) for path in paths):
+                return True
+            sleep(0.05)
+        return False
+
+    def test_array_script(self):
+        """Ensure each array task runs only its own jobscript."""
+        jobscripts = self.jobscripts(3)
+        writeArrayScript('array.sh', jobscripts)
+        env = dict(os.environ, MU_ARRAY_TASK_ID='2')
+        sp.check_call(['sh', 'array.sh'], env=env)
+        assert os.path.isfile('done_1')
+        assert not os.path.exists('done_0') and not os.path.exists('done_2')
+
+    def test_array_submission(self):
+        """Ensure jobs of a rule are submitted as one array of the right size."""
+        bundler = JobBundler(os.path.join(self.tdir, 'spool'), None, {},
+                             executor=ArrayJobExecutor('echo', arraySize=3),
+                             defaultSize=3)
+        for jobscript in self.jobscripts(4):
+            spoolJobscript(bundler.spoolDir, jobscript)
+        bundler.poll()
+        assert bundler.nBundles == 1
+        assert len(bundler.pending['small']['jobs']) == 1
+        assert set(bundler.externalIds.values()) == {'3 {}'.format(
+            os.path.join(bundler.spoolDir, 'bundles', 'bundle_1.sh'))}
+
+    def test_fake_cluster(self):
+        """Ensure the fake cluster runs every task of a submission."""
+        executor = FakeClusterExecutor(latency=0.01, slots=2, seed=1, arraySize=10).start()
+        bundler = JobBundler(os.path.join(self.tdir, 'spool'), None, {},
+                             executor=executor, defaultSize=10)
+        for jobscript in self.jobscripts(5):
+            spoolJobscript(bundler.spoolDir, jobscript)
+        bundler.poll(flushAll=True)
+        assert self.wait_for(['done_{}'.format(i) for i in range(5)])
+        executor.stop()
+        assert executor.counts['submissions'] == 1
+        assert executor.counts['tasks'] == 5
+
+    def test_fake_cluster_failures(self):
+        """Ensure jobs of lost tasks are marked failed."""
+        executor = FakeClusterExecutor(latency=0, failureRate=1.0).start()
+        bundler = JobBundler(os.path.join(self.tdir, 'spool'), None, {}, executor=executor)
+        for jobscript in self.jobscripts(2):
+            spoolJobscript(bundler.spoolDir, jobscript)
+        bundler.poll()
+        assert self.wait_for(['failed_0', 'failed_1'])
+        executor.stop()
+        assert executor.counts['lost'] == 2
+        assert not os.path.exists('done_0')
+
+    def test_submit_required(self):
+        """Ensure executors without a way to submit jobs fail before a run."""
+        class SpoolingExecutor(Executor):
+            spools = True
+
+        with self.assertRaises(TypeError):
+            SpoolingExecutor()
+        with self.assertRaisesRegex(TypeError, 'local executor'):
+            LocalExecutor().submit('bundle.sh', [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Test bundling of cluster jobs."""
+
+import os
+import json
+import unittest
+
+from moduleultra.job_bundler import JobBundler, spoolJobscript, jobStatus
+
+from .base_test import BaseTestDataSuper
+
+
+def write_jobscript(dirname, jobid, rule, sample):
+    """Write a minimal snakemake style jobscript and return its path."""
+    properties = {'rule': rule, 'wildcards': {'sample_name': sample}}
+    path = os.path.join(dirname, 'job_{}.sh'.format(jobid))
+    with open(path, 'w') as jobscript:
+        jobscript.write('#!/bin/sh\n')
+        jobscript.write('# properties = {}\n'.format(json.dumps(properties)))
+        jobscript.write('true && touch "done_{0}" || (touch "failed_{0}"; exit 1)\n'.format(jobid))
+    return path
+
+
+class TestJobBundler(BaseTestDataSuper):
+    """Test bundling of cluster jobs."""
+
+    def bundler(self, groupSizes, **kwargs):
+        """Return a bundler whose submit command just echoes the bundle."""
+        spool = os.path.join(self.tdir, 'spool')
+        return JobBundler(spool, 'echo', groupSizes, **kwargs)
+
+    def spool(self, bundler, jobs):
+        """Spool (rule, sample) jobs into `bundler`."""
+        for i, (rule, sample) in enumerate(jobs):
+            jobscript = write_jobscript(self.tdir, i, rule, sample)
+            spoolJobscript(bundler.spoolDir, jobscript)
+
+    def test_bundle_by_rule(self):
+        """Ensure jobs of one rule are submitted together."""
+        bundler = self.bundler({'small': 3})
+        self.spool(bundler, [('small', 's1'), ('small', 's2'), ('small', 's3'), ('big', 's1')])
+        bundler.poll()
+        assert bundler.nBundles == 2
+        assert len(set(bundler.externalIds.values())) == 2
+        assert not bundler.pending
+
+    def test_bundle_waits_to_fill(self):
+        """Ensure partial bundles wait, then flush."""
+        bundler = self.bundler({'small': 3}, maxWait=1000)
+        self.spool(bundler, [('small', 's1'), ('small', 's2')])
+        bundler.poll()
+        assert bundler.nBundles == 0
+        bundler.poll()
+        assert bundler.nBundles == 0
+        bundler.poll(flushAll=True)
+        assert bundler.nBundles == 1
+
+    def test_bundle_by_sample(self):
+        """Ensure jobs can be bundled per sample."""
+        bundler = self.bundler({'a': 2, 'b': 2}, groupBy='sample')
+        self.spool(bundler, [('a', 's1'), ('b', 's1'), ('a', 's2')])
+        bundler.poll()
+        assert bundler.nBundles == 1
+        assert list(bundler.pending.keys()) == ['s2']
+
+    def test_failed_submission(self):
+        """Ensure jobs are marked failed if the bundle cannot be submitted."""
+        bundler = self.bundler({})
+        bundler.submitCmd = 'false'
+        self.spool(bundler, [('small', 's1')])
+        bundler.poll()
+        assert os.path.isfile('failed_0')
+
+    def test_job_status(self):
+        """Ensure job status comes from markers and the bundle status."""
+        bundler = self.bundler({'small': 2}, statusCmd='echo running; true')
+        self.spool(bundler, [('small', 's1'), ('small', 's2')])
+        jobIds = sorted(os.listdir(os.path.join(bundler.spoolDir, 'incoming')))
+        jobIds = [jobId[:-len('.sh')] for jobId in jobIds]
+        assert jobStatus(bundler.spoolDir, jobIds[0]) == 'running'
+        bundler.poll()
+        assert jobStatus(bundler.spoolDir, jobIds[0]) == 'running'
+        open('done_0', 'w').close()
+        statuses = {jobStatus(bundler.spoolDir, jobId) for jobId in jobIds}
+        assert statuses == {'success', 'running'}
+
+
+if __name__ == '__main__':
+    unittest.main()
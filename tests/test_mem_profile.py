@@ -0,0 +1,64 @@
+"""Test memory reports of run stages."""
+
+import os
+import json
+import unittest
+import tracemalloc
+
+from moduleultra.mem_profile import MemProfiler, peakRSS, summarize
+
+from .base_test import BaseTestDataSuper
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(2048)]
+
+
+class TestMemProfile(BaseTestDataSuper):
+
+    def test_stages(self):
+        """Test that each stage records memory and its top allocation site."""
+        path = os.path.join(self.tdir, 'run_logs', 'report.json')
+        profiler = MemProfiler(path=path, run_id='r1').start()
+        with profiler.stage('plan'):
+            kept = allocate()
+        with open(path) as f:
+            written = json.load(f)
+        self.assertEqual(written['run_id'], 'r1')
+        self.assertEqual([stage['stage'] for stage in written['stages']], ['plan'])
+        with profiler.stage('conf'):
+            pass
+        profiler.finish()
+        self.assertFalse(tracemalloc.is_tracing())
+
+        stage = profiler.report()['stages'][0]
+        self.assertGreater(stage['traced_peak'], 2 * 2 ** 20)
+        self.assertGreater(stage['traced_net'], 2 * 2 ** 20)
+        self.assertLessEqual(stage['peak_rss'], peakRSS())
+        self.assertIn('test_mem_profile.py', stage['top_sites'][0]['site'])
+        self.assertIn('plan', summarize(profiler.report()))
+        del kept
+
+    def test_failed_stage(self):
+        """Test that a failing stage is still recorded."""
+        path = os.path.join(self.tdir, 'report.json')
+        profiler = MemProfiler(path=path).start()
+        with self.assertRaises(ValueError):
+            with profiler.stage('dryrun'):
+                raise ValueError()
+        self.assertFalse(tracemalloc.is_tracing())
+        with open(path) as f:
+            self.assertEqual(json.load(f)['stages'][0]['stage'], 'dryrun')
+
+    def test_disabled(self):
+        """Test that a disabled profiler does not trace or write."""
+        path = os.path.join(self.tdir, 'report.json')
+        profiler = MemProfiler(path=path, enabled=False).start()
+        with profiler.stage('plan'):
+            self.assertFalse(tracemalloc.is_tracing())
+        profiler.finish()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
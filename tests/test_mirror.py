@@ -0,0 +1,60 @@
+"""Test pipeline source mirrors."""
+
+import os
+import unittest
+from subprocess import CalledProcessError
+
+from moduleultra.installation.mirror import syncTree, linkTree, updateGitMirror
+
+from .base_test import BaseTestDataSuper
+
+
+def write(path, content):
+    """Write `content` to `path`, making parent dirs."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestMirror(BaseTestDataSuper):
+    """Test pipeline source mirrors."""
+
+    def test_sync_copies_only_changes(self):
+        """Ensure unchanged files are not copied again."""
+        write('src/a.txt', 'a')
+        write('src/sub/b.txt', 'b')
+        assert syncTree('src', 'mirror') == 2
+        assert syncTree('src', 'mirror') == 0
+        write('src/sub/b.txt', 'bb')
+        assert syncTree('src', 'mirror') == 1
+        assert open('mirror/sub/b.txt').read() == 'bb'
+
+    def test_sync_removes_stale(self):
+        """Ensure files removed from the source leave the mirror."""
+        write('src/a.txt', 'a')
+        write('src/sub/b.txt', 'b')
+        syncTree('src', 'mirror')
+        os.remove('src/sub/b.txt')
+        os.rmdir('src/sub')
+        syncTree('src', 'mirror')
+        assert not os.path.exists('mirror/sub')
+        assert os.path.isfile('mirror/a.txt')
+
+    def test_sync_keeps_links_intact(self):
+        """Ensure updating the mirror does not change linked copies."""
+        write('src/a.txt', 'a')
+        syncTree('src', 'mirror')
+        linkTree('mirror', 'staged')
+        write('src/a.txt', 'changed')
+        syncTree('src', 'mirror')
+        assert open('staged/a.txt').read() == 'a'
+        assert open('mirror/a.txt').read() == 'changed'
+
+    def test_failed_clone(self):
+        """Ensure a clone that fails raises instead of passing silently."""
+        with self.assertRaises(CalledProcessError):
+            updateGitMirror(os.path.join(self.tdir, 'no_such_repo'), 'mirrors')
+
+
+if __name__ == '__main__':
+    unittest.main()
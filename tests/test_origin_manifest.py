@@ -0,0 +1,149 @@
+"""Test the persisted manifest of sample origin files."""
+
+import os
+import unittest
+
+from moduleultra.origin_manifest import OriginManifest
+from moduleultra.planning_set import PlanningSet
+from moduleultra.state_store import StateStore
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeFile:
+    """Stand in for a datasuper file record that counts reads."""
+
+    reads = 0
+
+    def __init__(self, path, checksum):
+        self.path = path
+        self.checksum = checksum
+
+    def filepath(self):
+        FakeFile.reads += 1
+        return self.path
+
+
+class FakeResult:
+    """Stand in for a datasuper result record."""
+
+    def __init__(self, sampleName, rtype, checksum='c0'):
+        self.name = 'result_{}_{}'.format(sampleName, rtype)
+        self.rtype = rtype
+        self.fileRecs = [('read1', FakeFile('/data/{}.{}.fq'.format(sampleName, rtype), checksum))]
+
+    def resultType(self):
+        return self.rtype
+
+    def files(self):
+        return self.fileRecs
+
+
+class FakeSample:
+    """Stand in for a datasuper sample record."""
+
+    def __init__(self, name, rtypes=('raw_reads',)):
+        self.name = name
+        self.sampleType = 'metagenome'
+        self._results = [FakeResult(name, rtype) for rtype in rtypes]
+
+    def to_dict(self):
+        return {'results': {result.name for result in self._results}}
+
+    def results(self):
+        return self._results
+
+
+class TestOriginManifest(BaseTestDataSuper):
+
+    def setUp(self):
+        super().setUp()
+        FakeFile.reads = 0
+        self.dbPath = os.path.join(self.tdir, 'state.sqlite')
+        self.store = StateStore(self.dbPath)
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def test_reused_between_runs(self):
+        """Test that a second plan reads no file records."""
+        samples = [FakeSample('s{}'.format(i)) for i in range(10)]
+        manifest = OriginManifest(self.store)
+        first = PlanningSet.fromRecords(['raw_reads'], samples, [], manifest=manifest)
+        self.assertEqual(FakeFile.reads, 10)
+        manifest.save()
+        self.assertEqual(manifest.changed, {})
+
+        manifest = OriginManifest(self.store)
+        second = PlanningSet.fromRecords(['raw_reads'], samples, [], manifest=manifest)
+        self.assertEqual(FakeFile.reads, 10)
+        self.assertEqual(manifest.hits, 10)
+        self.assertEqual(second.origins, first.origins)
+        self.assertEqual(second.origins['raw_reads']['s3'], {'read1': '/data/s3.raw_reads.fq'})
+
+    def test_new_result_rebuilds_entry(self):
+        """Test that an entry is rebuilt when its sample gains a result."""
+        sample = FakeSample('s1')
+        manifest = OriginManifest(self.store)
+        manifest.sampleResults(sample)
+        manifest.save()
+        sample._results.append(FakeResult('s1', 'other_reads'))
+        manifest = OriginManifest(self.store)
+        results = manifest.sampleResults(sample)
+        self.assertEqual(manifest.misses, 1)
+        self.assertIn('other_reads', results)
+
+    def test_record_result(self):
+        """Test that registering a result keeps the entry valid."""
+        sample = FakeSample('s1')
+        manifest = OriginManifest(self.store)
+        manifest.sampleResults(sample)
+        manifest.save()
+        result = FakeResult('s1', 'kraken')
+        sample._results.append(result)
+        OriginManifest(self.store).recordResult(sample, result)
+        manifest = OriginManifest(self.store)
+        self.assertIn('kraken', manifest.sampleResults(sample))
+        self.assertEqual(manifest.hits, 1)
+
+    def test_record_results_out_of_order(self):
+        """Test that an entry is only valid once every new result is recorded."""
+        sample = FakeSample('s1')
+        manifest = OriginManifest(self.store)
+        manifest.sampleResults(sample)
+        manifest.save()
+        kraken, mash = FakeResult('s1', 'kraken'), FakeResult('s1', 'mash')
+        sample._results += [kraken, mash]
+        OriginManifest(self.store).recordResult(sample, mash)
+        manifest = OriginManifest(self.store)
+        self.assertIn('kraken', manifest.sampleResults(sample))
+        self.assertEqual(manifest.misses, 1)
+
+        sample = FakeSample('s2')
+        manifest = OriginManifest(self.store)
+        manifest.sampleResults(sample)
+        manifest.save()
+        kraken, mash = FakeResult('s2', 'kraken'), FakeResult('s2', 'mash')
+        sample._results += [kraken, mash]
+        OriginManifest(self.store).recordResult(sample, mash)
+        OriginManifest(self.store).recordResult(sample, kraken)
+        manifest = OriginManifest(self.store)
+        self.assertIn('kraken', manifest.sampleResults(sample))
+        self.assertEqual(manifest.hits, 1)
+
+    def test_sync(self):
+        """Test that sync rebuilds entries whose checksums changed."""
+        samples = [FakeSample('s1'), FakeSample('s2'), FakeSample('gone')]
+        manifest = OriginManifest(self.store)
+        for sample in samples:
+            manifest.sampleResults(sample)
+        manifest.save()
+        checksums = {'/data/s1.raw_reads.fq': 'c0', '/data/s2.raw_reads.fq': 'changed'}
+        counts = OriginManifest(self.store).sync(samples[:2], checksums)
+        self.assertEqual(counts, {'ok': 1, 'rebuilt': 1, 'removed': 1})
+        self.assertEqual(sorted(OriginManifest(self.store).entries), ['s1', 's2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
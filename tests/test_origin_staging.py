@@ -0,0 +1,52 @@
+"""Test staging origin files to local scratch."""
+
+import os
+import unittest
+
+from moduleultra.origin_staging import (
+    STAGE_RESOURCE,
+    stagedOriginPath,
+    stageFile,
+    waitForBudget,
+)
+from moduleultra.pipeline_instance_snakemake_utils import makeOriginStagingRule
+
+from .base_test import BaseTestDataSuper
+
+
+class TestOriginStaging(BaseTestDataSuper):
+    """Test staging origin files to local scratch."""
+
+    def makeFile(self, name, size):
+        with open(name, 'wb') as f:
+            f.write(b'x' * size)
+        return os.path.abspath(name)
+
+    def test_stage_file(self):
+        """Ensure origins are staged to their staged path."""
+        src = self.makeFile('reads.fq.gz', 100)
+        dest = stagedOriginPath('scratch', 's1', 'raw_reads', 'read1', src)
+        self.assertEqual(dest, 'scratch/s1/raw_reads/read1/reads.fq.gz')
+        stageFile(src, dest, 'scratch', budget=1000)
+        self.assertTrue(os.path.samefile(src, dest))
+        self.assertEqual(os.listdir(os.path.dirname(dest)), ['reads.fq.gz'])
+
+    def test_budget(self):
+        """Ensure staging waits for room in the budget."""
+        os.makedirs('scratch')
+        self.assertTrue(waitForBudget('scratch', 100, 1000, maxWait=0))
+        self.makeFile('scratch/staged', 950)
+        self.assertFalse(waitForBudget('scratch', 100, 1000, maxWait=0, pollInterval=0))
+        self.assertTrue(waitForBudget('scratch', 50, 1000, maxWait=0))
+
+    def test_rule(self):
+        """Ensure staged files are temp and limited by a resource."""
+        rule = makeOriginStagingRule('/scratch')
+        self.assertIn('rule mu_stage_origin:', rule)
+        self.assertIn('localrules: mu_stage_origin', rule)
+        self.assertIn('temp("/scratch/{stage_name,[^/]+}/', rule)
+        self.assertIn('resources: {}=1'.format(STAGE_RESOURCE), rule)
+
+
+if __name__ == '__main__':
+    unittest.main()
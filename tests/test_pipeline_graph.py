@@ -0,0 +1,61 @@
+"""Test the pipeline dependency graph."""
+
+import unittest
+
+from moduleultra.errors import PipelineCycleError
+from moduleultra.pipeline_graph import PipelineGraph
+
+from .base_test import BaseTestDataSuper
+
+
+DEPENDENCIES = {
+    'kraken': ['filtered_reads'],
+    'filtered_reads': ['raw_reads'],
+    'mash': ['raw_reads'],
+    'mash_dists': ['mash'],
+    'raw_reads': [],
+}
+
+
+class TestPipelineGraph(BaseTestDataSuper):
+    """Test the pipeline dependency graph."""
+
+    def test_topological_order(self):
+        """Ensure every result type comes after its dependencies."""
+        graph = PipelineGraph(DEPENDENCIES)
+        order = graph.topologicalOrder()
+        self.assertEqual(sorted(order), sorted(DEPENDENCIES))
+        for name, deps in DEPENDENCIES.items():
+            for dep in deps:
+                self.assertLess(order.index(dep), order.index(name))
+
+    def test_cycle(self):
+        """Ensure cycles are detected."""
+        with self.assertRaises(PipelineCycleError):
+            PipelineGraph({'a': ['b'], 'b': ['c'], 'c': ['a'], 'd': []})
+
+    def test_closures(self):
+        """Ensure upstream and downstream closures are transitive."""
+        graph = PipelineGraph(DEPENDENCIES)
+        self.assertEqual(graph.upstream('kraken'), {'filtered_reads', 'raw_reads'})
+        self.assertEqual(graph.downstream('raw_reads'),
+                         {'kraken', 'filtered_reads', 'mash', 'mash_dists'})
+        self.assertEqual(graph.withDownstream(['mash']), {'mash', 'mash_dists'})
+        self.assertEqual(graph.withDependencies(['mash_dists']),
+                         {'mash_dists', 'mash', 'raw_reads'})
+
+    def test_closed_subset(self):
+        """Ensure names with unselected dependencies are dropped."""
+        graph = PipelineGraph(DEPENDENCIES)
+        selected = graph.closedSubset(['kraken', 'raw_reads', 'mash', 'mash_dists'])
+        self.assertEqual(selected, {'raw_reads', 'mash', 'mash_dists'})
+
+    def test_undefined_dependency(self):
+        """Ensure dependencies without a definition are leaves."""
+        graph = PipelineGraph({'a': ['missing']})
+        self.assertEqual(graph.topologicalOrder(), ['missing', 'a'])
+        self.assertEqual(graph.closedSubset(['a']), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Test building the PackageMega recipes of a pipeline."""
+
+import unittest
+
+from moduleultra.errors import RecipeBuildError
+from moduleultra.installation.pipeline_setup import (
+    PipelineInstaller,
+    checkRecipeReport,
+    planRecipes,
+)
+
+from .base_test import BaseTestDataSuper
+
+
+class FakePMRepo:
+    """A PackageMega repo whose recipes fail if their name says so."""
+
+    def __init__(self):
+        self.made = []
+
+    def makeRecipe(self, recipe):
+        if recipe.startswith('bad'):
+            raise ValueError('cannot build ' + recipe)
+        self.made.append(recipe)
+
+
+class TestPipelineSetup(BaseTestDataSuper):
+
+    def test_skip_installed(self):
+        """Test that installed recipes are skipped only when asked."""
+        report, toBuild = planRecipes(['a', 'b'], ['a'], True)
+        self.assertEqual(report, [('a', 'skipped', 0, None)])
+        self.assertEqual(toBuild, ['b'])
+        report, toBuild = planRecipes(['a', 'b'], ['a'], False)
+        self.assertEqual(report, [])
+        self.assertEqual(toBuild, ['a', 'b'])
+
+    def test_failed_recipe(self):
+        """Test that a failed recipe fails the install after the others build."""
+        installer = PipelineInstaller(None, '.', recipeJobs=2)
+        pmRepo = FakePMRepo()
+        report = installer.buildRecipes(pmRepo, ['a', 'bad_b', 'c'])
+        self.assertEqual(sorted(pmRepo.made), ['a', 'c'])
+        self.assertEqual([status for _, status, _, _ in report], ['built', 'failed', 'built'])
+        with self.assertRaises(RecipeBuildError):
+            checkRecipeReport(report)
+        checkRecipeReport([('a', 'built', 1.0, None), ('b', 'skipped', 0, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Test planning of pipeline runs."""
+
+import os
+import unittest
+
+from moduleultra.pipeline_instance_snakemake_utils import findPendingTargets
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeSchema:
+    """Stand in for a ResultSchema."""
+
+    def __init__(self, module, level='SAMPLE', origin=False):
+        self.module = module
+        self.level = level
+        self.origin = origin
+
+    def isOrigin(self):
+        return self.origin
+
+    def getOutputFilePattern(self):
+        wildcard = '{sample_name}' if self.level == 'SAMPLE' else '{group_name}'
+        return '{0}/{0}.{1}.flag.registered'.format(wildcard, self.module)
+
+
+class TestPlanning(BaseTestDataSuper):
+    """Test planning of pipeline runs."""
+
+    def test_pending_targets(self):
+        """Ensure only missing flags are planned."""
+        os.makedirs('s1')
+        open('s1/s1.kraken.flag.registered', 'w').close()
+        endpts = [FakeSchema('kraken'), FakeSchema('mash'),
+                  FakeSchema('raw', origin=True), FakeSchema('dist', level='GROUP')]
+        sampleTargets, groupTargets = findPendingTargets(self.tdir, endpts,
+                                                         ['s1', 's2'], ['g1'])
+        assert sampleTargets == {
+            's1': ['s1/s1.mash.flag.registered'],
+            's2': ['s2/s2.kraken.flag.registered', 's2/s2.mash.flag.registered'],
+        }
+        assert groupTargets == {'g1': ['g1/g1.dist.flag.registered']}
+
+    def test_nothing_pending(self):
+        """Ensure finished samples are left out."""
+        os.makedirs('s1')
+        open('s1/s1.kraken.flag.registered', 'w').close()
+        sampleTargets, groupTargets = findPendingTargets(self.tdir, [FakeSchema('kraken')],
+                                                         ['s1'], [])
+        assert sampleTargets == {}
+        assert groupTargets == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Test the compact planning representation of samples and groups."""
+
+import gc
+import unittest
+import tracemalloc
+
+from moduleultra.planning_set import PlanningSet
+from moduleultra.pipeline_instance_snakemake_utils import (
+    addDataToSnakemakeConf,
+    addOriginsToSnakemakeConf,
+)
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeFile:
+    """Stand in for a datasuper file record."""
+
+    def __init__(self, path):
+        self.path = path
+        self.primaryKey = 'file_' + path
+        self.checksum = None
+
+    def filepath(self):
+        return self.path
+
+
+class FakeResult:
+    """Stand in for a datasuper result record."""
+
+    def __init__(self, name, rtype):
+        self.name = name
+        self.rtype = rtype
+        self.fileRecs = {'read1': FakeFile('/data/{}.R1.fq.gz'.format(name)),
+                         'read2': FakeFile('/data/{}.R2.fq.gz'.format(name))}
+
+    def resultType(self):
+        return self.rtype
+
+    def files(self):
+        return list(self.fileRecs.items())
+
+
+class FakeSample:
+    """Stand in for a datasuper sample record."""
+
+    def __init__(self, name, sampleType='metagenome', origins=('raw_reads',)):
+        self.name = name
+        self.primaryKey = 'pk_' + name
+        self.sampleType = sampleType
+        self._results = [FakeResult('{}_{}'.format(name, origin), origin)
+                         for origin in origins]
+        self._results += [FakeResult('{}_other_{}'.format(name, i), 'other')
+                          for i in range(4)]
+
+    def results(self, resultTypes=None):
+        if resultTypes is None:
+            return self._results
+        return [result for result in self._results if result.rtype in resultTypes]
+
+
+class FakeGroup:
+    """Stand in for a datasuper sample group record."""
+
+    def __init__(self, name, samples):
+        self.name = name
+        self.samples = samples
+
+    def allSamples(self):
+        yield from self.samples
+
+    def allResults(self, resultTypes=None):
+        return []
+
+
+class TestPlanningSet(BaseTestDataSuper):
+    """Test the compact planning representation of samples and groups."""
+
+    def test_conf(self):
+        """Ensure conf builders see the same data as the records hold."""
+        samples = [FakeSample('s1'), FakeSample('s2', sampleType='isolate'),
+                   FakeSample('s3', origins=())]
+        groups = [FakeGroup('g1', samples[:2]), FakeGroup('g2', samples)]
+        plan = PlanningSet.fromRecords(['raw_reads'], samples, groups)
+        conf = addDataToSnakemakeConf({}, plan)
+        conf = addOriginsToSnakemakeConf(conf, plan)
+        self.assertEqual(conf['samples'], {'s1': {'sample_type': 'metagenome'},
+                                           's2': {'sample_type': 'isolate'}})
+        self.assertEqual(conf['groups'], {'g1': ['s1', 's2']})
+        self.assertEqual(conf['origins']['raw_reads']['s2'],
+                         {'read1': '/data/s2_raw_reads.R1.fq.gz',
+                          'read2': '/data/s2_raw_reads.R2.fq.gz'})
+
+    def test_subset(self):
+        """Ensure subsets keep indices and origins consistent."""
+        samples = [FakeSample('s{}'.format(i)) for i in range(4)]
+        groups = [FakeGroup('g1', samples[2:]), FakeGroup('g2', samples[:2])]
+        plan = PlanningSet.fromRecords(['raw_reads'], samples, groups)
+        plan = plan.subset(['s2', 's3', 's0'], ['g1', 'g2'])
+        self.assertEqual(plan.sampleNames, ['s0', 's2', 's3'])
+        self.assertEqual(plan.groupNames, ['g1'])
+        self.assertEqual(plan.groupSampleNames(0), ['s2', 's3'])
+        self.assertEqual(sorted(plan.origins['raw_reads']), ['s0', 's2', 's3'])
+
+    def test_peak_memory(self):
+        """Ensure planning from lazily loaded records stays small."""
+        nSamples = 5000
+
+        def loadSamples():
+            for i in range(nSamples):
+                yield FakeSample('sample_{}'.format(i))
+
+        gc.collect()
+        tracemalloc.start()
+        records = list(loadSamples())
+        recordsSize, _ = tracemalloc.get_traced_memory()
+        del records
+        gc.collect()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        plan = PlanningSet.fromRecords(['raw_reads'], loadSamples(), [])
+        _, planPeak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(len(plan), nSamples)
+        self.assertLess(planPeak, recordsSize / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Test the content addressed result cache."""
+
+import os
+import shutil
+import unittest
+from threading import Thread
+
+from moduleultra.result_cache import ResultCache, staticKey
+
+from .base_test import BaseTestDataSuper
+
+
+def writeFile(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestResultCache(BaseTestDataSuper):
+
+    def setUp(self):
+        super().setUp()
+        self.cacheDir = os.path.join(self.tdir, 'result_cache')
+        self.inPath = os.path.join(self.tdir, 's1.reads.fastq')
+        writeFile(self.inPath, 'ACGT')
+        self.static = staticKey('pipe', '0.1.0', 'mod_a', 'rule a:\n', {'db': 'x'})
+
+    def test_job_key(self):
+        """Test that keys follow the content of inputs, the module and params."""
+        cache = ResultCache(self.cacheDir)
+        key = cache.jobKey(self.static, [self.inPath], {'k': 1}, {'sample_name': 's1'})
+        self.assertEqual(key, cache.jobKey(self.static, [self.inPath], {'k': 1},
+                                           {'sample_name': 's1'}))
+        self.assertNotEqual(key, cache.jobKey(self.static, [self.inPath], {'k': 2},
+                                              {'sample_name': 's1'}))
+        otherStatic = staticKey('pipe', '0.1.0', 'mod_a', 'rule a:\n', {'db': 'y'})
+        self.assertNotEqual(key, cache.jobKey(otherStatic, [self.inPath], {'k': 1},
+                                              {'sample_name': 's1'}))
+        writeFile(self.inPath, 'TTTT')
+        self.assertNotEqual(key, cache.jobKey(self.static, [self.inPath], {'k': 1},
+                                              {'sample_name': 's1'}))
+        self.assertIsNone(cache.jobKey(self.static, [self.tdir]))
+
+    def test_wrapped_run(self):
+        """Test that a second repo reuses outputs instead of running the job."""
+        calls = []
+
+        def run(input, output, params, wildcards, *args):
+            calls.append(output[0])
+            writeFile(output[0], 'result')
+
+        for repo in ['repo1', 'repo2']:
+            cache = ResultCache(self.cacheDir, link='copy')
+            cachedRun = cache.wrapRunFunc(run, 'mod_a', self.static, 'mod_a')
+            os.makedirs(os.path.join(self.tdir, repo))
+            outPath = os.path.join(self.tdir, repo, 's1.mod_a.out')
+            cachedRun([self.inPath], [outPath], {}, {'sample_name': 's1'}, 1)
+            with open(outPath) as f:
+                self.assertEqual(f.read(), 'result')
+        self.assertEqual(len(calls), 1)
+        stats = ResultCache(self.cacheDir).stats['mod_a']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['stored'], 1)
+        self.assertEqual(stats['bytes_restored'], len('result'))
+
+    def test_rules_of_one_module(self):
+        """Test that rules of a module with the same inputs do not share outputs."""
+        def runner(content):
+            def run(input, output, params, wildcards, *args):
+                writeFile(output[0], content)
+            return run
+
+        cache = ResultCache(self.cacheDir, link='copy')
+        for rule in ['mod_a_stats', 'mod_a_report']:
+            cachedRun = cache.wrapRunFunc(runner(rule), 'mod_a', self.static, rule)
+            outPath = os.path.join(self.tdir, 's1.{}.out'.format(rule))
+            cachedRun([self.inPath], [outPath], {}, {'sample_name': 's1'}, 1)
+            with open(outPath) as f:
+                self.assertEqual(f.read(), rule)
+        self.assertEqual(cache.stats['mod_a']['hits'], 0)
+        self.assertEqual(cache.stats['mod_a']['stored'], 2)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entries go once over budget."""
+        cache = ResultCache(self.cacheDir, maxBytes=250)
+        for name in ['a', 'b', 'c']:
+            outPath = os.path.join(self.tdir, name + '.out')
+            writeFile(outPath, 'x' * 100)
+            cache.add(name * 64, [outPath], 'mod_a')
+            if name == 'b':
+                self.assertTrue(cache.restore('a' * 64, [outPath + '.copy'], 'mod_a'))
+        self.assertIn('a' * 64, cache.index)
+        self.assertNotIn('b' * 64, cache.index)
+        self.assertFalse(os.path.exists(cache.objectDir('b' * 64)))
+        self.assertEqual(cache.stats['mod_a']['evicted'], 1)
+
+    def test_concurrent_eviction(self):
+        """Test that caches sharing a dir can add and evict at once."""
+        errors = []
+
+        def addMany(worker):
+            cache = ResultCache(self.cacheDir, maxBytes=250)
+            try:
+                for i in range(20):
+                    outPath = os.path.join(self.tdir, '{}_{}.out'.format(worker, i))
+                    writeFile(outPath, 'x' * 100)
+                    cache.add('{}{:02d}'.format(worker, i) * 32, [outPath], 'mod_a')
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [Thread(target=addMany, args=(worker,)) for worker in 'ab']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(ResultCache(self.cacheDir).size(), 250)
+
+    def test_cache_errors_never_fail_jobs(self):
+        """Test that unplaceable objects are misses and failed adds are only logged."""
+        cache = ResultCache(self.cacheDir, link='copy')
+        outPath = os.path.join(self.tdir, 's1.mod_a.out')
+        writeFile(outPath, 'result')
+        cache.add('a' * 64, [outPath], 'mod_a')
+        shutil.rmtree(cache.objectDir('a' * 64))
+        self.assertFalse(cache.restore('a' * 64, [outPath], 'mod_a'))
+
+        def run(input, output, params, wildcards, *args):
+            writeFile(output[0], 'result')
+
+        shutil.rmtree(os.path.join(self.cacheDir, 'objects'))
+        writeFile(os.path.join(self.cacheDir, 'objects'), 'not a dir')
+        cachedRun = cache.wrapRunFunc(run, 'mod_a', self.static, 'mod_a')
+        cachedRun([self.inPath], [outPath + '.2'], {}, {'sample_name': 's1'}, 1)
+        with open(outPath + '.2') as f:
+            self.assertEqual(f.read(), 'result')
+
+
+if __name__ == '__main__':
+    unittest.main()
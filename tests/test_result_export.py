@@ -0,0 +1,100 @@
+"""Test streaming export of results."""
+
+import os
+import json
+import shutil
+import tarfile
+import zipfile
+import unittest
+from hashlib import sha256
+from subprocess import CalledProcessError
+
+from moduleultra.result_export import (
+    MANIFEST_NAME,
+    ArchiveWriter,
+    ExportEntry,
+    exportResults,
+)
+
+from .base_test import BaseTestDataSuper
+
+
+class TestResultExport(BaseTestDataSuper):
+    """Test streaming export of results."""
+
+    def makeEntries(self):
+        entries, contents = [], {}
+        for i, size in enumerate([0, 10, 1000, 4096 * 3 + 7]):
+            path = os.path.abspath('file_{}.txt'.format(i))
+            data = os.urandom(size)
+            with open(path, 'wb') as f:
+                f.write(data)
+            arcname = 'group/sample/file_{}.txt'.format(i)
+            contents[arcname] = data
+            entries.append(ExportEntry(arcname, path, 'result_{}'.format(i), 'kraken', 'report'))
+        return entries, contents
+
+    def checkManifest(self, manifest, contents):
+        self.assertEqual({el['path'] for el in manifest}, set(contents))
+        for el in manifest:
+            self.assertEqual(el['sha256'], sha256(contents[el['path']]).hexdigest())
+            self.assertEqual(el['size'], len(contents[el['path']]))
+
+    def test_tar(self):
+        """Ensure tar exports hold every file and a manifest."""
+        entries, contents = self.makeEntries()
+        writer = ArchiveWriter('out.tar.gz', fmt='tar', compress='gzip')
+        exportResults(entries, writer, chunkSize=1000, maxChunks=2)
+        writer.close()
+        with tarfile.open('out.tar.gz') as archive:
+            for arcname, data in contents.items():
+                self.assertEqual(archive.extractfile(arcname).read(), data)
+            manifest = json.load(archive.extractfile(MANIFEST_NAME))
+        self.checkManifest(manifest, contents)
+
+    def test_zip(self):
+        """Ensure zip exports hold every file and a manifest."""
+        entries, contents = self.makeEntries()
+        with open('out.zip', 'wb') as out:
+            writer = ArchiveWriter(out, fmt='zip', compress='gzip')
+            exportResults(entries, writer, chunkSize=1000, maxChunks=2)
+            writer.close()
+        with zipfile.ZipFile('out.zip') as archive:
+            for arcname, data in contents.items():
+                self.assertEqual(archive.read(arcname), data)
+            manifest = json.loads(archive.read(MANIFEST_NAME))
+        self.checkManifest(manifest, contents)
+
+    @unittest.skipIf(shutil.which('pigz') is None, 'pigz is not installed')
+    def test_pigz(self):
+        """Ensure tar exports can be compressed with pigz."""
+        entries, contents = self.makeEntries()
+        writer = ArchiveWriter('out.tar.gz', fmt='tar', compress='pigz', threads=2)
+        exportResults(entries, writer)
+        writer.close()
+        with tarfile.open('out.tar.gz') as archive:
+            self.assertEqual(len(archive.getnames()), len(contents) + 1)
+
+    def test_pigz_fails(self):
+        """Ensure a failed pigz raises and odd file names reach it unquoted."""
+        os.makedirs('bin')
+        with open('bin/pigz', 'w') as f:
+            f.write('#!/bin/sh\ncat > /dev/null\necho "$@"\nexit 3\n')
+        os.chmod('bin/pigz', 0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = os.path.abspath('bin') + os.pathsep + path
+        try:
+            outfile = 'out $(touch pwned).tar.gz'
+            writer = ArchiveWriter(outfile, fmt='tar', compress='pigz', threads=2)
+            writer.addBytes('a.txt', b'a')
+            with self.assertRaises(CalledProcessError):
+                writer.close()
+        finally:
+            os.environ['PATH'] = path
+        self.assertFalse(os.path.exists('pwned'))
+        with open(outfile) as f:
+            self.assertEqual(f.read(), '-p 2\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Test garbage collection of unreferenced result files."""
+
+import os
+import gzip
+import unittest
+
+from moduleultra.result_gc import DEFAULT_KEEP_PATTERNS, GarbageCollector, moduleOf
+
+from .base_test import BaseTestDataSuper
+
+
+PATTERNS = ['{sample_name}/{sample_name}.mod_a.reads.fastq',
+            '{sample_name}/{sample_name}.mod_a.flag.registered']
+
+
+class TestResultGC(BaseTestDataSuper):
+
+    def setUp(self):
+        super().setUp()
+        self.resultDir = os.path.join(self.tdir, 'core_results')
+        self.sampleDir = os.path.join(self.resultDir, 's1')
+        os.makedirs(os.path.join(self.sampleDir, '.snakemake'))
+        self.paths = {}
+        for fname in ['s1.mod_a.reads.fastq', 's1.mod_a.flag.registered',
+                      's1.mod_a.tmp.sam', 's1.mod_b.stats.txt', 's1.mod_a.rule.timing',
+                      'stray.txt', '.snakemake/log']:
+            path = os.path.join(self.sampleDir, fname)
+            with open(path, 'w') as f:
+                f.write('x' * 1000)
+            self.paths[fname] = path
+
+    def collector(self, **kwargs):
+        return GarbageCollector(self.resultDir, [self.paths['s1.mod_b.stats.txt']],
+                                PATTERNS, **kwargs)
+
+    def test_module_of(self):
+        """Test that files are attributed to the module in their name."""
+        self.assertEqual(moduleOf('s1', 's1.mod_a.tmp.sam'), 'mod_a')
+        self.assertEqual(moduleOf('s1', 'stray.txt'), 'unknown')
+
+    def test_report(self):
+        """Test that a dry run finds only unreferenced files and keeps them."""
+        totals, files = self.collector().collect()
+        self.assertEqual(sorted(files), sorted([self.paths['s1.mod_a.tmp.sam'],
+                                                self.paths['stray.txt']]))
+        self.assertEqual(totals['mod_a'], {'files': 1, 'bytes': 1000, 'freed': 0,
+                                           'skipped': 0})
+        self.assertEqual(totals['unknown']['files'], 1)
+        for path in self.paths.values():
+            self.assertTrue(os.path.isfile(path))
+
+    def test_delete(self):
+        """Test that delete removes garbage and nothing else."""
+        collector = self.collector(keepPatterns=DEFAULT_KEEP_PATTERNS + ['stray.*'])
+        totals, files = collector.collect(action='delete', jobs=2)
+        self.assertEqual(files, [self.paths['s1.mod_a.tmp.sam']])
+        self.assertEqual(totals['mod_a']['freed'], 1000)
+        self.assertFalse(os.path.exists(self.paths['s1.mod_a.tmp.sam']))
+        self.assertTrue(os.path.isfile(self.paths['stray.txt']))
+        self.assertTrue(os.path.isfile(self.paths['s1.mod_a.reads.fastq']))
+
+    def test_compress(self):
+        """Test that compress gzips garbage in place."""
+        totals, _ = self.collector().collect(action='compress')
+        path = self.paths['s1.mod_a.tmp.sam']
+        self.assertFalse(os.path.exists(path))
+        with gzip.open(path + '.gz', 'rt') as f:
+            self.assertEqual(f.read(), 'x' * 1000)
+        self.assertGreater(totals['mod_a']['freed'], 0)
+
+    def test_compress_existing(self):
+        """Test that compress never overwrites an existing .gz."""
+        path = self.paths['stray.txt']
+        with open(path + '.gz', 'w') as f:
+            f.write('mine')
+        totals, _ = self.collector().collect(action='compress')
+        self.assertEqual(totals['unknown']['skipped'], 1)
+        self.assertEqual(totals['unknown']['freed'], 0)
+        self.assertTrue(os.path.isfile(path))
+        with open(path + '.gz') as f:
+            self.assertEqual(f.read(), 'mine')
+        self.assertEqual(totals['mod_a']['skipped'], 0)
+
+    def test_skip_dirs(self):
+        """Test that claimed dirs are not scanned."""
+        totals, files = self.collector(skipDirs=['s1']).collect(action='delete')
+        self.assertEqual(files, [])
+        self.assertTrue(os.path.isfile(self.paths['s1.mod_a.tmp.sam']))
+
+
+if __name__ == '__main__':
+    unittest.main()
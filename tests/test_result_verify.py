@@ -0,0 +1,67 @@
+"""Test verification of result files."""
+
+import os
+import unittest
+from hashlib import sha256
+
+from moduleultra.state_store import StateStore
+from moduleultra.result_verify import DigestCache, hashFile, verifyFiles
+
+from .base_test import BaseTestDataSuper
+
+
+class TestResultVerify(BaseTestDataSuper):
+    """Test verification of result files."""
+
+    def makeFile(self, name, data):
+        path = os.path.abspath(name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path, sha256(data[:4096]).hexdigest()
+
+    def test_hash_file(self):
+        """Ensure the head digest matches datasuper checksums."""
+        data = os.urandom(10000)
+        path, checksum = self.makeFile('a.bin', data)
+        head, full = hashFile(path, blockSize=1000)
+        self.assertEqual(head, checksum)
+        self.assertEqual(full, sha256(data).hexdigest())
+
+    def test_verify(self):
+        """Ensure missing and altered files are reported per endpoint."""
+        cache = DigestCache(StateStore('state.sqlite'))
+        good, goodSum = self.makeFile('good.txt', b'good')
+        bad, _ = self.makeFile('bad.txt', b'bad')
+        tail, tailSum = self.makeFile('tail.bin', b'x' * 5000)
+        files = [('kraken', good, goodSum),
+                 ('kraken', bad, goodSum),
+                 ('mash', tail, tailSum),
+                 ('mash', os.path.abspath('gone.txt'), None)]
+
+        report = verifyFiles(files, cache, jobs=2)
+        self.assertEqual(report.endpoints['kraken'], {'ok': 1, 'missing': [],
+                                                      'altered': [bad]})
+        self.assertEqual(report.endpoints['mash']['missing'], [files[3][1]])
+        self.assertFalse(report.isClean())
+
+        # change the tail of a file, past what datasuper checksums
+        with open(tail, 'ab') as f:
+            f.write(b'y')
+        report = verifyFiles(files[2:3], cache)
+        self.assertEqual(report.endpoints['mash']['altered'], [tail])
+
+    def test_cache(self):
+        """Ensure unchanged files are not hashed again."""
+        cache = DigestCache(StateStore('state.sqlite'))
+        path, checksum = self.makeFile('a.txt', b'abc')
+        verifyFiles([('kraken', path, checksum)], cache)
+        self.assertIsNotNone(cache.lookup(path, os.stat(path)))
+        cache.update([(path, os.stat(path), checksum, checksum, 'not a real digest')])
+        report = verifyFiles([('kraken', path, checksum)], cache)
+        self.assertEqual(report.endpoints['kraken']['ok'], 1)
+        report = verifyFiles([('kraken', path, checksum)], cache, rehash=True)
+        self.assertEqual(report.endpoints['kraken']['altered'], [path])
+
+
+if __name__ == '__main__':
+    unittest.main()
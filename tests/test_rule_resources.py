@@ -0,0 +1,76 @@
+"""Test that module threads and memory reach their rules."""
+
+import unittest
+
+from moduleultra.installation.pipeline_config_utils import ramToThreads, threadsToRAM
+from moduleultra.pipeline_instance_snakemake_utils import addRuleResources
+
+from .base_test import BaseTestDataSuper
+
+
+SNAKEFILE = '''
+rule align:
+    input: 'a'
+    output: 'b'
+    shell: 'bwa mem -t {threads} a > b'
+
+rule sort:
+    input: 'b'
+    output: 'c'
+    threads: 2
+    resources: mem_mb=100
+    shell: 'sort b > c'
+
+rule index:
+    \'\'\'Index the sorted reads.\'\'\'
+    input: 'c'
+    output: 'd'
+    resources: disk_mb=10
+    shell: 'samtools index c'
+
+rule count:
+    """
+    Count the reads.
+    """
+    input: 'c'
+    output: 'e'
+    resources:
+        disk_mb=10
+    shell: 'wc -l c > e'
+'''
+
+
+class TestRuleResources(BaseTestDataSuper):
+
+    def test_add_rule_resources(self):
+        """Test that rules get threads and memory unless they set their own."""
+        out = addRuleResources(SNAKEFILE, threads=8, memMB=16000)
+        align, sort, index, count = out.split('\nrule ')[1:]
+        self.assertIn("align:\n    threads: 8\n    resources: mem_mb=16000\n    input: 'a'",
+                      align)
+        self.assertEqual(sort.count('threads'), 1)
+        self.assertIn('threads: 2', sort)
+        self.assertIn('mem_mb=100', sort)
+        self.assertNotIn('mem_mb=16000', sort)
+        self.assertEqual(addRuleResources(SNAKEFILE), SNAKEFILE)
+
+    def test_rule_docstrings_and_resources(self):
+        """Test that directives go after docstrings and mem_mb joins other resources."""
+        out = addRuleResources(SNAKEFILE, threads=8, memMB=16000)
+        index, count = out.split('\nrule ')[3:]
+        self.assertIn("'''Index the sorted reads.'''\n    threads: 8\n    input: 'c'", index)
+        self.assertIn('resources: mem_mb=16000, disk_mb=10', index)
+        self.assertIn('Count the reads.\n    """\n    threads: 8\n    input', count)
+        self.assertIn('resources: mem_mb=16000,\n        disk_mb=10', count)
+
+    def test_threads_and_ram(self):
+        """Test that memory is shared evenly between cores."""
+        self.assertEqual(threadsToRAM(4, cores=16, memMB=64000), 16000)
+        self.assertEqual(ramToThreads(16000, cores=16, memMB=64000), 4)
+        self.assertEqual(ramToThreads(16001, cores=16, memMB=64000), 5)
+        self.assertEqual(ramToThreads(1, cores=16, memMB=64000), 1)
+        self.assertGreater(threadsToRAM(1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
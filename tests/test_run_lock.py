@@ -0,0 +1,53 @@
+"""Test run locks."""
+
+import unittest
+
+from moduleultra.errors import RunLockedError
+from moduleultra.run_lock import RunLock, makeRunId
+
+from .base_test import BaseTestDataSuper
+
+
+class TestRunLock(BaseTestDataSuper):
+    """Test run locks."""
+
+    def test_disjoint_runs(self):
+        """Ensure runs over disjoint samples can hold locks together."""
+        first = RunLock(self.tdir, 'pipe', 'a', ['s1', 's2'], [])
+        second = RunLock(self.tdir, 'pipe', 'b', ['s3'], [])
+        with first, second:
+            assert first.held and second.held
+
+    def test_overlapping_runs(self):
+        """Ensure runs over the same samples exclude each other."""
+        first = RunLock(self.tdir, 'pipe', 'a', ['s1', 's2'], ['g1'])
+        second = RunLock(self.tdir, 'pipe', 'b', ['s2'], [])
+        with first:
+            with self.assertRaises(RunLockedError):
+                second.acquire()
+        second.acquire()
+        second.release()
+
+    def test_group_members(self):
+        """Ensure a group run conflicts with a run over one of its samples."""
+        first = RunLock(self.tdir, 'pipe', 'a', [], ['g1'], groupMembers={'g1': ['s1', 's2']})
+        second = RunLock(self.tdir, 'pipe', 'b', ['s2'], [])
+        with first:
+            with self.assertRaises(RunLockedError):
+                second.acquire()
+
+    def test_other_pipeline(self):
+        """Ensure different pipelines do not share claims."""
+        first = RunLock(self.tdir, 'pipe', 'a', ['s1'], [])
+        second = RunLock(self.tdir, 'other_pipe', 'b', ['s1'], [])
+        with first, second:
+            assert second.held
+
+    def test_run_id(self):
+        """Ensure run ids depend on the sample set, not its order."""
+        assert makeRunId('p', '1', ['a', 'b'], []) == makeRunId('p', '1', ['b', 'a'], [])
+        assert makeRunId('p', '1', ['a'], []) != makeRunId('p', '1', ['b'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
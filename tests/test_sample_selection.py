@@ -0,0 +1,77 @@
+"""Test selecting samples without loading every record."""
+
+import unittest
+
+from moduleultra.sample_selection import SampleSelection
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeTable:
+    """Stand in for a datasuper table that only serves raw records."""
+
+    def __init__(self, rawRecs):
+        self.rawRecs = rawRecs
+        self.names = {rawRec['name'] for rawRec in rawRecs}
+
+    def getAllRaw(self):
+        return self.rawRecs
+
+    def exists(self, name):
+        return name in self.names
+
+    def getAll(self):
+        raise AssertionError('full records should not be loaded')
+
+
+class FakeDB:
+    """Stand in for a datasuper database."""
+
+    def __init__(self):
+        samples = []
+        for i in range(20):
+            samples.append({'name': 'sample_{}'.format(i),
+                            'primary_key': 'pk_s{}'.format(i),
+                            'sample_type': 'metagenome' if i % 2 else 'isolate',
+                            'results': []})
+        groups = [
+            {'name': 'first', 'primary_key': 'pk_g1',
+             'direct_samples': ['pk_s1', 'pk_s2'], 'subgroups': ['pk_g2']},
+            {'name': 'second', 'primary_key': 'pk_g2',
+             'direct_samples': ['pk_s3'], 'subgroups': ['pk_g1']},
+        ]
+        self.sampleTable = FakeTable(samples)
+        self.sampleGroupTable = FakeTable(groups)
+
+
+class TestSampleSelection(BaseTestDataSuper):
+    """Test selecting samples without loading every record."""
+
+    def test_names(self):
+        """Ensure listed names are checked against the table."""
+        lines = iter(['sample_1\n', 'missing\n', '\n', 'sample_7\n'])
+        selection = SampleSelection(names=lines)
+        self.assertEqual(list(selection.resolve(FakeDB())), ['sample_1', 'sample_7'])
+
+    def test_patterns(self):
+        """Ensure globs, regexes and sample types combine."""
+        selection = SampleSelection(patterns=['sample_1*'], sampleTypes=['metagenome'])
+        self.assertEqual(list(selection.resolve(FakeDB())),
+                         ['sample_1', 'sample_11', 'sample_13', 'sample_15',
+                          'sample_17', 'sample_19'])
+        selection = SampleSelection(regexes=[r'_1\d$'], names=['sample_12', 'sample_2'])
+        self.assertEqual(list(selection.resolve(FakeDB())), ['sample_12'])
+
+    def test_groups(self):
+        """Ensure group members are found through subgroups."""
+        selection = SampleSelection(groups=['first'])
+        self.assertEqual(list(selection.resolve(FakeDB())),
+                         ['sample_1', 'sample_2', 'sample_3'])
+
+    def test_empty(self):
+        """Ensure an empty selection returns every sample."""
+        self.assertEqual(len(list(SampleSelection().resolve(FakeDB()))), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Test per job scratch dirs."""
+
+import os
+import json
+import subprocess
+import unittest
+
+from moduleultra.scratch import ScratchManager, scratchShellPrefix
+
+from .base_test import BaseTestDataSuper
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestScratch(BaseTestDataSuper):
+    """Test per job scratch dirs."""
+
+    def readUsage(self):
+        with open('usage.jsonl') as log:
+            return [json.loads(line) for line in log]
+
+    def test_job(self):
+        """Ensure scratch is removed on success and kept on failure."""
+        manager = ScratchManager('root', usageLog=os.path.abspath('usage.jsonl'))
+        with manager.job('kraken') as path:
+            with open(os.path.join(path, 'tmp'), 'w') as tmp:
+                tmp.write('x' * 100)
+        self.assertFalse(os.path.exists(path))
+        with self.assertRaises(ValueError):
+            with manager.job('mash') as failedPath:
+                raise ValueError()
+        self.assertTrue(os.path.isdir(failedPath))
+        self.assertEqual(manager.usedBytes(), 0)
+        usage = self.readUsage()
+        self.assertEqual([el['success'] for el in usage], [True, False])
+        self.assertGreaterEqual(usage[0]['bytes'], 100)
+
+    def test_budget(self):
+        """Ensure new dirs wait while the root is over budget."""
+        manager = ScratchManager('root', budget=50, maxWait=0)
+        self.assertTrue(manager.waitForBudget())
+        path = manager.enter()
+        with open(os.path.join(path, 'big'), 'w') as big:
+            big.write('x' * 100)
+        self.assertFalse(manager.waitForBudget())
+        manager.leave(path)
+        self.assertTrue(manager.waitForBudget())
+
+        path = manager.enter()
+        with open(os.path.join(path, 'big'), 'w') as big:
+            big.write('x' * 100)
+        manager.leave(path, success=False)
+        self.assertTrue(os.path.isdir(path))
+        self.assertTrue(manager.waitForBudget())
+
+    def test_shell_prefix(self):
+        """Ensure shell jobs run in a scratch dir and keep their exit status."""
+        conf = {'root': os.path.abspath('root'), 'budget': None,
+                'usage_log': os.path.abspath('usage.jsonl')}
+        prefix = scratchShellPrefix(conf)
+        self.assertTrue(prefix.startswith('set -euo pipefail; '))
+        self.assertNotIn('{', prefix)
+        env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+        cmd = prefix + 'echo hi > "$TMPDIR/out"; exit 3'
+        self.assertEqual(subprocess.call(['bash', '-c', cmd], env=env), 3)
+        cmd = prefix + 'false | true; echo hi > "$TMPDIR/out"'
+        self.assertNotEqual(subprocess.call(['bash', '-c', cmd], env=env), 0)
+        cmd = prefix + 'echo hi > "$TMPDIR/out"'
+        self.assertEqual(subprocess.call(['bash', '-c', cmd], env=env), 0)
+        self.assertEqual(len(os.listdir('root')), 2)
+        self.assertEqual([el['success'] for el in self.readUsage()], [False, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
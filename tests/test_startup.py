@@ -0,0 +1,41 @@
+"""Test CLI startup cost."""
+
+import sys
+import unittest
+import subprocess as sp
+
+
+HEAVY_MODULES = ['snakemake', 'datasuper', 'packagemega', 'blessings', 'yaml_backed_structs']
+IMPORT_BUDGET = 1.0  # seconds
+
+IMPORT_SCRIPT = '''
+import sys
+from time import time
+start = time()
+import moduleultra.cli
+print(time() - start)
+print(' '.join(m for m in {heavy} if m in sys.modules))
+'''
+
+
+class TestStartup(unittest.TestCase):
+    """Test CLI startup cost."""
+
+    def test_cli_import(self):
+        """Ensure the CLI imports quickly and without heavy dependencies."""
+        script = IMPORT_SCRIPT.format(heavy=HEAVY_MODULES)
+        out = sp.check_output([sys.executable, '-c', script]).decode('utf-8')
+        seconds, loaded = out.split('\n')[:2]
+        assert not loaded, f'CLI imported heavy modules: {loaded}'
+        assert float(seconds) < IMPORT_BUDGET, f'CLI import took {seconds}s'
+
+    def test_lazy_exports(self):
+        """Ensure package exports are still reachable."""
+        import moduleultra
+        assert 'ModuleUltraRepo' in dir(moduleultra)
+        with self.assertRaises(AttributeError):
+            moduleultra.NotAThing
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Test the SQLite state store."""
+
+import os
+import sqlite3
+import unittest
+from multiprocessing import Pool
+
+from moduleultra.state_store import StateStore
+
+from .base_test import BaseTestDataSuper
+
+
+def add_key(args):
+    """Add a key to a shared list in a fresh store."""
+    dbPath, key = args
+    store = StateStore(dbPath)
+    with store.transaction():
+        table = store.table('shared')
+        table['keys'] = table.get('keys', []) + [key]
+    store.close()
+
+
+class TestStateStore(BaseTestDataSuper):
+    """Test the SQLite state store."""
+
+    def test_set_get(self):
+        """Ensure values persist between stores."""
+        store = StateStore('state.sqlite')
+        table = store.table('pipelines')
+        table['a'] = ['0.1.0']
+        assert 'a' in table
+        assert 'b' not in table
+        store.close()
+        table = StateStore('state.sqlite').table('pipelines')
+        assert table['a'] == ['0.1.0']
+        assert table.keys() == ['a']
+        del table['a']
+        assert len(table) == 0
+
+    def test_tables_are_separate(self):
+        """Ensure tables do not share keys."""
+        store = StateStore('state.sqlite')
+        store.table('one')['a'] = 1
+        assert 'a' not in store.table('two')
+
+    def test_transaction_rollback(self):
+        """Ensure failed transactions change nothing."""
+        store = StateStore('state.sqlite')
+        table = store.table('pipelines')
+        table['a'] = 1
+        with self.assertRaises(ValueError):
+            with store.transaction():
+                table['a'] = 2
+                table['b'] = 3
+                raise ValueError()
+        assert table['a'] == 1
+        assert 'b' not in table
+
+    def test_migrate_yaml(self):
+        """Ensure YAML files are migrated once."""
+        with open('pipelines.yml', 'w') as yml:
+            yml.write('a: 0.1.0\nb: [1, 2]\n')
+        store = StateStore('state.sqlite')
+        table = store.table('pipelines', yamlPath='pipelines.yml')
+        assert table['a'] == '0.1.0'
+        assert table['b'] == [1, 2]
+        del table['a']
+        table = store.table('pipelines', yamlPath='pipelines.yml')
+        assert 'a' not in table
+
+    def test_read_only(self):
+        """Ensure read only stores see data but do not create a database."""
+        with open('pipelines.yml', 'w') as yml:
+            yml.write('a: 1\n')
+        table = StateStore('state.sqlite', readOnly=True).table('pipelines', yamlPath='pipelines.yml')
+        assert table['a'] == 1
+        assert not os.path.exists('state.sqlite')
+        StateStore('state.sqlite').table('pipelines')['a'] = 2
+        table = StateStore('state.sqlite', readOnly=True).table('pipelines')
+        assert table['a'] == 2
+
+    def test_read_only_writes_raise(self):
+        """Ensure writes to read only stores fail instead of being lost."""
+        with open('pipelines.yml', 'w') as yml:
+            yml.write('a: 1\n')
+        table = StateStore('state.sqlite', readOnly=True).table('pipelines', yamlPath='pipelines.yml')
+        with self.assertRaises(sqlite3.OperationalError):
+            table['b'] = 2
+        StateStore('state.sqlite').table('pipelines')['a'] = 2
+        table = StateStore('state.sqlite', readOnly=True).table('pipelines')
+        with self.assertRaises(sqlite3.OperationalError):
+            table['b'] = 2
+
+    def test_concurrent_updates(self):
+        """Ensure transactions from many processes do not lose updates."""
+        StateStore('state.sqlite').close()
+        dbPath = os.path.abspath('state.sqlite')
+        with Pool(4) as pool:
+            pool.map(add_key, [(dbPath, i) for i in range(20)])
+        table = StateStore('state.sqlite').table('shared')
+        assert sorted(table['keys']) == list(range(20))
+
+
+if __name__ == '__main__':
+    unittest.main()
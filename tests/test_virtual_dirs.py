@@ -0,0 +1,125 @@
+"""Test virtual dirs of linked results."""
+
+import os
+import unittest
+
+from moduleultra.errors import NotALinkFarmError
+from moduleultra.virtual_dirs import buildLinkFarm, buildLinkFarms, groupLinks
+
+from .base_test import BaseTestDataSuper
+
+
+class FakeFile:
+    """Stand in for a datasuper file record."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def filepath(self):
+        return self.path
+
+
+class FakeResult:
+    """Stand in for a datasuper result record."""
+
+    def __init__(self, name, paths):
+        self.name = name
+        self.paths = paths
+
+    def files(self):
+        return [(str(i), FakeFile(path)) for i, path in enumerate(self.paths)]
+
+
+class FakeSample:
+    """Stand in for a datasuper sample record."""
+
+    def __init__(self, name, results):
+        self.name = name
+        self._results = results
+
+    def results(self):
+        return self._results
+
+
+class FakeGroup:
+    """Stand in for a datasuper sample group record."""
+
+    def __init__(self, name, samples, results):
+        self.name = name
+        self.samples = samples
+        self.results = results
+
+    def allSamples(self):
+        return iter(self.samples)
+
+    def directResults(self):
+        return self.results
+
+
+class TestVirtualDirs(BaseTestDataSuper):
+    """Test virtual dirs of linked results."""
+
+    def makeFile(self, name):
+        path = os.path.abspath(os.path.join('results', name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(name)
+        return path
+
+    def test_incremental(self):
+        """Ensure only changed links are touched."""
+        first, second = self.makeFile('a.txt'), self.makeFile('b.txt')
+        links = {'a.txt': first, 'sub/b.txt': second}
+        self.assertEqual(buildLinkFarm('farm', links), (2, 0, 0))
+        self.assertEqual(os.readlink('farm/sub/b.txt'), second)
+        self.assertEqual(buildLinkFarm('farm', links), (0, 2, 0))
+
+        third = self.makeFile('c.txt')
+        links = {'a.txt': third}
+        self.assertEqual(buildLinkFarm('farm', links), (1, 0, 1))
+        self.assertEqual(os.readlink('farm/a.txt'), third)
+        self.assertFalse(os.path.exists('farm/sub'))
+
+    def test_leaves_real_files(self):
+        """Ensure files the farm did not make are never removed."""
+        target = self.makeFile('a.txt')
+        os.makedirs('s1')
+        with open('s1/data.fastq', 'w') as f:
+            f.write('reads')
+        with self.assertRaises(NotALinkFarmError):
+            buildLinkFarm('s1', {'a.txt': target})
+        self.assertTrue(os.path.isfile('s1/data.fastq'))
+
+        buildLinkFarm('farm', {'a.txt': target, 'b.txt': target}, hardlink=True)
+        with open('farm/notes.txt', 'w') as f:
+            f.write('mine')
+        self.assertEqual(buildLinkFarm('farm', {}), (0, 0, 2))
+        self.assertEqual(sorted(os.listdir('farm')), ['.mu_link_farm.json', 'notes.txt'])
+        with self.assertRaises(NotALinkFarmError):
+            buildLinkFarm('farm', {'notes.txt': target})
+
+    def test_hardlinks(self):
+        """Ensure hardlinks share the target's inode."""
+        target = self.makeFile('a.txt')
+        buildLinkFarms({'farm1': {'a.txt': target}, 'farm2': {'x.txt': target}},
+                       hardlink=True, jobs=2)
+        self.assertTrue(os.path.samefile('farm1/a.txt', target))
+        self.assertFalse(os.path.islink('farm2/x.txt'))
+        self.assertEqual(buildLinkFarm('farm1', {'a.txt': target}, hardlink=True),
+                         (0, 1, 0))
+
+    def test_group_layouts(self):
+        """Ensure nested groups get a dir per sample and for the group."""
+        s1 = FakeSample('s1', [FakeResult('r1', [self.makeFile('s1/s1.kraken.report')])])
+        s2 = FakeSample('s2', [FakeResult('r2', [self.makeFile('s2/s2.kraken.report')])])
+        group = FakeGroup('g1', [s1, s2], [FakeResult('r3', [self.makeFile('g1/dists')])])
+        self.assertEqual(sorted(groupLinks(group)),
+                         ['group_result/dists',
+                          's1/s1.kraken.report',
+                          's2/s2.kraken.report'])
+        self.assertEqual(sorted(groupLinks(group, flat=True)),
+                         ['dists', 's1.kraken.report', 's2.kraken.report'])
+
+
+if __name__ == '__main__':
+    unittest.main()